@@ -0,0 +1,454 @@
+#!/usr/bin/env python3
+"""
+Audio Toggle - shared platform-neutral core
+Config file handling, device records, the toggle state machine and
+notification formatting used by both audio_toggle_linux.py and
+audio_toggle_mac.py. Nothing here
+talks to an audio server; each platform's ToggleSession adapter supplies
+the current device and switches devices as the SwitchPlan says.
+
+Run directly to benchmark the planner:  python3 audio_toggle_core.py
+"""
+
+import json
+import os
+import re
+import sys
+from collections import namedtuple
+from pathlib import Path
+
+# Device keys stored in config files
+CONFIG_KEYS = ('speaker_device', 'headset_output', 'speaker_input', 'headset_input')
+
+Profile = namedtuple('Profile', ['name', 'label', 'output', 'input'])
+
+
+class ProfileTable(namedtuple('ProfileTable', CONFIG_KEYS)):
+    """Immutable compiled configuration: one resolved device ID per config key"""
+    __slots__ = ()
+
+    @property
+    def profiles(self):
+        return (
+            Profile("Profile 1", "Profile 1 (Desktop)", self.speaker_device, self.speaker_input),
+            Profile("Profile 2", "Profile 2 (Headset)", self.headset_output, self.headset_input),
+        )
+
+    def is_complete(self):
+        return all(self)
+
+
+def read_config_file(config_file):
+    """
+    Return a config file's JSON object, or {} if it is missing. Raises
+    ValueError if it is unreadable or not a JSON object.
+    """
+    try:
+        with open(config_file, 'r') as f:
+            config = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        raise ValueError(f"{config_file}: {e}")
+    if not isinstance(config, dict):
+        raise ValueError(f"{config_file}: expected a JSON object, got {type(config).__name__}")
+    return config
+
+
+def update_config_file(config_file, config):
+    """
+    Set keys in a config file, keeping its other sections (match, rules).
+    A device key written here replaces the file's own "match" pattern for
+    it, and "sample_specs" entries are merged into the file's.
+    """
+    merged = {}
+    try:
+        with open(config_file, 'r') as f:
+            merged = json.load(f)
+    except (OSError, ValueError):
+        pass
+    if not isinstance(merged, dict):
+        merged = {}
+    match = merged.get('match')
+    if isinstance(match, dict):
+        for key in config:
+            if match.pop(key, None):
+                print(f"Note: {config_file}: the \"match\" pattern for {key} is replaced by the chosen device")
+        if not match:
+            del merged['match']
+    if isinstance(config.get('sample_specs'), dict) and isinstance(merged.get('sample_specs'), dict):
+        config = dict(config, sample_specs={**merged['sample_specs'], **config['sample_specs']})
+    merged.update(config)
+    write_config_atomic(config_file, merged)
+
+
+def write_config_atomic(config_file, config):
+    """Write config JSON via a temp file and rename, so readers never see a partial file"""
+    config_file = Path(config_file)
+    config_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = config_file.with_name(f".{config_file.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp_file, 'w') as f:
+            json.dump(config, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, config_file)
+    finally:
+        if tmp_file.exists():
+            tmp_file.unlink()
+
+
+class Device(namedtuple('Device', ['id', 'name', 'index', 'sample_spec', 'ports', 'active_port', 'properties'])):
+    """
+    One audio device from an enumeration. Immutable and slotted; the ID is
+    interned so repeated enumerations share one copy of each.
+
+    id: the stable device ID (pactl name, or SwitchAudioSource UID)
+    name: description shown to the user, the ID when the server has none
+    index: the server's current index (pactl index, CoreAudio device id)
+    sample_spec: (format, rate), e.g. ('s24le', 48000)
+    ports: {port name: (available, priority)}, available True, False or None (unknown)
+    active_port: the active port's name
+    properties: {key: value} of server properties, when enumerated with them
+    Fields the platform does not report are None.
+    """
+    __slots__ = ()
+
+    def __new__(cls, id, name=None, index=None, sample_spec=None, ports=None, active_port=None, properties=None):
+        id = sys.intern(id)
+        return super().__new__(cls, id, name or id, index, sample_spec, ports, active_port, properties)
+
+
+DeviceChanges = namedtuple('DeviceChanges', ['added', 'removed', 'changed'])
+
+
+class DeviceSnapshot:
+    """
+    The devices of one type from one enumeration, in server order and keyed
+    by ID. Snapshots are never modified: without() and a new enumeration
+    both produce a new one, so holders can keep and compare old ones.
+    """
+    __slots__ = ('devices', '_by_id')
+
+    def __init__(self, devices=()):
+        self.devices = tuple(devices)
+        self._by_id = {device.id: device for device in self.devices}
+
+    def __iter__(self):
+        return iter(self.devices)
+
+    def __len__(self):
+        return len(self.devices)
+
+    def __getitem__(self, position):
+        return self.devices[position]
+
+    def __contains__(self, device_id):
+        return device_id in self._by_id
+
+    def get(self, device_id, default=None):
+        return self._by_id.get(device_id, default)
+
+    def without(self, device_id):
+        """This snapshot minus one device"""
+        if device_id not in self._by_id:
+            return self
+        return DeviceSnapshot(device for device in self.devices if device.id != device_id)
+
+    def diff(self, previous):
+        """
+        DeviceChanges from previous (a DeviceSnapshot or None) to this one:
+        tuples of the added, removed and changed Device records (the new
+        record for changed ones). Unchanged devices cost one dict lookup and
+        a tuple comparison.
+        """
+        before = previous._by_id if previous else {}
+        added = []
+        changed = []
+        for device in self.devices:
+            old = before.get(device.id)
+            if old is None:
+                added.append(device)
+            elif old is not device and old != device:
+                changed.append(device)
+        removed = tuple(device for device in previous or () if device.id not in self._by_id)
+        return DeviceChanges(tuple(added), removed, tuple(changed))
+
+
+def short_device_name(device_name):
+    """
+    Simplify device names for display - matches Windows implementation
+    Extracts brand/model from parentheses and cleans up special characters
+    """
+    # Extract content from parentheses if present
+    match = re.search(r'\(([^)]+)\)', device_name)
+    if match:
+        name = match.group(1)
+    else:
+        name = device_name
+
+    # Remove any remaining parentheses and their content (including partial ones)
+    name = re.sub(r'\([^)]*\)', '', name)   # Complete pairs like (R)
+    name = re.sub(r'\([^)]*$', '', name)    # Partial opening like (R
+    name = re.sub(r'\(', '', name)          # Any remaining (
+    name = re.sub(r'\)', '', name)          # Any remaining )
+    name = re.sub(r'\s+', ' ', name)        # Collapse multiple spaces
+    name = name.strip()
+
+    # Truncate if too long
+    if len(name) > 30:
+        name = name[:27] + "..."
+
+    return name
+
+
+class PlanError(Exception):
+    """The toggle cannot go ahead; title and message are for the user notification"""
+
+    def __init__(self, title, message):
+        super().__init__(message)
+        self.title = title
+        self.message = message
+
+
+# profile: the Profile to switch to
+# output_port / input_port: None to leave the port alone, a port name to
+#   select first, or False if the device is unavailable (see plan_toggle)
+# fallback: the current output matched neither profile
+SwitchPlan = namedtuple('SwitchPlan', ['profile', 'output_port', 'input_port', 'fallback'])
+
+
+def plan_toggle(table, current_output, port_states=None):
+    """
+    Decide what a toggle should do, without side effects.
+
+    table is a ProfileTable of device IDs, current_output the ID of the
+    current default output. port_states optionally maps a device ID to
+    None (usable as is), a port name to switch to first, or False
+    (unplugged or missing). The profile after the current one is chosen;
+    if the current output matches neither profile, Profile 1 is chosen,
+    or Profile 2 when Profile 1's output is unavailable.
+
+    Returns a SwitchPlan, or raises PlanError.
+    """
+    if not table.is_complete():
+        raise PlanError("Configuration Required",
+                        "Please use 'Configure Devices...' from the menu to set up your audio devices.")
+    port_states = port_states or {}
+    desktop, headset = table.profiles
+    if current_output == headset.output:
+        candidates = (desktop,)
+    elif current_output == desktop.output:
+        candidates = (headset,)
+    else:
+        candidates = (desktop, headset)
+
+    for profile in candidates:
+        output_port = port_states.get(profile.output)
+        if output_port is not False:
+            break
+    else:
+        raise PlanError("Audio Toggle", f"{candidates[0].name} output is unavailable (unplugged or asleep)")
+    return SwitchPlan(profile, output_port, port_states.get(profile.input), len(candidates) > 1)
+
+
+def active_profile(table, current_output):
+    """The Profile whose output is current_output, or None"""
+    return next((profile for profile in table.profiles if current_output and profile.output == current_output), None)
+
+
+def notification_message(profile, output_name, input_name):
+    """Format the post-toggle notification body (matches Windows)"""
+    return f"{profile.label}\n🔊 {short_device_name(output_name)}\n🎤 {short_device_name(input_name)}"
+
+
+class ToggleSession:
+    """
+    Carries out a toggle: plans it with plan_toggle() and applies the plan,
+    with the same log lines and notifications on every platform. A
+    platform adapter subclasses it and supplies:
+
+      current_output()                   ID of the default output, or None;
+                                         may raise PlanError to abort
+      switch_device(device_id, role, port)
+                                         make the device the default 'output'
+                                         or 'input' (selecting port first,
+                                         unless None); True on success
+      device_display_name(device_id, role)
+      show_notification(title, message)
+
+    and may override resolve_toggle_devices() to map configured values to
+    device IDs and report unavailable devices.
+    """
+
+    def resolve_toggle_devices(self, table):
+        """(table of device IDs, port_states for plan_toggle); called with a complete table"""
+        return table, {}
+
+    def toggle_profile(self, table):
+        """Switch to the next profile of table; returns its name, or None"""
+        try:
+            current_output = self.current_output()
+        except PlanError as e:
+            self.show_notification(e.title, e.message)
+            return None
+
+        print(f"[Toggle] Current output: '{current_output}'")
+        print(f"[Toggle] Profile 1 Output: '{table.speaker_device}'")
+        print(f"[Toggle] Profile 2 Output: '{table.headset_output}'")
+
+        port_states = {}
+        if table.is_complete():
+            table, port_states = self.resolve_toggle_devices(table)
+        try:
+            plan = plan_toggle(table, current_output, port_states)
+        except PlanError as e:
+            self.show_notification(e.title, e.message)
+            return None
+        profile = plan.profile
+        if plan.fallback:
+            print(f"[Toggle] Warning: Current device doesn't match configured devices, using {profile.name}")
+        if plan.input_port is False:
+            self.show_notification("Audio Toggle", f"{profile.name} input is not connected")
+            return None
+
+        print(f"[Toggle] Switching to {profile.name}: output='{profile.output}', input='{profile.input}'")
+
+        if not self.switch_device(profile.output, 'output', plan.output_port):
+            self.show_notification("Audio Toggle",
+                                   f"Failed to switch output to {self.device_display_name(profile.output, 'output')}")
+            return None
+        if not self.switch_device(profile.input, 'input', plan.input_port):
+            self.show_notification("Audio Toggle", "Output switched but input failed")
+            return None
+
+        message = notification_message(profile,
+                                       self.device_display_name(profile.output, 'output'),
+                                       self.device_display_name(profile.input, 'input'))
+        self.show_notification("Audio Toggle", message)
+        return profile.name
+
+
+def read_input_line(tty_file):
+    """Read a line from tty_file with proper EOF handling.
+    
+    Returns the stripped input string, or None if EOF/empty/whitespace-only input.
+    """
+    try:
+        line = tty_file.readline()
+        if line == '':
+            # EOF reached - no more input available
+            return None
+        stripped = line.strip()
+        if stripped == '':
+            # Whitespace-only input treated as empty
+            return None
+        return stripped
+    except (OSError, IOError):
+        return None
+
+
+class DevicePicker:
+    """
+    Paged, filterable device list for the interactive configure prompts.
+
+    Devices keep their position in the full list as their number, so a
+    number shown on any page or under any filter picks the same device.
+    Typed text filters on ID and description (case-insensitive substring)
+    through an n-gram index built once here: a query only checks the
+    devices sharing all of its trigrams, and a query extending the previous
+    one only re-checks the previous matches.
+    """
+    PAGE_SIZE = 20
+    GRAM_SIZE = 3
+
+    def __init__(self, devices):
+        self.devices = tuple(devices)
+        self._haystacks = [f"{device.id}\n{device.name}".lower() for device in self.devices]
+        # n-gram (1 to GRAM_SIZE characters) -> positions of devices containing it
+        self._index = {}
+        for position, haystack in enumerate(self._haystacks):
+            for size in range(1, self.GRAM_SIZE + 1):
+                for start in range(len(haystack) - size + 1):
+                    self._index.setdefault(haystack[start:start + size], set()).add(position)
+        self._last_search = ('', list(range(len(self.devices))))
+
+    def search(self, query):
+        """Positions of the devices whose ID or description contains query"""
+        query = query.lower()
+        if not query:
+            return list(range(len(self.devices)))
+        last_query, last_matches = self._last_search
+        if last_query and query.startswith(last_query):
+            matches = [position for position in last_matches if query in self._haystacks[position]]
+        elif len(query) <= self.GRAM_SIZE:
+            # Every substring this short is a key of the index itself
+            matches = sorted(self._index.get(query, ()))
+        else:
+            grams = {query[start:start + self.GRAM_SIZE] for start in range(len(query) - self.GRAM_SIZE + 1)}
+            candidates = set.intersection(*(self._index.get(gram, set()) for gram in grams))
+            matches = [position for position in sorted(candidates) if query in self._haystacks[position]]
+        self._last_search = (query, matches)
+        return matches
+
+    def show(self, title, matches, page, query):
+        pages = max(1, -(-len(matches) // self.PAGE_SIZE))
+        heading = f"=== {title} ==="
+        if query:
+            heading += f"  filter '{query}': {len(matches)} of {len(self.devices)}"
+        if pages > 1:
+            heading += f"  (page {page + 1}/{pages})"
+        print(heading)
+        for position in matches[page * self.PAGE_SIZE:(page + 1) * self.PAGE_SIZE]:
+            print(f"  [{position}] {self.devices[position].name}")
+        if not matches:
+            print("  (no matching devices)")
+        if pages > 1 or query or len(self.devices) > self.PAGE_SIZE:
+            print("  Type text to filter ('/' clears, '/text' to search for n, p or q), 'n'/'p' for next/previous page")
+
+    def pick(self, tty_file, title, prompt):
+        """
+        Prompt until a device is chosen. Returns the device, or None after
+        telling the user why (quit or no input).
+        """
+        query = ''
+        matches = self.search(query)
+        page = 0
+        while True:
+            self.show(title, matches, page, query)
+            print(prompt, end='', flush=True)
+            answer = read_input_line(tty_file)
+            if answer is None:
+                print("\nError: No input received. Please run this command in an interactive terminal.")
+                return None
+            command = answer.lower()
+            if command == 'q':
+                print("Configuration cancelled.")
+                return None
+            if answer.isdigit():
+                position = int(answer)
+                if position < len(self.devices):
+                    return self.devices[position]
+                print(f"Error: Number out of range (0-{len(self.devices) - 1}).")
+            elif command == 'n':
+                page = min(page + 1, max(0, (len(matches) - 1) // self.PAGE_SIZE))
+            elif command == 'p':
+                page = max(page - 1, 0)
+            else:
+                query = answer[1:] if answer.startswith('/') else answer
+                matches = self.search(query)
+                page = 0
+            print()
+
+
+def benchmark_plan(iterations=100000):
+    """Time plan_toggle alone; returns microseconds per call"""
+    import timeit
+    table = ProfileTable('speakers', 'headset', 'webcam-mic', 'headset-mic')
+    port_states = {'speakers': False, 'headset': None}
+    seconds = timeit.timeit(lambda: plan_toggle(table, 'hdmi', port_states), number=iterations)
+    return seconds / iterations * 1e6
+
+
+if __name__ == '__main__':
+    print(f"plan_toggle: {benchmark_plan():.2f} µs per call")
@@ -14,29 +14,1219 @@ import os
 import sys
 import fcntl
 import atexit
-import shlex
+import contextlib
+import re
+import functools
+import threading
+import time
+from collections import namedtuple
 from pathlib import Path
 import signal
 
-try:
-    import gi
-    gi.require_version('Gtk', '3.0')
-    gi.require_version('AppIndicator3', '0.1')
-    from gi.repository import Gtk, AppIndicator3, GLib
-except ImportError:
-    print("Error: Required libraries not found.")
-    print("Install with:")
-    print("  Ubuntu/Debian: sudo apt install python3-gi gir1.2-appindicator3-0.1")
-    print("  Fedora: sudo dnf install python3-gobject gtk3 libappindicator-gtk3")
-    print("  Arch: sudo pacman -S python-gobject gtk3 libappindicator-gtk3")
-    sys.exit(1)
-
-
-class AudioToggle:
+from audio_toggle_core import (CONFIG_KEYS, ProfileTable, PlanError, ToggleSession, active_profile,
+                               read_config_file, update_config_file,
+                               read_input_line, DevicePicker, Device, DeviceSnapshot, short_device_name)
+
+# GTK is imported on demand by import_gtk(), so headless modes never load it
+Gtk = AppIndicator3 = GLib = None
+
+# Reference point for --startup-timing
+STARTUP_TIME = time.perf_counter()
+
+
+def import_gtk():
+    """Import PyGObject/GTK/AppIndicator for the tray app"""
+    global Gtk, AppIndicator3, GLib
+    try:
+        import gi
+        gi.require_version('Gtk', '3.0')
+        gi.require_version('AppIndicator3', '0.1')
+        from gi.repository import Gtk, AppIndicator3, GLib
+    except ImportError:
+        print("Error: Required libraries not found.")
+        print("Install with:")
+        print("  Ubuntu/Debian: sudo apt install python3-gi gir1.2-appindicator3-0.1")
+        print("  Fedora: sudo dnf install python3-gobject gtk3 libappindicator-gtk3")
+        print("  Arch: sudo pacman -S python-gobject gtk3 libappindicator-gtk3")
+        sys.exit(1)
+
+
+# System-wide policy layer, merged underneath the per-user config file
+SYSTEM_CONFIG_DIR = Path('/etc/audio_toggle')
+
+# App settings stored alongside the device keys (later layers win)
+SETTING_KEYS = ('hotkey', 'align_sample_rate')
+
+# Environment overrides (e.g. AUDIO_TOGGLE_SPEAKER_DEVICE) win over every file
+CONFIG_ENV_PREFIX = 'AUDIO_TOGGLE_'
+
+# Per-user config file, the topmost file layer
+USER_CONFIG_FILE = Path.home() / ".config" / "audio_toggle" / "config.json"
+
+# Multi-server daemon control socket, unless its config names another
+DEFAULT_CONTROL_SOCKET = Path.home() / ".config" / "audio_toggle" / "control.sock"
+
+# Held (flock) by the running tray app, which answers queries on TRAY_SOCKET
+LOCK_FILE = Path.home() / ".config" / "audio_toggle" / ".audio_toggle.lock"
+TRAY_SOCKET = Path.home() / ".config" / "audio_toggle" / "tray.sock"
+
+class LayeredConfig:
+    """
+    Merges /etc/audio_toggle/*.json (sorted), the per-user config file and
+    AUDIO_TOGGLE_* environment overrides into a compiled ProfileTable.
+
+    Each layer may set a key to an exact device ID, or list it under "match"
+    as a regex checked against device IDs and descriptions. Patterns are
+    resolved when the table is compiled. The compiled table is cached until
+    a source file's mtime or an override changes, also while a pattern
+    matches no device (server not up yet, device unplugged), so an unplugged
+    headset does not cost an enumeration per load(); retry_unresolved()
+    resolves such patterns again once a device appears. A layer that is not
+    valid config is skipped.
+    """
+
+    def __init__(self, user_config_file, system_dir=None, environ=None, backend=None):
+        self.user_config_file = Path(user_config_file)
+        self.backend = backend
+        self.system_dir = Path(SYSTEM_CONFIG_DIR if system_dir is None else system_dir)
+        self.environ = os.environ if environ is None else environ
+        self._stamp = None
+        self._table = None
+        # Set when the table was compiled with resolve=False
+        self._deferred = False
+        # Keys whose "match" pattern matched no device in the last compile
+        self.unresolved = ()
+        # Compiled per-application routing rules, app settings and recorded
+        # output sample specs ({device ID: {"format", "rate"}}), rebuilt with the table
+        self.router = StreamRouter(())
+        self.settings = {}
+        self.sample_specs = {}
+
+    def sources(self):
+        """Config files in merge order: system-wide policy first, then the user file"""
+        sources = []
+        if self.system_dir.is_dir():
+            sources.extend(sorted(self.system_dir.glob('*.json')))
+        sources.append(self.user_config_file)
+        return sources
+
+    def _env_overrides(self):
+        overrides = {}
+        for key in CONFIG_KEYS + SETTING_KEYS:
+            value = self.environ.get(CONFIG_ENV_PREFIX + key.upper())
+            if value:
+                overrides[key] = value
+        return overrides
+
+    def _stamp_for(self, sources, overrides):
+        stamp = []
+        for path in sources:
+            try:
+                stamp.append((str(path), path.stat().st_mtime_ns))
+            except OSError:
+                stamp.append((str(path), None))
+        return tuple(stamp), tuple(sorted(overrides.items()))
+
+    def load(self, device_lister=None, resolve=True):
+        """
+        Return the compiled ProfileTable, recompiling only if a source
+        changed. With resolve=False "match" patterns are left unresolved
+        (their keys empty, listed in unresolved) instead of asking the
+        server, and the next load() resolves them.
+        """
+        sources = self.sources()
+        overrides = self._env_overrides()
+        stamp = self._stamp_for(sources, overrides)
+        if self._table is not None and stamp == self._stamp and not (resolve and self._deferred):
+            return self._table
+
+        values = dict.fromkeys(CONFIG_KEYS, '')
+        patterns = {}
+        rules = []
+        settings = {}
+        sample_specs = {}
+        for path in sources:
+            try:
+                layer = read_config_file(path)
+            except ValueError as e:
+                print(f"Failed to load config {e}")
+                continue
+            problem = self._layer_problem(layer)
+            if problem:
+                print(f"Ignoring config {path}: {problem}")
+                continue
+            # A later layer replaces earlier values and patterns key by key
+            for key, pattern in (layer.get('match') or {}).items():
+                if key in values and pattern:
+                    patterns[key] = pattern
+                    values[key] = ''
+            for key in CONFIG_KEYS:
+                if layer.get(key):
+                    values[key] = layer[key]
+                    patterns.pop(key, None)
+            # Rules from later layers are checked first
+            rules[:0] = layer.get('rules') or []
+            settings.update((key, layer[key]) for key in SETTING_KEYS if layer.get(key))
+            if isinstance(layer.get('sample_specs'), dict):
+                sample_specs.update(layer['sample_specs'])
+
+        for key, value in overrides.items():
+            if key in SETTING_KEYS:
+                settings[key] = value
+                continue
+            values[key] = value
+            patterns.pop(key, None)
+
+        unresolved = ()
+        if patterns and not resolve:
+            unresolved = tuple(patterns)
+        elif patterns:
+            unresolved = self._resolve_patterns(values, patterns, device_lister or self._list_devices)
+
+        self._table = ProfileTable(**values)
+        self.router = StreamRouter(rules)
+        self.settings = settings
+        self.sample_specs = sample_specs
+        self.unresolved = unresolved
+        self._deferred = bool(patterns) and not resolve
+        self._stamp = stamp
+        return self._table
+
+    def retry_unresolved(self, device_lister=None):
+        """Recompile if a "match" pattern matched no device last time, e.g. after a device was added"""
+        if self.unresolved and not self._deferred:
+            self._stamp = None
+        return self.load(device_lister)
+
+    @staticmethod
+    def _layer_problem(layer):
+        """Why a config layer cannot be used, or None"""
+        match = layer.get('match')
+        if match is not None and not isinstance(match, dict):
+            return '"match" must be an object'
+        rules = layer.get('rules')
+        if rules is not None and not (isinstance(rules, list) and all(isinstance(rule, dict) for rule in rules)):
+            return '"rules" must be a list of objects'
+        for key in CONFIG_KEYS:
+            for value in (layer.get(key), (match or {}).get(key)):
+                if value and not isinstance(value, str):
+                    return f'"{key}" must be a string'
+        return None
+
+    def _list_devices(self, device_type):
+        return parse_pactl_devices(device_type, with_properties=True, backend=self.backend)
+
+    def _resolve_patterns(self, values, patterns, device_lister):
+        """
+        Resolve "match" selectors against a single enumeration of each
+        device type. Returns the keys whose pattern matched no device.
+        """
+        devices = {}
+        unresolved = []
+        for key, pattern in patterns.items():
+            device_type = 'sinks' if key in ('speaker_device', 'headset_output') else 'sources'
+            if device_type not in devices:
+                devices[device_type] = device_lister(device_type)
+            try:
+                device = match_device(devices[device_type], pattern)
+            except ValueError as e:
+                print(f"Invalid match pattern for {key}: {e}")
+                continue
+            if device:
+                values[key] = device.id
+            else:
+                print(f"No device matches {key} pattern '{pattern}'")
+                unresolved.append(key)
+        return tuple(unresolved)
+
+
+class StreamRouter:
+    """
+    Per-application routing rules, compiled into exact-value lookups keyed
+    on the match fields. A rule looks like:
+      {"match": {"application.process.binary": "teams"},
+       "output": "<sink ID>", "input": "<source ID>"}
+    A rule is indexed under its first match field (in MATCH_FIELDS order);
+    any other fields it lists must match too. When several rules match, the
+    one listed first (user rules before system rules) wins.
+    """
+
+    MATCH_FIELDS = ('application.process.binary', 'application.name', 'media.role')
+
+    def __init__(self, rules):
+        # field -> value -> [(position in the rule list, rule)], in list order
+        self.lookup = {field: {} for field in self.MATCH_FIELDS}
+        for position, rule in enumerate(rules):
+            match = rule.get('match') or {}
+            fields = [field for field in self.MATCH_FIELDS if field in match]
+            if not fields or len(fields) != len(match):
+                print(f"Ignoring routing rule with unsupported match {match}")
+                continue
+            self.lookup[fields[0]].setdefault(match[fields[0]], []).append((position, rule))
+
+    def __bool__(self):
+        return any(self.lookup.values())
+
+    def route(self, properties):
+        """Return the earliest-listed rule matching a stream's properties, or None"""
+        best = None
+        for field, rules_by_value in self.lookup.items():
+            value = properties.get(field)
+            if value is None:
+                continue
+            for position, rule in rules_by_value.get(value, ()):
+                if best is not None and position >= best[0]:
+                    break
+                if all(properties.get(key) == wanted for key, wanted in rule['match'].items()):
+                    best = (position, rule)
+                    break
+        return best[1] if best else None
+
+
+def match_device(devices, selector):
+    """
+    Return the first device matching selector, or None.
+
+    Selector forms:
+      exact device ID        alsa_output.pci-0000_00_1f.3.analog-stereo
+      regex on ID or name    alsa_output.*analog
+      desc:REGEX             regex on the description only
+      prop:KEY=REGEX         regex on a pactl property, e.g. prop:device.bus=usb
+    Raises ValueError for a malformed selector.
+    """
+    try:
+        if selector.startswith('desc:'):
+            regex = re.compile(selector[len('desc:'):])
+            return next((d for d in devices if regex.search(d.name)), None)
+        if selector.startswith('prop:'):
+            key, sep, pattern = selector[len('prop:'):].partition('=')
+            if not sep or not key:
+                raise ValueError(f"expected prop:KEY=REGEX, got '{selector}'")
+            regex = re.compile(pattern)
+            return next((d for d in devices
+                         if key in (d.properties or {}) and regex.search(d.properties[key])), None)
+        for device in devices:
+            if device.id == selector:
+                return device
+        regex = re.compile(selector)
+    except re.error as e:
+        raise ValueError(f"'{selector}': {e}")
+    for device in devices:
+        if regex.search(device.id) or regex.search(device.name):
+            return device
+    return None
+
+
+def sample_specs_for(devices, device_ids):
+    """Config "sample_specs" entries for the given devices, from their parsed sample_spec"""
+    specs = {}
+    for device in devices:
+        if device.id in device_ids and device.sample_spec:
+            sample_format, rate = device.sample_spec
+            specs[device.id] = {'format': sample_format, 'rate': rate}
+    return specs
+
+
+CommandResult = namedtuple('CommandResult', ['returncode', 'stdout', 'wall_time'])
+
+
+class CommandBackend:
+    """
+    Runs the external commands the app depends on (pactl, notify-send).
+    Every backend interaction goes through run() or stream(), so recording,
+    replay and other wrappers only need to implement these two methods.
+    """
+
+    # Whether a live event stream (pactl subscribe) can be opened
+    live = True
+
+    # Seconds before a command is killed and subprocess.TimeoutExpired raised
+    CALL_TIMEOUT = 3
+
+    def __init__(self, env=None):
+        # Extra environment for every command, e.g. PULSE_SERVER in multi-server mode
+        self.env = dict(os.environ, **env) if env else None
+
+    def run(self, argv, check=False, timeout=None):
+        """Run argv and capture stdout, raising like subprocess.run(check=..., timeout=...)"""
+        start = time.monotonic()
+        result = subprocess.run(argv, capture_output=True, text=True, env=self.env,
+                                timeout=self.CALL_TIMEOUT if timeout is None else timeout)
+        command_result = CommandResult(result.returncode, result.stdout, time.monotonic() - start)
+        if check and result.returncode != 0:
+            raise subprocess.CalledProcessError(result.returncode, argv)
+        return command_result
+
+    def stream(self, argv, consume, check=False, timeout=None):
+        """Run argv and hand stdout to consume(lines) as it arrives; returns consume's result"""
+        timeout = self.CALL_TIMEOUT if timeout is None else timeout
+        timed_out = []
+
+        def kill():
+            timed_out.append(True)
+            # The whole group, so no grandchild keeps the pipe (and consume) open
+            os.killpg(proc.pid, signal.SIGKILL)
+
+        with subprocess.Popen(argv, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+                              env=self.env, start_new_session=True) as proc:
+            # consume() blocks on the pipe, so a watchdog kills a stalled command
+            watchdog = threading.Timer(timeout, kill)
+            watchdog.start()
+            try:
+                parsed = consume(proc.stdout)
+            finally:
+                watchdog.cancel()
+        if timed_out:
+            raise subprocess.TimeoutExpired(argv, timeout)
+        if check and proc.returncode != 0:
+            raise subprocess.CalledProcessError(proc.returncode, argv)
+        return parsed
+
+
+class TraceRecorder:
+    """
+    Wraps a backend and appends every call to a JSON-lines trace file:
+    start offset, argv, exit code, stdout and wall time. Missing binaries
+    and timeouts are recorded too, so a replay fails the same way.
+    """
+
+    def __init__(self, inner, trace_path):
+        self.inner = inner
+        self.live = inner.live
+        self.trace_path = Path(trace_path)
+        self.trace_path.parent.mkdir(parents=True, exist_ok=True)
+        self._trace = open(self.trace_path, 'a', buffering=1)
+        self._start = time.monotonic()
+
+    def _record(self, argv, returncode, stdout, wall_time, offset, missing=False, timed_out=False):
+        entry = {
+            't': round(offset, 6),
+            'argv': list(argv),
+            'returncode': returncode,
+            'stdout': stdout,
+            'wall_time': round(wall_time, 6),
+        }
+        if missing:
+            entry['missing'] = True
+        if timed_out:
+            entry['timeout'] = True
+        self._trace.write(json.dumps(entry) + '\n')
+
+    def run(self, argv, check=False, timeout=None):
+        offset = time.monotonic() - self._start
+        try:
+            result = self.inner.run(argv, timeout=timeout)
+        except FileNotFoundError:
+            self._record(argv, 127, '', time.monotonic() - self._start - offset, offset, missing=True)
+            raise
+        except subprocess.TimeoutExpired:
+            self._record(argv, None, '', time.monotonic() - self._start - offset, offset, timed_out=True)
+            raise
+        self._record(argv, result.returncode, result.stdout, result.wall_time, offset)
+        if check and result.returncode != 0:
+            raise subprocess.CalledProcessError(result.returncode, argv)
+        return result
+
+    def stream(self, argv, consume, check=False, timeout=None):
+        # The full output is needed for the trace, so this buffers it
+        result = self.run(argv, check=check, timeout=timeout)
+        return consume(result.stdout.splitlines())
+
+    def close(self):
+        self._trace.close()
+
+
+class ReplayBackend:
+    """
+    Serves a recorded trace instead of running commands, for reproducing a
+    user's toggle/configure behavior and timing without an audio server.
+
+    Calls are matched by argv, in recorded order per argv; once an argv's
+    entries run out its last entry is repeated. Each call sleeps for the
+    recorded wall time divided by speed (speed 0 = no delay). A recorded
+    timeout, or a wall time over the caller's timeout, raises
+    subprocess.TimeoutExpired.
+    """
+
+    live = False
+
+    def __init__(self, trace_path, speed=1.0):
+        self.speed = speed
+        self._entries = {}
+        with open(trace_path, 'r') as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._entries.setdefault(tuple(entry['argv']), []).append(entry)
+
+    def run(self, argv, check=False, timeout=None):
+        queue = self._entries.get(tuple(argv))
+        if not queue:
+            print(f"[Replay] No recorded call for {argv}")
+            if check:
+                raise subprocess.CalledProcessError(1, argv)
+            return CommandResult(1, '', 0.0)
+        entry = queue.pop(0) if len(queue) > 1 else queue[0]
+        timeout = CommandBackend.CALL_TIMEOUT if timeout is None else timeout
+        timed_out = entry.get('timeout') or entry['wall_time'] > timeout
+        if self.speed:
+            time.sleep(min(entry['wall_time'], timeout) / self.speed)
+        if timed_out:
+            raise subprocess.TimeoutExpired(argv, timeout)
+        if entry.get('missing'):
+            raise FileNotFoundError(argv[0])
+        if check and entry['returncode'] != 0:
+            raise subprocess.CalledProcessError(entry['returncode'], argv)
+        return CommandResult(entry['returncode'], entry['stdout'], entry['wall_time'])
+
+    def stream(self, argv, consume, check=False, timeout=None):
+        return consume(self.run(argv, check=check, timeout=timeout).stdout.splitlines())
+
+
+def build_backend(record_trace=None, replay_trace=None, replay_speed=1.0):
+    """Backend for the command line: live commands, optionally recorded, or a replayed trace"""
+    if replay_trace:
+        return ReplayBackend(replay_trace, speed=replay_speed)
+    backend = CommandBackend()
+    if record_trace:
+        backend = TraceRecorder(backend, record_trace)
+    return backend
+
+
+class BackendUnavailable(Exception):
+    """Raised instead of running a command while the audio server is considered unresponsive"""
+
+
+class CircuitBreaker:
+    """
+    Wraps a backend so a wedged audio server costs a bounded amount of time.
+
+    Consecutive audio-server command timeouts past FAILURE_THRESHOLD open
+    the circuit: audio commands then fail fast with BackendUnavailable. After
+    RESET_SECONDS the next audio command is let through as a half-open
+    probe; success closes the circuit, another timeout re-opens it. There is
+    no timer, so recovery is noticed on the next call (a toggle, a menu
+    action or a pactl event). Other commands (notify-send) pass through.
+
+    deadline(seconds) bounds every audio command made inside it, on that
+    thread, by what is left of an overall budget.
+    """
+
+    FAILURE_THRESHOLD = 3
+    RESET_SECONDS = 15
+    AUDIO_COMMANDS = ('/usr/bin/pactl', '/usr/bin/pw-metadata')
+
+    def __init__(self, inner, on_state_change=None):
+        self.inner = inner
+        self.live = inner.live
+        self.on_state_change = on_state_change
+        self.state = 'closed'
+        self.failures = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def unresponsive(self):
+        return self.state != 'closed'
+
+    @contextlib.contextmanager
+    def deadline(self, seconds):
+        outer = getattr(self._local, 'deadline', None)
+        self._local.deadline = time.monotonic() + seconds if outer is None else min(outer, time.monotonic() + seconds)
+        try:
+            yield
+        finally:
+            self._local.deadline = outer
+
+    def _timeout_for(self, argv, timeout):
+        timeout = CommandBackend.CALL_TIMEOUT if timeout is None else timeout
+        deadline = getattr(self._local, 'deadline', None)
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise subprocess.TimeoutExpired(argv, 0)
+            timeout = min(timeout, remaining)
+        return timeout
+
+    def _set_state(self, state):
+        # Called with the lock held
+        if state != self.state:
+            self.state = state
+            if self.on_state_change:
+                self.on_state_change(state)
+
+    def _admit(self, argv):
+        with self._lock:
+            if self.state == 'closed':
+                return
+            if self.state == 'open' and time.monotonic() - self._opened_at >= self.RESET_SECONDS:
+                self._set_state('half-open')
+                return
+            raise BackendUnavailable(f"audio server unresponsive, not running {argv[0]}")
+
+    def _record(self, timed_out):
+        with self._lock:
+            if not timed_out:
+                self.failures = 0
+                self._set_state('closed')
+                return
+            self.failures += 1
+            if self.state == 'half-open' or self.failures >= self.FAILURE_THRESHOLD:
+                self._opened_at = time.monotonic()
+                self._set_state('open')
+
+    def _call(self, call, argv, timeout):
+        if argv[0] not in self.AUDIO_COMMANDS:
+            return call(timeout)
+        timeout = self._timeout_for(argv, timeout)
+        self._admit(argv)
+        try:
+            result = call(timeout)
+        except subprocess.TimeoutExpired:
+            self._record(timed_out=True)
+            raise
+        except Exception:
+            # The server answered (or pactl is missing): slow or not, it isn't hung
+            self._record(timed_out=False)
+            raise
+        self._record(timed_out=False)
+        return result
+
+    def run(self, argv, check=False, timeout=None):
+        return self._call(lambda timeout: self.inner.run(argv, check=check, timeout=timeout), argv, timeout)
+
+    def stream(self, argv, consume, check=False, timeout=None):
+        return self._call(lambda timeout: self.inner.stream(argv, consume, check=check, timeout=timeout),
+                          argv, timeout)
+
+    def close(self):
+        if hasattr(self.inner, 'close'):
+            self.inner.close()
+
+
+class ProfileCapture:
+    """
+    On-demand cProfile session covering toggle_audio and the backend calls.
+
+    Only code wrapped by @profiled is measured, so an active session adds no
+    overhead to the idle main loop. stop() writes a pstats file plus a
+    flamegraph-compatible collapsed-stack file next to it (.collapsed).
+    cProfile follows one thread at a time: calls made on another thread
+    while one is being measured run unprofiled.
+    """
+
+    def __init__(self, out_path):
+        self.out_path = Path(out_path)
+        self.profiler = None
+        self._depth = 0
+        self._owner = None
+        self._lock = threading.Lock()
+
+    @property
+    def active(self):
+        return self.profiler is not None
+
+    def start(self):
+        import cProfile
+        self.profiler = cProfile.Profile()
+        print(f"[Profile] Capture started, will write {self.out_path}")
+
+    def stop(self):
+        profiler, self.profiler = self.profiler, None
+        if profiler is None:
+            return
+        import pstats
+        try:
+            self.out_path.parent.mkdir(parents=True, exist_ok=True)
+            stats = pstats.Stats(profiler)
+            stats.dump_stats(str(self.out_path))
+            collapsed_path = self.out_path.with_name(self.out_path.name + '.collapsed')
+            write_collapsed_stacks(stats, collapsed_path)
+            print(f"[Profile] Capture written to {self.out_path} and {collapsed_path}")
+        except (OSError, TypeError) as e:
+            # TypeError: pstats raises it for a session with no samples
+            print(f"[Profile] Failed to write capture: {e}")
+
+    def toggle(self):
+        if self.active:
+            self.stop()
+        else:
+            self.start()
+
+    def __enter__(self):
+        with self._lock:
+            if self._owner is None:
+                self._owner = threading.get_ident()
+            if self._owner == threading.get_ident():
+                self._depth += 1
+                if self._depth == 1 and self.profiler is not None:
+                    self.profiler.enable()
+
+    def __exit__(self, *exc):
+        with self._lock:
+            if self._owner != threading.get_ident():
+                return False
+            self._depth -= 1
+            if self._depth == 0:
+                self._owner = None
+                if self.profiler is not None:
+                    self.profiler.disable()
+        return False
+
+
+def profiled(method):
+    """Measure method under the instance's ProfileCapture while a session is active"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        capture = getattr(self, 'profile_capture', None)
+        if capture is None or not capture.active:
+            return method(self, *args, **kwargs)
+        with capture:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def write_collapsed_stacks(stats, path):
+    """
+    Write "frame;frame;frame microseconds" lines (flamegraph.pl / speedscope).
+
+    cProfile only records caller->callee edges, so stacks are reconstructed
+    from the call graph and each function's time is split across its
+    callers in proportion to the per-edge cumulative time.
+    """
+    def label(func):
+        filename, lineno, name = func
+        if filename == '~':
+            return name
+        return f"{name} ({os.path.basename(filename)}:{lineno})"
+
+    callees = {}
+    for func, (_, _, _, _, callers) in stats.stats.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((func, edge[3]))
+
+    lines = {}
+
+    def walk(func, stack, weight):
+        _, _, tottime, cumtime, _ = stats.stats[func]
+        stack = stack + (label(func),)
+        micros = int(tottime * weight * 1e6)
+        if micros:
+            key = ';'.join(stack)
+            lines[key] = lines.get(key, 0) + micros
+        for callee, edge_cumtime in callees.get(func, ()):
+            callee_cumtime = stats.stats[callee][3]
+            if label(callee) in stack or not callee_cumtime:
+                continue  # Recursion: already accounted for on this stack
+            walk(callee, stack, weight * min(1.0, edge_cumtime / callee_cumtime))
+
+    for func, (_, _, _, _, callers) in stats.stats.items():
+        if not callers:
+            walk(func, (), 1.0)
+
+    with open(path, 'w') as f:
+        for stack, micros in sorted(lines.items()):
+            f.write(f"{stack} {micros}\n")
+
+
+class MemoryReport:
+    """
+    tracemalloc-based report of live allocations, attributed to backend
+    parsing, GTK objects, config or other by the innermost frame of each
+    allocation's traceback that belongs to this app or to gi.
+    """
+
+    # Functions in this app whose allocations count towards each category
+    CATEGORIES = {
+        'backend': ('parse_pactl_output', 'parse_pactl_devices', 'PactlSubscription',
+                    'get_audio_devices', 'get_current_device', 'set_audio_device',
+                    'server_info', 'detect_audio_system', 'show_notification'),
+        'gtk': ('_build_devices_menu', '_add_device_item', '_apply_device_list',
+                '_remove_device_item', '_sync_default_items'),
+        'config': ('LayeredConfig', 'ProfileTable', 'load_config', 'save_config',
+                   'match_device', 'write_config_atomic'),
+    }
+
+    def __init__(self, frames=25):
+        import tracemalloc
+        self.tracemalloc = tracemalloc
+        tracemalloc.start(frames)
+        self._ranges = self._function_ranges()
+
+    def _function_ranges(self):
+        """Map (first line, last line) of each categorised function to its category"""
+        import inspect
+        import linecache
+        self._linecache_file = linecache.__file__
+        module = sys.modules[__name__]
+        ranges = []
+        for category, names in self.CATEGORIES.items():
+            for name in names:
+                obj = getattr(module, name, None) or getattr(AudioToggle, name, None)
+                if obj is None:
+                    continue
+                try:
+                    filename = os.path.abspath(inspect.getsourcefile(obj))
+                    source, first = inspect.getsourcelines(obj)
+                except (OSError, TypeError):
+                    continue
+                ranges.append((filename, first, first + len(source) - 1, category))
+        return ranges
+
+    def _categorize(self, traceback):
+        for frame in reversed(traceback):
+            if os.sep + 'gi' + os.sep in frame.filename:
+                return 'gtk'
+            for filename, first, last, category in self._ranges:
+                if frame.filename == filename and first <= frame.lineno <= last:
+                    return category
+        return 'other'
+
+    def report(self):
+        """Print live traced memory per category, the top allocation sites and RSS"""
+        # Leave out the reporter's own overhead (tracemalloc, source lookups)
+        snapshot = self.tracemalloc.take_snapshot().filter_traces((
+            self.tracemalloc.Filter(False, self.tracemalloc.__file__),
+            self.tracemalloc.Filter(False, self._linecache_file),
+        ))
+        totals = {}
+        for stat in snapshot.statistics('traceback'):
+            category = self._categorize(stat.traceback)
+            size, count = totals.get(category, (0, 0))
+            totals[category] = (size + stat.size, count + stat.count)
+
+        print("[Memory] Live allocations by category:")
+        for category, (size, count) in sorted(totals.items(), key=lambda item: -item[1][0]):
+            print(f"  {category:<8} {size / 1024:9.1f} KiB in {count} blocks")
+        print("[Memory] Top allocation sites:")
+        for stat in snapshot.statistics('lineno')[:10]:
+            frame = stat.traceback[0]
+            print(f"  {stat.size / 1024:9.1f} KiB  {os.path.basename(frame.filename)}:{frame.lineno}")
+        current, peak = self.tracemalloc.get_traced_memory()
+        print(f"[Memory] Traced: {current / 1024:.1f} KiB (peak {peak / 1024:.1f} KiB), RSS: {read_rss_kib()} KiB")
+
+
+def read_rss_kib():
+    """Resident set size of this process in KiB, from /proc/self/status"""
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def read_process_counters():
+    """
+    CPU seconds used by this process (all threads) and its voluntary and
+    involuntary context switches, summed over threads, from /proc
+    """
+    with open('/proc/self/stat', 'r') as f:
+        # Fields after the parenthesised command name; utime and stime are 14 and 15
+        fields = f.read().rpartition(')')[2].split()
+    cpu_seconds = (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    voluntary = involuntary = 0
+    for status in Path('/proc/self/task').glob('*/status'):
+        try:
+            with open(status, 'r') as f:
+                for line in f:
+                    if line.startswith('voluntary_ctxt_switches:'):
+                        voluntary += int(line.split()[1])
+                    elif line.startswith('nonvoluntary_ctxt_switches:'):
+                        involuntary += int(line.split()[1])
+        except OSError:
+            pass  # Thread exited while we were reading
+    return cpu_seconds, voluntary, involuntary
+
+
+class IdleCheck:
+    """
+    Measures what the tray costs while nothing happens: after a settle
+    delay, CPU time and context switches over a fixed window are compared
+    against a budget. The app has no periodic timers, so an idle process
+    should stay blocked in the main loop; anything above the budget means
+    something is polling.
+    """
+
+    SETTLE_SECONDS = 5
+    # Budget per minute of idle time
+    CPU_SECONDS_PER_MINUTE = 0.05
+    WAKEUPS_PER_MINUTE = 2
+    # Per window: the window's own timer plus stray GTK/D-Bus traffic
+    # (e.g. the indicator host re-reading properties)
+    WAKEUP_ALLOWANCE = 4
+
+    def __init__(self, window_seconds, on_done):
+        self.window_seconds = window_seconds
+        self.on_done = on_done
+        self.start_counters = None
+        self.passed = None
+
+    def start(self):
+        GLib.timeout_add_seconds(self.SETTLE_SECONDS, self._begin_window)
+
+    def _begin_window(self):
+        self.start_counters = read_process_counters()
+        GLib.timeout_add_seconds(self.window_seconds, self._end_window)
+        return False  # One-shot
+
+    def _end_window(self):
+        cpu, voluntary, involuntary = (end - start for end, start in
+                                       zip(read_process_counters(), self.start_counters))
+        minutes = self.window_seconds / 60
+        self.passed = (cpu <= self.CPU_SECONDS_PER_MINUTE * minutes
+                       and voluntary <= self.WAKEUPS_PER_MINUTE * minutes + self.WAKEUP_ALLOWANCE)
+        print(f"[Idle] {self.window_seconds} s idle: CPU {cpu:.3f} s, "
+              f"{voluntary} wakeups (voluntary context switches), {involuntary} involuntary"
+              f" - {'within' if self.passed else 'OVER'} budget")
+        self.on_done()
+        return False
+
+
+class StartupTiming:
+    """
+    Records when each tray startup stage finished, relative to the module
+    being loaded, so slow stages (e.g. waiting on a starting audio server)
+    can be told apart from the time to show the tray icon.
+    """
+
     def __init__(self):
-        self.config_file = Path.home() / ".config" / "audio_toggle" / "config.json"
-        self.lockfile_path = Path.home() / ".config" / "audio_toggle" / ".audio_toggle.lock"
+        self.stages = []
+
+    def mark(self, stage):
+        # list.append is atomic, so the startup thread can mark too
+        self.stages.append((stage, threading.current_thread().name, time.perf_counter()))
+
+    def report(self):
+        print("[Startup] Stage timings (ms since start):")
+        for stage, thread_name, at in sorted(self.stages, key=lambda entry: entry[2]):
+            print(f"  {(at - STARTUP_TIME) * 1000:8.1f}  {stage:<14} [{thread_name}]")
+        tray = next((at for stage, _, at in self.stages if stage == 'indicator'), None)
+        if tray is not None:
+            print(f"[Startup] Time to tray: {(tray - STARTUP_TIME) * 1000:.1f} ms")
+
+
+class AudioSession(ToggleSession):
+    """
+    Headless toggle state for one audio server: backend, layered config and
+    the toggle logic. AudioToggle adds the tray UI on top; multi-server mode
+    runs one AudioSession per server.
+    """
+
+    # Overall budget for one toggle's backend calls, in seconds
+    TOGGLE_DEADLINE = 5
+
+    def __init__(self, config_file=USER_CONFIG_FILE, backend=None, resolve_patterns=True):
+        backend = backend or CommandBackend()
+        # Bound every audio server call, and fail fast once it stops answering
+        self.backend = backend if isinstance(backend, CircuitBreaker) else CircuitBreaker(backend)
+        self.config_file = Path(config_file)
+        self.config = LayeredConfig(self.config_file, backend=self.backend)
+        # 'pipewire' or 'pulseaudio', detected when first needed
+        self.audio_system = None
+        # Graph rate pinned by align_sample_rate, if any
+        self.forced_graph_rate = None
+        # Resolving "match" patterns asks the server; callers that must not
+        # block on it pass resolve_patterns=False and load_config() later
+        self.load_config(resolve=resolve_patterns)
+
+    @profiled
+    def server_info(self):
+        """
+        `pactl info` as a dict ("Server Name", "Cookie", ...), or None if no
+        server answered. The cookie changes whenever the server restarts.
+        Raises FileNotFoundError if pactl is not installed.
+        """
+        try:
+            result = self.backend.run(['/usr/bin/pactl', 'info'])
+        except FileNotFoundError:
+            print("Error: pactl not found. Please install PulseAudio or PipeWire.")
+            raise
+        except (subprocess.TimeoutExpired, BackendUnavailable):
+            return None
+        if result.returncode != 0:
+            return None
+        info = {}
+        for line in result.stdout.splitlines():
+            key, sep, value = line.partition(':')
+            if sep:
+                info[key.strip()] = value.strip()
+        return info
+
+    def detect_audio_system(self, info=None):
+        """Detect if using PulseAudio or PipeWire from server_info() (queried unless given); None if no server"""
+        if info is None:
+            info = self.server_info()
+        if not info:
+            print("Error detecting audio system: no audio server answered")
+            return None
+        # Check for PipeWire
+        if 'PipeWire' in info.get('Server Name', ''):
+            return 'pipewire'
+        return 'pulseaudio'
+    
+    def load_config(self, resolve=True, retry=False):
+        """
+        Load device configuration from the layered config (cached until a
+        source changes). retry=True also re-resolves "match" patterns that
+        matched no device before.
+        """
+        table = self.config.retry_unresolved() if retry else self.config.load(resolve=resolve)
+        self.speaker_device = table.speaker_device
+        self.headset_output = table.headset_output
+        self.speaker_input = table.speaker_input
+        self.headset_input = table.headset_input
+        return table
+
+    def get_device_display_name(self, device_id, device_type):
+        """
+        Convert device ID to friendly display name
+        device_type: 'sinks' or 'sources'
+        """
+        try:
+            device = self.get_audio_devices(device_type).get(device_id)
+            # Fallback to device ID if not found
+            return device.name if device else device_id
+        except Exception:
+            return device_id
+
+    def save_config(self, keys=CONFIG_KEYS):
+        """
+        Save the given device keys to the user config file. Other keys are
+        left as they are, so values from system or environment layers are
+        not copied into it.
+        """
+        config = {key: getattr(self, key) for key in keys}
+        outputs = [self.get_cached_device(config[key], 'sinks') for key in ('speaker_device', 'headset_output')
+                   if key in config]
+        sample_specs = sample_specs_for([device for device in outputs if device], config.values())
+        if sample_specs:
+            config['sample_specs'] = sample_specs
+        update_config_file(self.config_file, config)
+    
+    @profiled
+    def get_audio_devices(self, device_type='sinks'):
+        """Get list of audio devices using pactl - optimized to run pactl only once"""
+        return parse_pactl_devices(device_type, backend=self.backend)
+    
+    @profiled
+    def get_current_device(self, device_type='sink'):
+        """Get current default audio device"""
+        try:
+            cmd = ['/usr/bin/pactl', f'get-default-{device_type}']
+            result = self.backend.run(cmd, check=True)
+            return result.stdout.strip()
+        except Exception as e:
+            print(f"Error getting current device: {e}")
+            return None
+    
+    @profiled
+    def set_audio_device(self, device_id, device_type='sink'):
+        """Set default audio device"""
+        try:
+            cmd = ['/usr/bin/pactl', f'set-default-{device_type}', device_id]
+            self.backend.run(cmd, check=True)
+            return True
+        except Exception as e:
+            print(f"Error setting device: {e}")
+            return False
+    
+    def get_cached_device(self, device_id, device_type):
+        """Last known device record, if this session keeps a device cache"""
+        return None
+
+    def find_usable_port(self, device_id, device_type):
+        """
+        Check a device's cached port availability, without enumerating.
+        Returns None if the active port is usable (or nothing is known), the
+        name of the best available port to switch to, or False if no port
+        is available.
+        """
+        device = self.get_cached_device(device_id, device_type)
+        if not device or not device.ports:
+            return None
+        ports = device.ports
+        active = ports.get(device.active_port)
+        if active is None or active[0] is not False:
+            return None
+        usable = [(available is True, priority, port)
+                  for port, (available, priority) in ports.items() if available is not False]
+        if not usable:
+            return False
+        return max(usable)[2]
+
+    @profiled
+    def set_device_port(self, device_id, port, device_type='sink'):
+        """Set the active port of a sink or source"""
+        try:
+            self.backend.run(['/usr/bin/pactl', f'set-{device_type}-port', device_id, port], check=True)
+            return True
+        except Exception as e:
+            print(f"Error setting port: {e}")
+            return False
+
+    def align_sample_rate(self, device_id):
+        """
+        With the align_sample_rate setting on PipeWire, run the graph at the
+        output's native rate (clock.force-rate), so streams are not resampled
+        to a server default the device does not use. The rate comes from the
+        cached device record, else from the config's recorded sample_specs.
+        A rate pinned for the previous output is released when this one has
+        no known rate or the setting is off. Returns the rate set, or None.
+        """
+        if str(self.config.settings.get('align_sample_rate', '')).lower() not in ('1', 'true', 'yes'):
+            self.release_graph_rate()
+            return None
+        device = self.get_cached_device(device_id, 'sinks')
+        if device and device.sample_spec:
+            rate = device.sample_spec[1]
+        else:
+            rate = (self.config.sample_specs.get(device_id) or {}).get('rate')
+        if not rate:
+            self.release_graph_rate()
+            return None
+        if self.audio_system is None:
+            self.audio_system = self.detect_audio_system()
+        if self.audio_system != 'pipewire':
+            return None
+        if self.set_graph_rate(rate):
+            print(f"[Toggle] PipeWire graph rate set to {rate} Hz")
+            self.forced_graph_rate = rate
+            return rate
+        return None
+
+    def release_graph_rate(self):
+        """Hand the graph rate back to PipeWire if align_sample_rate pinned it"""
+        if self.forced_graph_rate and self.set_graph_rate(0):
+            print("[Toggle] PipeWire graph rate released")
+            self.forced_graph_rate = None
+
+    @profiled
+    def set_graph_rate(self, rate):
+        """Force the PipeWire graph rate; 0 hands the choice back to PipeWire"""
+        try:
+            self.backend.run(['/usr/bin/pw-metadata', '-n', 'settings', '0', 'clock.force-rate', str(rate)],
+                             check=True)
+            return True
+        except Exception as e:
+            print(f"Error setting graph rate: {e}")
+            return False
+
+    @profiled
+    def toggle_audio(self, _):
+        """Toggle between audio configurations; returns the profile switched to, or None"""
+        # A wedged server must not hold the caller (the GTK main loop) for long
+        with self.backend.deadline(self.TOGGLE_DEADLINE):
+            return self._switch_profile()
+
+    def _switch_profile(self):
+        # Reload configuration to get latest settings
+        return self.toggle_profile(self.load_config())
+
+    def current_output(self):
+        current_output = self.get_current_device('sink')
+        if current_output is None and self.backend.unresponsive:
+            raise PlanError("Audio Toggle", "Audio server unresponsive, try again shortly")
+        return current_output
+
+    def resolve_toggle_devices(self, table):
+        # Cached port availability lets the plan skip an unplugged profile
+        port_states = {}
+        for profile in table.profiles:
+            port_states[profile.output] = self.find_usable_port(profile.output, 'sinks')
+            port_states[profile.input] = self.find_usable_port(profile.input, 'sources')
+        return table, port_states
+
+    def switch_device(self, device_id, role, port):
+        device_type = 'sink' if role == 'output' else 'source'
+        # Move off an unavailable active port first (e.g. headphones -> speakers)
+        if port:
+            self.set_device_port(device_id, port, device_type)
+        if not self.set_audio_device(device_id, device_type):
+            return False
+        if role == 'output':
+            self.align_sample_rate(device_id)
+        return True
+
+    def device_display_name(self, device_id, role):
+        return self.get_device_display_name(device_id, 'sinks' if role == 'output' else 'sources')
+
+    def current_defaults(self):
+        """Current default sink and source IDs"""
+        return {'sinks': self.get_current_device('sink'), 'sources': self.get_current_device('source')}
+
+    def known_devices(self, device_type):
+        """Device records for --list; one enumeration per call here"""
+        return self.get_audio_devices(device_type)
+
+    def watch_state(self):
+        """One --watch record: the active profile and the default devices with short names"""
+        table = self.load_config()
+        defaults = self.current_defaults()
+        profile = active_profile(table, defaults['sinks'])
+        record = {
+            'profile': profile.name if profile else None,
+            'profile_label': profile.label if profile else None,
+        }
+        for key, device_type in (('output', 'sinks'), ('input', 'sources')):
+            device_id = defaults[device_type]
+            record[key] = device_id
+            record[key + '_name'] = short_device_name(self.get_device_display_name(device_id, device_type)) \
+                if device_id else None
+        return record
+
+    def query_state(self, command):
+        """JSON-ready answer to a 'status', 'list' or 'watch' query"""
+        if command == 'watch':
+            return self.watch_state()
+        table = self.load_config()
+        defaults = self.current_defaults()
+        profile = active_profile(table, defaults['sinks'])
+        reply = {
+            'ok': True,
+            'defaults': {'sink': defaults['sinks'], 'source': defaults['sources']},
+            'profile': profile.name if profile else None,
+            'profile_label': profile.label if profile else None,
+            'configured': table.is_complete(),
+        }
+        if command == 'list':
+            for device_type in ('sinks', 'sources'):
+                reply[device_type] = [describe_device(device) for device in self.known_devices(device_type)]
+        return reply
+
+    @profiled
+    def show_notification(self, title, message):
+        """Show desktop notification"""
+        try:
+            self.backend.run(['/usr/bin/notify-send', title, message])
+        except Exception:
+            print(f"{title}: {message}")
+
+
+class AudioToggle(AudioSession):
+    # Toggles queued while reconnecting are dropped if the server takes longer than this
+    QUEUED_TOGGLE_TTL = 30
+
+    def __init__(self, profile_out=None, mem_report=False, backend=None, hotkey=None, idle_check=None,
+                 startup_timing=False):
+        self.lockfile_path = LOCK_FILE
         self.lockfile = None
+        self.config_dialog = None
+        # Profiling: --profile-out starts a session now, SIGUSR1 starts/stops one
+        self.profile_capture = ProfileCapture(
+            profile_out or self.lockfile_path.parent / f"profile-{os.getpid()}.pstats"
+        )
+        if profile_out:
+            self.profile_capture.start()
+        # --mem-report traces allocations from startup; SIGUSR2 prints a report
+        self.memory_report = MemoryReport() if mem_report else None
+        # --idle-check measures idle CPU and wakeups, then quits
+        self.idle_check = IdleCheck(idle_check, lambda: self.quit(None)) if idle_check else None
+        # --startup-timing reports when each startup stage finished
+        self.startup_timing = StartupTiming() if startup_timing else None
 
         # Ensure lock directory exists
         self.lockfile_path.parent.mkdir(parents=True, exist_ok=True)
@@ -45,11 +1235,12 @@ class AudioToggle:
         if not self._acquire_lock():
             print("Audio Toggle is already running.")
             sys.exit(0)
+        self._mark_startup('lock')
 
-        self.load_config()
-        
-        # Detect audio system (PulseAudio or PipeWire)
-        self.audio_system = self.detect_audio_system()
+        # Only the config files are read here; "match" patterns wait on the
+        # server, so the startup thread resolves them
+        super().__init__(USER_CONFIG_FILE, backend, resolve_patterns=False)
+        self._mark_startup('config')
         
         # Create indicator
         # Use symbolic icon for better visibility in dark themes
@@ -65,10 +1256,17 @@ class AudioToggle:
         self.menu = Gtk.Menu()
         
         # Toggle item
-        item_toggle = Gtk.MenuItem(label="Toggle Audio")
-        item_toggle.connect("activate", self.toggle_audio)
-        self.menu.append(item_toggle)
+        self.item_toggle = Gtk.MenuItem(label="Toggle Audio")
+        self.item_toggle.connect("activate", self.toggle_audio)
+        self.menu.append(self.item_toggle)
         
+        # Devices submenu, kept up to date incrementally from pactl events
+        item_devices = Gtk.MenuItem(label="Devices")
+        self.devices_menu = Gtk.Menu()
+        item_devices.set_submenu(self.devices_menu)
+        self.menu.append(item_devices)
+        self._build_devices_menu()
+
         # Separator
         self.menu.append(Gtk.SeparatorMenuItem())
         
@@ -87,397 +1285,1325 @@ class AudioToggle:
         
         self.menu.show_all()
         self.indicator.set_menu(self.menu)
-        
+        self._mark_startup('indicator')
+
+        # Reflect the audio server's health (see CircuitBreaker) in the tray
+        self.backend.on_state_change = lambda state: GLib.idle_add(self._show_backend_state, state)
+
+        # Follow server events from now on; events that beat the snapshot
+        # only schedule a refresh, which diffs against whatever is in the menu.
+        # When the subscription ends the server went away: reconnect in the
+        # background and queue toggles until it is back
+        self.server_cookie = None
+        self._queued_toggles = []
+        self.reconnect = ServerReconnect(self.server_info, self._on_server_back)
+        self.subscription = PactlSubscription(self._on_pactl_event, self._on_server_lost)
+        if self.backend.live:
+            self.subscription.start()
+        self._mark_startup('subscription')
+
+        # --status/--list/--watch from other processes read this instance's state
+        self._watch_state = None
+        self.query_server = TrayQueryServer(TRAY_SOCKET, self.query_state)
+        self.query_server.start()
+
+        # Global hotkey calls the warm toggle path directly
+        self.hotkey = None
+        accelerator = hotkey or self.config.settings.get('hotkey')
+        if accelerator:
+            self.hotkey = GlobalHotkey(accelerator, lambda: self.toggle_audio(None))
+            self.hotkey.bind()
+        self._mark_startup('hotkey')
+
+        # At login the audio server may still be starting, so detection, the
+        # device snapshot and the config check run off the main loop while
+        # the tray icon is already up
+        threading.Thread(target=self._load_startup_snapshot, name='startup-snapshot', daemon=True).start()
+
+    def _show_backend_state(self, state):
+        """Main loop: show or clear the 'audio server unresponsive' or 'reconnecting' state"""
+        if state == 'reconnecting':
+            self.indicator.set_icon_full("audio-volume-muted-symbolic", "Reconnecting to the audio server")
+            self.item_toggle.set_label("Toggle Audio (reconnecting to audio server)")
+        elif state == 'open':
+            self.indicator.set_icon_full("audio-volume-muted-symbolic", "Audio server unresponsive")
+            self.item_toggle.set_label("Toggle Audio (audio server unresponsive)")
+            self.show_notification("Audio Toggle", "Audio server unresponsive; will retry on the next action")
+        elif state == 'closed':
+            self.indicator.set_icon_full("audio-volume-high-symbolic", "Audio Toggle")
+            self.item_toggle.set_label("Toggle Audio")
+        return False  # One-shot
+
+    def _mark_startup(self, stage):
+        if self.startup_timing:
+            self.startup_timing.mark(stage)
+
+    def _read_server_state(self, info=None, mark=lambda stage: None):
+        """Worker thread: server info (queried unless given), both device snapshots and the defaults"""
+        if info is None:
+            info = self.server_info()
+        audio_system = self.detect_audio_system(info) if info else None
+        mark('detect')
+        device_lists = {device_type: self.get_audio_devices(device_type) for device_type in ('sinks', 'sources')}
+        mark('devices')
+        defaults = {'sinks': self.get_current_device('sink'), 'sources': self.get_current_device('source')}
+        mark('defaults')
+        return ServerState(info, audio_system, device_lists, defaults)
+
+    def _apply_server_state(self, state):
+        """Main loop: adopt a ServerState and diff its devices into the Devices submenu"""
+        if state.info:
+            self.server_cookie = state.info.get('Cookie')
+        self.audio_system = state.audio_system
+        for device_type, devices in state.devices.items():
+            if devices or not self.backend.unresponsive:
+                self._apply_device_list(device_type, devices)
+        self._sync_default_items(state.defaults)
+
+    def _load_startup_snapshot(self):
+        """Startup thread: query the backend, then hand the results to the main loop"""
+        try:
+            if self.config.unresolved:
+                self.load_config()
+                self._mark_startup('patterns')
+            state = self._read_server_state(mark=self._mark_startup)
+        except FileNotFoundError:
+            # pactl is missing; server_info has said so
+            GLib.idle_add(self.quit, None)
+            return
+        GLib.idle_add(self._apply_startup_snapshot, state)
+
         # Check configuration
         if not all([self.speaker_device, self.headset_output, self.speaker_input, self.headset_input]):
             self.show_notification("Configuration Required", "Please configure your audio devices first.")
 
-    def _acquire_lock(self):
-        """Acquire exclusive lock to prevent multiple instances"""
-        try:
-            self.lockfile = open(self.lockfile_path, 'w')
-            fcntl.flock(self.lockfile.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
-            # Write PID to lockfile
-            self.lockfile.write(str(os.getpid()))
-            self.lockfile.flush()
-            # Register cleanup
-            atexit.register(self._release_lock)
-            return True
-        except IOError:
-            # Lock already held by another process
-            return False
-        except Exception as e:
-            print(f"Warning: Could not acquire lock: {e}")
-            return True  # Continue anyway if lock fails
+    def _apply_startup_snapshot(self, state):
+        """Main loop: merge the startup snapshot into the Devices submenu"""
+        self._apply_server_state(state)
+        self._mark_startup('menu merged')
+        if self.startup_timing:
+            self.startup_timing.report()
+        return False  # One-shot
+
+    def _on_server_lost(self):
+        """Main loop: pactl subscribe ended, so the server went away (restart, crash, suspend)"""
+        print("[Server] Audio server connection lost, reconnecting")
+        self._show_backend_state('reconnecting')
+        self.reconnect.start()
+
+    def _on_server_back(self, info):
+        """Main loop: the server answers again; resubscribe, then re-read its state off the main loop"""
+        restarted = info.get('Cookie') != self.server_cookie
+        print(f"[Server] Audio server {'restarted' if restarted else 'reconnected'}")
+        # Subscribe before reading, as at startup: changes made while the
+        # state is read still arrive as events
+        self.subscription.start()
+        threading.Thread(target=self._load_reconnect_snapshot, args=(info, restarted),
+                         name='server-reconnect', daemon=True).start()
+
+    def _load_reconnect_snapshot(self, info, restarted):
+        """Reconnect thread: read the returned server's state for the main loop"""
+        if self.config.unresolved:
+            # Patterns that found nothing while the server was down
+            self.load_config(retry=True)
+        GLib.idle_add(self._apply_reconnect_snapshot, self._read_server_state(info), restarted)
+
+    def _apply_reconnect_snapshot(self, state, restarted):
+        """Main loop: adopt the returned server's state, then run the toggles queued meanwhile"""
+        self._apply_server_state(state)
+        if restarted and self.forced_graph_rate:
+            # A new server instance starts with clock.force-rate unset
+            self.forced_graph_rate = None
+            self.align_sample_rate(state.defaults['sinks'])
+        if not self.backend.unresponsive:
+            self._show_backend_state('closed')
+        queued, self._queued_toggles = self._queued_toggles, []
+        now = time.monotonic()
+        for queued_at in queued:
+            if now - queued_at > self.QUEUED_TOGGLE_TTL:
+                print(f"[Server] Dropping a toggle queued {now - queued_at:.0f}s ago")
+                continue
+            print("[Server] Replaying a toggle queued while reconnecting")
+            super().toggle_audio(None)
+        return False  # One-shot
+
+    def toggle_audio(self, _):
+        """Toggle now, or once the server is back if it is restarting"""
+        if self.reconnect.active:
+            self._queued_toggles.append(time.monotonic())
+            self.show_notification("Audio Toggle", "Audio server restarting; will toggle once it is back")
+            return None
+        return super().toggle_audio(_)
+
+    def _build_devices_menu(self):
+        """Create the empty Outputs/Inputs sections of the Devices submenu"""
+        # Per device type: latest DeviceSnapshot, device ID -> CheckMenuItem, server index -> device ID
+        self.devices = {'sinks': DeviceSnapshot(), 'sources': DeviceSnapshot()}
+        self.device_items = {'sinks': {}, 'sources': {}}
+        self.device_indexes = {'sinks': {}, 'sources': {}}
+        self.default_devices = {'sinks': None, 'sources': None}
+        self._syncing_items = False
+        self._pending_refresh = set()
+        # New stream indexes awaiting routing, per stream type
+        self._pending_streams = {'sink-inputs': set(), 'source-outputs': set()}
+        self._refresh_source_id = None
+
+        header = Gtk.MenuItem(label="Outputs")
+        header.set_sensitive(False)
+        self.devices_menu.append(header)
+        self.devices_menu.append(Gtk.SeparatorMenuItem())
+        header = Gtk.MenuItem(label="Inputs")
+        header.set_sensitive(False)
+        self.devices_menu.append(header)
+
+    def _apply_device_list(self, device_type, devices):
+        """Diff a fresh DeviceSnapshot against the last one, touching only changed items; returns the DeviceChanges"""
+        previous = self.devices[device_type]
+        changes = devices.diff(previous)
+        for device in changes.removed:
+            self._remove_device_item(device_type, device.id)
+        self.devices[device_type] = devices
+        items = self.device_items[device_type]
+        indexes = self.device_indexes[device_type]
+        for device in changes.changed:
+            old = previous.get(device.id)
+            if old.index != device.index:
+                indexes.pop(old.index, None)
+            if device.name != old.name and device.id in items:
+                items[device.id].set_label(device.name)
+        for device in changes.added + changes.changed:
+            if device.index is not None:
+                indexes[device.index] = device.id
+            if device.id not in items:
+                self._add_device_item(device_type, device)
+        return changes
+
+    def _add_device_item(self, device_type, device):
+        item = Gtk.CheckMenuItem(label=device.name)
+        item.set_draw_as_radio(True)
+        item.set_active(device.id == self.default_devices[device_type])
+        item.connect("activate", self._on_device_item_activate, device_type, device.id)
+        items = self.device_items[device_type]
+        if device_type == 'sinks':
+            # Outputs sit between the "Outputs" header and the separator
+            self.devices_menu.insert(item, 1 + len(items))
+        else:
+            self.devices_menu.append(item)
+        items[device.id] = item
+        item.show()
+
+    def _remove_device_item(self, device_type, device_id):
+        self.devices[device_type] = self.devices[device_type].without(device_id)
+        item = self.device_items[device_type].pop(device_id, None)
+        if item is not None:
+            self.devices_menu.remove(item)
+            item.destroy()
+        indexes = self.device_indexes[device_type]
+        for index in [index for index, known_id in indexes.items() if known_id == device_id]:
+            del indexes[index]
+
+    def _sync_default_items(self, defaults=None):
+        """Mark the current defaults in the submenu, querying them unless given"""
+        if defaults is None:
+            defaults = {'sinks': self.get_current_device('sink'), 'sources': self.get_current_device('source')}
+        self.default_devices.update(defaults)
+        self._syncing_items = True
+        try:
+            for device_type, items in self.device_items.items():
+                for device_id, item in items.items():
+                    active = device_id == self.default_devices[device_type]
+                    if item.get_active() != active:
+                        item.set_active(active)
+        finally:
+            self._syncing_items = False
+        self._publish_watch_state()
+
+    def _publish_watch_state(self):
+        """Push the --watch record to watching clients if it changed since the last push"""
+        if not self.query_server.watchers:
+            self._watch_state = None
+            return
+        state = self.watch_state()
+        if state != self._watch_state:
+            self._watch_state = state
+            self.query_server.publish(state)
+
+    def _on_device_item_activate(self, item, device_type, device_id):
+        """Make the picked device the default"""
+        if self._syncing_items:
+            return
+        if device_id != self.default_devices[device_type]:
+            self.set_audio_device(device_id, 'sink' if device_type == 'sinks' else 'source')
+        # The server 'change' event confirms the switch; re-assert radio state now
+        self._sync_default_items()
+
+    def _on_pactl_event(self, event, facility, index):
+        """Route a pactl subscribe event to the affected part of the submenu"""
+        device_type = {'sink': 'sinks', 'source': 'sources'}.get(facility)
+        if device_type and event == 'remove':
+            # Removal needs no enumeration, the index identifies the item
+            device_id = self.device_indexes[device_type].get(index)
+            if device_id is not None:
+                self._remove_device_item(device_type, device_id)
+        elif device_type and event in ('new', 'change'):
+            # 'change' covers renames (proplist updates) as well as volume;
+            # the snapshot diff only touches items whose label changed
+            self._schedule_refresh(device_type)
+        elif facility == 'server' and event == 'change':
+            self._schedule_refresh('defaults')
+        elif facility == 'card' and event == 'change':
+            # Jack plug/unplug and HDMI sleep change port availability on the card
+            self._schedule_refresh('sinks')
+            self._schedule_refresh('sources')
+        elif facility in ('sink-input', 'source-output') and event == 'new':
+            # Cheap when cached: picks up rules added since the last toggle
+            self.load_config()
+            if self.config.router:
+                self._pending_streams[facility + 's'].add(index)
+                self._schedule_refresh('streams')
+
+    def _schedule_refresh(self, what):
+        """Coalesce bursts of events (e.g. a card adding several ports) into one refresh"""
+        self._pending_refresh.add(what)
+        if self._refresh_source_id is None:
+            self._refresh_source_id = GLib.timeout_add(100, self._run_pending_refresh)
+
+    def _run_pending_refresh(self):
+        self._refresh_source_id = None
+        pending, self._pending_refresh = self._pending_refresh, set()
+        appeared = False
+        for device_type in ('sinks', 'sources'):
+            if device_type in pending:
+                devices = self.get_audio_devices(device_type)
+                if not devices and self.backend.unresponsive:
+                    # Keep the last known list rather than emptying the menu
+                    continue
+                appeared |= bool(self._apply_device_list(device_type, devices).added)
+        if self.config.unresolved and appeared:
+            # A device a "match" pattern waits for has just appeared
+            self.load_config(retry=True)
+        if pending - {'streams'}:
+            self._sync_default_items()
+        if 'streams' in pending:
+            self._route_new_streams()
+        return False  # One-shot
+
+    def _route_new_streams(self):
+        """Move newly created streams that match a routing rule to their target device"""
+        router = self.config.router
+        for stream_type, target_key, move in (('sink-inputs', 'output', 'move-sink-input'),
+                                              ('source-outputs', 'input', 'move-source-output')):
+            indexes, self._pending_streams[stream_type] = self._pending_streams[stream_type], set()
+            if not indexes:
+                continue
+            # pactl cannot list a single stream, so one listing serves the whole
+            # burst and only the new indexes' properties are parsed
+            streams = parse_pactl_streams(stream_type, indexes, backend=self.backend)
+            for index, properties in streams.items():
+                rule = router.route(properties)
+                target = rule.get(target_key) if rule else None
+                if not target:
+                    continue
+                print(f"[Route] {properties.get('application.name', index)} -> {target}")
+                try:
+                    self.backend.run(['/usr/bin/pactl', move, str(index), target], check=True)
+                except Exception as e:
+                    print(f"Error routing stream {index}: {e}")
+
+    def _acquire_lock(self):
+        """Acquire exclusive lock to prevent multiple instances"""
+        try:
+            self.lockfile = open(self.lockfile_path, 'w')
+            fcntl.flock(self.lockfile.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            # Write PID to lockfile
+            self.lockfile.write(str(os.getpid()))
+            self.lockfile.flush()
+            # Register cleanup
+            atexit.register(self._release_lock)
+            return True
+        except IOError:
+            # Lock already held by another process
+            return False
+        except Exception as e:
+            print(f"Warning: Could not acquire lock: {e}")
+            return True  # Continue anyway if lock fails
+
+    def _release_lock(self):
+        """Release the lock file"""
+        try:
+            if self.lockfile:
+                fcntl.flock(self.lockfile.fileno(), fcntl.LOCK_UN)
+                self.lockfile.close()
+            if self.lockfile_path.exists():
+                self.lockfile_path.unlink()
+        except Exception:
+            pass  # Ignore errors during cleanup
+
+    def get_cached_device(self, device_id, device_type):
+        return self.devices[device_type].get(device_id)
+
+    def current_defaults(self):
+        # Kept current by pactl events; empty only until the startup snapshot lands
+        if self.default_devices['sinks'] is None:
+            return super().current_defaults()
+        return dict(self.default_devices)
+
+    def known_devices(self, device_type):
+        if not self.devices[device_type]:
+            return super().known_devices(device_type)
+        return self.devices[device_type]
+
+    def get_device_display_name(self, device_id, device_type):
+        """Convert device ID to friendly display name, preferring the live submenu labels"""
+        item = self.device_items[device_type].get(device_id)
+        if item is not None:
+            return item.get_label()
+        return super().get_device_display_name(device_id, device_type)
+
+    def configure_devices(self, _):
+        """Open the configuration dialog, populated from the live device state"""
+        if self.config_dialog is not None:
+            self.config_dialog.present()
+            return
+        self.load_config()
+
+        dialog = Gtk.Dialog(title="Configure Audio Toggle")
+        dialog.add_button("Close", Gtk.ResponseType.CLOSE)
+        grid = Gtk.Grid(column_spacing=12, row_spacing=6, margin=12)
+        rows = (
+            ("Profile 1 Output", 'speaker_device', 'sinks'),
+            ("Profile 1 Input", 'speaker_input', 'sources'),
+            ("Profile 2 Output", 'headset_output', 'sinks'),
+            ("Profile 2 Input", 'headset_input', 'sources'),
+        )
+        for row, (label, key, device_type) in enumerate(rows):
+            grid.attach(Gtk.Label(label=label, xalign=0), 0, row, 1, 1)
+            combo = Gtk.ComboBoxText()
+            # Reuse the Devices submenu's state instead of enumerating again
+            for device_id, item in self.device_items[device_type].items():
+                combo.append(device_id, item.get_label())
+            current = getattr(self, key)
+            if current:
+                if current not in self.device_items[device_type]:
+                    combo.append(current, f"{current} (not connected)")
+                combo.set_active_id(current)
+            combo.connect("changed", self._on_config_combo_changed, key)
+            grid.attach(combo, 1, row, 1, 1)
+        dialog.get_content_area().add(grid)
+        dialog.connect("response", self._on_config_dialog_response)
+        dialog.show_all()
+        self.config_dialog = dialog
+
+    def _on_config_combo_changed(self, combo, key):
+        """Save each selection as soon as it is made"""
+        device_id = combo.get_active_id()
+        if device_id and device_id != getattr(self, key):
+            setattr(self, key, device_id)
+            self.save_config((key,))
+            self._publish_watch_state()
+
+    def _on_config_dialog_response(self, dialog, response):
+        dialog.destroy()
+        self.config_dialog = None
+    
+    def quit(self, _):
+        """Quit the application"""
+        self.reconnect.stop()
+        self.subscription.stop()
+        self.query_server.stop()
+        if self.hotkey:
+            self.hotkey.unbind()
+        self.profile_capture.stop()
+        # Don't leave the graph pinned once the tray is gone
+        self.release_graph_rate()
+        if self.memory_report:
+            self.memory_report.report()
+        self.backend.close()
+        self._release_lock()
+        Gtk.main_quit()
+    
+    def run(self):
+        """Run the GTK main loop"""
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        GLib.unix_signal_add(GLib.PRIORITY_DEFAULT, signal.SIGUSR1, self._on_sigusr1)
+        if self.memory_report:
+            GLib.unix_signal_add(GLib.PRIORITY_DEFAULT, signal.SIGUSR2, self._on_sigusr2)
+        if self.idle_check:
+            self.idle_check.start()
+        if self.startup_timing:
+            GLib.idle_add(self._mark_startup, 'main loop')
+        # Everything else is event-driven: the pactl subscription's IO watch,
+        # the hotkey, signals and a one-shot debounce. No periodic timers.
+        Gtk.main()
+        return not self.idle_check or self.idle_check.passed is not False
+
+    def _on_sigusr1(self):
+        """Start or stop a profile capture (kill -USR1 <pid>)"""
+        self.profile_capture.toggle()
+        return True  # Keep the handler installed
+
+    def _on_sigusr2(self):
+        """Print a memory report (kill -USR2 <pid>, requires --mem-report)"""
+        self.memory_report.report()
+        return True
+
+
+class ServerSession:
+    """
+    One audio server in multi-server mode. Commands run with PULSE_SERVER set
+    to the server address, on a dedicated worker thread, so a hung server
+    only delays requests routed to it.
+    """
+
+    def __init__(self, server, config_file, env=None):
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.server = server
+        backend = CommandBackend(env=dict(env or {}, PULSE_SERVER=server))
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"server-{server}")
+        # Loading the config may resolve match patterns against the server, so
+        # it runs on the worker too; later commands queue up behind it
+        self._session = self.executor.submit(AudioSession, config_file, backend)
+
+    @property
+    def session(self):
+        return self._session.result()
+
+    def submit(self, command):
+        """Queue a command on this server's worker; returns a Future"""
+        if command == 'toggle':
+            return self.executor.submit(self._toggle)
+        return self.executor.submit(self._status)
+
+    def _toggle(self):
+        # No device events reach the daemon; a pattern waiting for its
+        # device is retried on each toggle (off any UI, on this worker)
+        self.session.load_config(retry=True)
+        profile = self.session.toggle_audio(None)
+        return {'ok': profile is not None, 'profile': profile}
+
+    def _status(self):
+        return {
+            'ok': True,
+            'output': self.session.get_current_device('sink'),
+            'input': self.session.get_current_device('source'),
+        }
+
+
+class MultiServerDaemon:
+    """
+    Headless mode serving many PulseAudio/PipeWire sessions from one process.
+
+    The config file lists servers and their per-session config:
+      {"socket": "/run/audio_toggle/control.sock",
+       "servers": {"unix:/run/user/1001/pulse/native": {
+           "config_file": "/home/alice/.config/audio_toggle/config.json",
+           "env": {"DBUS_SESSION_BUS_ADDRESS": "unix:path=/run/user/1001/bus"}}}}
+
+    Clients send one JSON request line per connection on the control socket,
+    e.g. {"command": "toggle", "server": "unix:/run/user/1001/pulse/native"},
+    and get one JSON reply line.
+    """
+
+    # How long a client waits for its server's worker before giving up
+    REQUEST_TIMEOUT = 30
+
+    def __init__(self, config_path):
+        with open(config_path, 'r') as f:
+            config = json.load(f)
+        self.socket_path = Path(config.get('socket') or DEFAULT_CONTROL_SOCKET)
+        self.sessions = {}
+        for server, entry in (config.get('servers') or {}).items():
+            self.sessions[server] = ServerSession(
+                server, entry.get('config_file') or USER_CONFIG_FILE, entry.get('env')
+            )
+
+    def handle(self, request):
+        """Route one request to its server's worker and wait for the result"""
+        from concurrent.futures import TimeoutError as FutureTimeout
+
+        command = request.get('command')
+        if command not in ('toggle', 'status'):
+            return {'ok': False, 'error': f"unknown command {command!r}"}
+        session = self.sessions.get(request.get('server'))
+        if session is None:
+            return {'ok': False, 'error': f"unknown server {request.get('server')!r}"}
+        try:
+            return session.submit(command).result(timeout=self.REQUEST_TIMEOUT)
+        except FutureTimeout:
+            return {'ok': False, 'error': "audio server did not respond"}
+        except BaseException as e:
+            # Whatever the worker died of, the client still gets its reply line
+            return {'ok': False, 'error': str(e) or type(e).__name__}
+
+    def _serve_connection(self, conn):
+        with conn, conn.makefile('rwb') as stream:
+            try:
+                request = json.loads(stream.readline() or b'{}')
+            except ValueError:
+                request = {}
+            reply = self.handle(request) if isinstance(request, dict) else {'ok': False}
+            stream.write(json.dumps(reply).encode() + b'\n')
+            stream.flush()
+
+    def serve_forever(self):
+        import socket
+
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+        if self.socket_path.exists():
+            self.socket_path.unlink()
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(str(self.socket_path))
+        listener.listen(16)
+        print(f"Serving {len(self.sessions)} audio servers on {self.socket_path}")
+        try:
+            while True:
+                conn, _ = listener.accept()
+                threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            listener.close()
+            self.socket_path.unlink()
+
+
+def send_control_request(socket_path, request, timeout=MultiServerDaemon.REQUEST_TIMEOUT + 5):
+    """Send one request to a multi-server daemon and return its reply"""
+    import socket
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        conn.settimeout(timeout)
+        conn.connect(str(socket_path))
+        with conn.makefile('rwb') as stream:
+            stream.write(json.dumps(request).encode() + b'\n')
+            stream.flush()
+            return json.loads(stream.readline())
+
+
+def describe_device(device):
+    """A Device record as plain JSON (port tuples and sample_spec spelled out)"""
+    described = {'id': device.id, 'name': device.name}
+    if device.index is not None:
+        described['index'] = device.index
+    if device.sample_spec:
+        described['sample_format'], described['sample_rate'] = device.sample_spec
+    if device.ports is not None:
+        described['active_port'] = device.active_port
+        described['ports'] = {port: {'available': available, 'priority': priority}
+                              for port, (available, priority) in device.ports.items()}
+    return described
+
+
+def tray_is_running(socket_path=TRAY_SOCKET):
+    """
+    True if a tray instance accepts connections on its query socket. The
+    probe connects and hangs up without a request, which the tray ignores;
+    unlike taking the lock file, it cannot make a starting tray think
+    another instance holds the lock.
+    """
+    import socket
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        conn.settimeout(1)
+        try:
+            conn.connect(str(socket_path))
+        except OSError:
+            return False
+    return True
+
+
+def query_tray(command, socket_path=TRAY_SOCKET, timeout=2):
+    """Ask the running tray for its in-memory state; None if no tray answers"""
+    try:
+        reply = send_control_request(socket_path, {'command': command}, timeout=timeout)
+    except (OSError, ValueError):
+        return None
+    return reply if reply.get('ok') else None
+
+
+def print_query_reply(command, reply, as_json):
+    if as_json:
+        print(json.dumps(reply, indent=2))
+        return
+    if command == 'list':
+        for device_type, default_key in (('sinks', 'sink'), ('sources', 'source')):
+            print("Outputs:" if device_type == 'sinks' else "Inputs:")
+            for device in reply[device_type]:
+                marker = '*' if device['id'] == reply['defaults'][default_key] else ' '
+                print(f"  {marker} {device['name']}  ({device['id']})")
+    else:
+        print(f"Output:  {reply['defaults']['sink']}")
+        print(f"Input:   {reply['defaults']['source']}")
+        print(f"Profile: {reply['profile_label'] or ('none' if reply['configured'] else 'not configured')}")
+
+
+class WatchSession(AudioSession):
+    """AudioSession for a direct --watch: device lists are kept until a device is added or removed"""
+
+    def __init__(self, backend=None):
+        super().__init__(backend=backend)
+        self._snapshots = {}
+
+    def get_audio_devices(self, device_type='sinks'):
+        devices = self._snapshots.get(device_type)
+        if devices is None:
+            devices = self._snapshots[device_type] = super().get_audio_devices(device_type)
+        return devices
+
+    def invalidate(self, device_type=None):
+        if device_type is None:
+            self._snapshots.clear()
+        else:
+            self._snapshots.pop(device_type, None)
+
 
-    def _release_lock(self):
-        """Release the lock file"""
+class StatusWatch:
+    """
+    --watch: one JSON line per change of the active profile or the default
+    devices (see AudioSession.watch_state), for status bars.
+
+    With a running tray it relays the tray's state over its socket and
+    opens no audio server connection of its own; without one (or once the
+    tray quits) it follows `pactl subscribe` itself. It re-queries only
+    for default changes and added/removed devices, coalescing each burst
+    of events, and blocks in between. A tray that starts later connects to
+    the server as a client, which wakes the direct watch to hand over to it.
+    """
+
+    # After a relevant event, wait this long for the rest of its burst
+    COALESCE_SECONDS = 0.1
+
+    def __init__(self, backend, out=None):
+        self.backend = backend
+        self.out = out or sys.stdout
+        self.last = None
+
+    def run(self):
         try:
-            if self.lockfile:
-                fcntl.flock(self.lockfile.fileno(), fcntl.LOCK_UN)
-                self.lockfile.close()
-            if self.lockfile_path.exists():
-                self.lockfile_path.unlink()
-        except Exception:
-            pass  # Ignore errors during cleanup
+            while True:
+                if self.backend.live and self.follow_tray():
+                    print("[Watch] Tray quit, watching the audio server directly", file=sys.stderr)
+                if not self.follow_server():
+                    return
+                print("[Watch] Tray started, following it", file=sys.stderr)
+        except (KeyboardInterrupt, BrokenPipeError):
+            # The status bar went away
+            pass
+
+    def emit(self, record):
+        if record != self.last:
+            self.last = record
+            self.out.write(json.dumps(record) + '\n')
+            self.out.flush()
+
+    def follow_tray(self, socket_path=TRAY_SOCKET):
+        """Relay the running tray's watch stream until it ends; False if no tray streamed"""
+        import socket
 
-    def detect_audio_system(self):
-        """Detect if using PulseAudio or PipeWire"""
+        streamed = False
         try:
-            # Check for PipeWire
-            result = subprocess.run(['/usr/bin/pactl', 'info'], capture_output=True, text=True)
-            if 'PipeWire' in result.stdout:
-                return 'pipewire'
-            return 'pulseaudio'
-        except FileNotFoundError:
-            print("Error: pactl not found. Please install PulseAudio or PipeWire.")
-            sys.exit(1)
-    
-    def load_config(self):
-        """Load device configuration from file"""
-        if self.config_file.exists():
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+                conn.settimeout(2)
+                conn.connect(str(socket_path))
+                with conn.makefile('rwb') as stream:
+                    stream.write(json.dumps({'command': 'watch'}).encode() + b'\n')
+                    stream.flush()
+                    record = json.loads(stream.readline())
+                    if record.get('ok') is False:
+                        return False
+                    streamed = True
+                    self.emit(record)
+                    conn.settimeout(None)
+                    for line in stream:
+                        self.emit(json.loads(line))
+        except (OSError, ValueError):
+            pass
+        return streamed
+
+    def follow_server(self):
+        """
+        Follow `pactl subscribe` directly, resubscribing with backoff whenever
+        it ends. Returns True once a tray is running to follow instead.
+        """
+        session = WatchSession(backend=self.backend)
+        attempt = 0
+        while True:
+            if self.backend.live and tray_is_running():
+                return True
+            self.emit(session.watch_state())
+            if not self.backend.live:
+                return False
             try:
-                with open(self.config_file, 'r') as f:
-                    config = json.load(f)
-                    self.speaker_device = config.get('speaker_device', '')
-                    self.headset_output = config.get('headset_output', '')
-                    self.speaker_input = config.get('speaker_input', '')
-                    self.headset_input = config.get('headset_input', '')
-            except Exception as e:
-                print(f"Failed to load config: {e}")
-                self.speaker_device = ''
-                self.headset_output = ''
-                self.speaker_input = ''
-                self.headset_input = ''
-        else:
-            self.speaker_device = ''
-            self.headset_output = ''
-            self.speaker_input = ''
-            self.headset_input = ''
+                process = subprocess.Popen(['/usr/bin/pactl', 'subscribe'],
+                                           stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+            except OSError as e:
+                print(f"Error: cannot follow the audio server: {e}", file=sys.stderr)
+                return False
+            try:
+                for changed in self._bursts(process.stdout.fileno(), session):
+                    if tray_is_running():
+                        return True
+                    if changed:
+                        attempt = 0
+                        self.emit(session.watch_state())
+            finally:
+                process.kill()
+                process.wait()
+                process.stdout.close()
+            # pactl exited: the server went away or was restarted
+            session.invalidate()
+            time.sleep(ServerReconnect.BACKOFF_SECONDS[min(attempt, len(ServerReconnect.BACKOFF_SECONDS) - 1)])
+            attempt += 1
 
-    def get_short_device_name(self, device_name):
+    def _bursts(self, fd, session):
         """
-        Simplify device names for display - matches Windows implementation
-        Extracts brand/model from parentheses and cleans up special characters
+        Yield once per burst of events that can change the record (True) or
+        that only had new clients, such as a starting tray (False); ends
+        with the stream.
         """
-        import re
+        import select
+
+        buffer = b''
+        pending = changed = False
+        while True:
+            readable, _, _ = select.select([fd], [], [], self.COALESCE_SECONDS if pending else None)
+            if not readable:
+                yield changed
+                pending = changed = False
+                continue
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                if pending:
+                    yield changed
+                return
+            lines = (buffer + chunk).split(b'\n')
+            buffer = lines.pop()
+            for line in lines:
+                match = PactlSubscription.EVENT_RE.match(line.decode('utf-8', 'replace'))
+                if not match:
+                    continue
+                event, facility, _ = match.groups()
+                if facility == 'server' and event == 'change':
+                    pending = changed = True
+                elif facility in ('sink', 'source') and event in ('new', 'remove'):
+                    session.invalidate(facility + 's')
+                    pending = changed = True
+                elif facility == 'client' and event == 'new':
+                    pending = True
 
-        # Extract content from parentheses if present
-        match = re.search(r'\(([^)]+)\)', device_name)
-        if match:
-            name = match.group(1)
-        else:
-            name = device_name
 
-        # Remove any remaining parentheses and their content (including partial ones)
-        name = re.sub(r'\([^)]*\)', '', name)   # Complete pairs like (R)
-        name = re.sub(r'\([^)]*$', '', name)    # Partial opening like (R
-        name = re.sub(r'\(', '', name)          # Any remaining (
-        name = re.sub(r'\)', '', name)          # Any remaining )
-        name = re.sub(r'\s+', ' ', name)        # Collapse multiple spaces
-        name = name.strip()
+class TrayQueryServer:
+    """
+    Answers 'status'/'list' requests from the tray's in-memory state on a
+    Unix socket, inside the GLib main loop: the listening socket is an IO
+    watch, so nothing runs until a client connects.
 
-        # Truncate if too long
-        if len(name) > 30:
-            name = name[:27] + "..."
+    A 'watch' client gets the current state and stays connected; publish()
+    sends it each later state as one JSON line.
+    """
 
-        return name
+    def __init__(self, socket_path, handler):
+        self.socket_path = Path(socket_path)
+        self.handler = handler
+        self.listener = None
+        self._watch_id = None
+        # 'watch' client socket -> IO watch ID noticing its hangup
+        self.watchers = {}
+
+    def start(self):
+        import socket
 
-    def get_device_display_name(self, device_id, device_type):
-        """
-        Convert device ID to friendly display name
-        device_type: 'sinks' or 'sources'
-        """
         try:
-            devices = self.get_audio_devices(device_type)
-            for device in devices:
-                if device.get('id') == device_id:
-                    return device.get('name', device_id)
-            # Fallback to device ID if not found
-            return device_id
-        except Exception:
-            return device_id
+            if self.socket_path.exists():
+                self.socket_path.unlink()
+            self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.listener.bind(str(self.socket_path))
+            self.listener.listen(4)
+        except OSError as e:
+            print(f"Warning: Status queries unavailable: {e}")
+            self.listener = None
+            return False
+        self._watch_id = GLib.io_add_watch(self.listener.fileno(), GLib.PRIORITY_DEFAULT,
+                                           GLib.IOCondition.IN, self._on_connection)
+        return True
 
-    def save_config(self):
-        """Save device configuration to file"""
-        self.config_file.parent.mkdir(parents=True, exist_ok=True)
-        config = {
-            'speaker_device': self.speaker_device,
-            'headset_output': self.headset_output,
-            'speaker_input': self.speaker_input,
-            'headset_input': self.headset_input
-        }
-        with open(self.config_file, 'w') as f:
-            json.dump(config, f, indent=2)
-    
-    def get_audio_devices(self, device_type='sinks'):
-        """Get list of audio devices using pactl - optimized to run pactl only once"""
+    def _on_connection(self, fd, condition):
+        conn, _ = self.listener.accept()
+        # Clients send their request right away; don't let a stuck one hold the UI
+        conn.settimeout(1)
+        command = None
         try:
-            # Get full device list with descriptions in one call
-            cmd = ['/usr/bin/pactl', 'list', device_type]
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+            with conn.makefile('rwb') as stream:
+                line = stream.readline()
+                if not line:
+                    # tray_is_running() probing: connected, nothing to answer
+                    conn.close()
+                    return True
+                request = json.loads(line)
+                command = request.get('command') if isinstance(request, dict) else None
+                if command in ('status', 'list', 'watch'):
+                    reply = self.handler(command)
+                else:
+                    reply = {'ok': False, 'error': f"unknown command {command!r}"}
+                stream.write(json.dumps(reply).encode() + b'\n')
+                stream.flush()
+        except (OSError, ValueError) as e:
+            print(f"Status query failed: {e}")
+            command = None
+        if command == 'watch':
+            # Pushes must never block the main loop: a client that stops
+            # reading is dropped instead
+            conn.setblocking(False)
+            self.watchers[conn] = GLib.io_add_watch(
+                conn.fileno(), GLib.PRIORITY_DEFAULT,
+                GLib.IOCondition.IN | GLib.IOCondition.HUP | GLib.IOCondition.ERR,
+                self._on_watcher_hangup, conn
+            )
+        else:
+            conn.close()
+        return True
 
-            devices = []
-            current_device = {}
+    def _on_watcher_hangup(self, fd, condition, conn):
+        # Watchers send nothing after their request, so readable means gone
+        self.watchers.pop(conn, None)
+        conn.close()
+        return False
+
+    def publish(self, record):
+        """Send record to every 'watch' client"""
+        line = json.dumps(record).encode() + b'\n'
+        for conn in list(self.watchers):
+            try:
+                conn.sendall(line)
+            except OSError:
+                self._drop_watcher(conn)
 
-            for line in result.stdout.split('\n'):
-                line = line.strip()
+    def _drop_watcher(self, conn):
+        watch_id = self.watchers.pop(conn, None)
+        if watch_id is not None:
+            GLib.source_remove(watch_id)
+        conn.close()
 
-                # New device entry
-                if line.startswith('Name:'):
-                    if current_device and 'id' in current_device:
-                        # Skip monitor sources for inputs
-                        if device_type != 'sources' or not current_device['id'].endswith('.monitor'):
-                            devices.append(current_device)
-                    current_device = {'id': line.split('Name:')[1].strip()}
+    def stop(self):
+        # Stop accepting first, so a --watch client that sees its stream end
+        # finds no tray left to reconnect to
+        if self._watch_id is not None:
+            GLib.source_remove(self._watch_id)
+            self._watch_id = None
+        if self.listener is not None:
+            self.listener.close()
+            self.listener = None
+            try:
+                self.socket_path.unlink()
+            except OSError:
+                pass
+        for conn in list(self.watchers):
+            self._drop_watcher(conn)
 
-                # Get description
-                elif line.startswith('Description:') and 'id' in current_device:
-                    current_device['name'] = line.split('Description:')[1].strip()
 
-            # Add last device
-            if current_device and 'id' in current_device:
-                if device_type != 'sources' or not current_device['id'].endswith('.monitor'):
-                    devices.append(current_device)
+class GlobalHotkey:
+    """
+    System-wide shortcut calling back into the running app: Keybinder on
+    X11, the XDG GlobalShortcuts portal on Wayland or without Keybinder.
+    accelerator uses GTK syntax, e.g. "<Ctrl><Alt>a".
+    """
+
+    PORTAL_BUS = 'org.freedesktop.portal.Desktop'
+    PORTAL_PATH = '/org/freedesktop/portal/desktop'
+    PORTAL_IFACE = 'org.freedesktop.portal.GlobalShortcuts'
+    SHORTCUT_ID = 'toggle'
+
+    def __init__(self, accelerator, callback):
+        self.accelerator = accelerator
+        self.callback = callback
+        self.method = None
+        self._bus = None
+        self._subscriptions = []
+        # Object path of the portal's GlobalShortcuts session, once created
+        self._session = None
+
+    def bind(self):
+        """Register the shortcut; returns False if no mechanism is available"""
+        wayland = os.environ.get('XDG_SESSION_TYPE') == 'wayland' or 'WAYLAND_DISPLAY' in os.environ
+        if not wayland and self._bind_keybinder():
+            self.method = 'keybinder'
+        elif self._bind_portal():
+            self.method = 'portal'
+        else:
+            print(f"Warning: Could not register hotkey {self.accelerator}")
+            return False
+        print(f"Hotkey {self.accelerator} registered via {self.method}")
+        return True
 
-            # Ensure all devices have a name
-            for device in devices:
-                if 'name' not in device:
-                    device['name'] = device['id']
+    def unbind(self):
+        if self.method == 'keybinder':
+            from gi.repository import Keybinder
+            Keybinder.unbind(self.accelerator)
+        for subscription in self._subscriptions:
+            self._bus.signal_unsubscribe(subscription)
+        self._subscriptions = []
+        if self._session is not None:
+            self._close_portal_session()
+        self.method = None
 
-            return devices
+    def _close_portal_session(self):
+        """Close the GlobalShortcuts session, which releases the shortcut"""
+        from gi.repository import Gio
+
+        session, self._session = self._session, None
+        try:
+            self._bus.call_sync(self.PORTAL_BUS, session, 'org.freedesktop.portal.Session', 'Close',
+                                None, None, Gio.DBusCallFlags.NONE, 1000, None)
         except Exception as e:
-            print(f"Error getting devices: {e}")
-            return []
-    
-    def get_current_device(self, device_type='sink'):
-        """Get current default audio device"""
+            print(f"Warning: Could not close hotkey portal session: {e}")
+
+    def _bind_keybinder(self):
         try:
-            cmd = ['/usr/bin/pactl', f'get-default-{device_type}']
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-            return result.stdout.strip()
+            import gi
+            gi.require_version('Keybinder', '3.0')
+            from gi.repository import Keybinder
+        except (ImportError, ValueError):
+            return False
+        Keybinder.init()
+        return bool(Keybinder.bind(self.accelerator, lambda keystring: self.callback()))
+
+    def portal_trigger(self):
+        """Convert the GTK accelerator to the shortcuts-spec form, e.g. CTRL+ALT+a"""
+        names = {'ctrl': 'CTRL', 'control': 'CTRL', 'primary': 'CTRL', 'alt': 'ALT',
+                 'shift': 'SHIFT', 'super': 'LOGO', 'meta': 'LOGO'}
+        modifiers = re.findall(r'<(\w+)>', self.accelerator)
+        key = re.sub(r'<\w+>', '', self.accelerator)
+        return '+'.join([names.get(modifier.lower(), modifier.upper()) for modifier in modifiers] + [key])
+
+    def _bind_portal(self):
+        """Create a GlobalShortcuts session; binding completes asynchronously"""
+        try:
+            from gi.repository import Gio
+            self._bus = Gio.bus_get_sync(Gio.BusType.SESSION, None)
         except Exception as e:
-            print(f"Error getting current device: {e}")
-            return None
-    
-    def set_audio_device(self, device_id, device_type='sink'):
-        """Set default audio device"""
+            print(f"Warning: Session bus unavailable: {e}")
+            return False
+        self._token = f"audio_toggle_{os.getpid()}"
+        options = {
+            'handle_token': GLib.Variant('s', self._token + '_session'),
+            'session_handle_token': GLib.Variant('s', self._token),
+        }
+        return self._portal_request('CreateSession', GLib.Variant('(a{sv})', (options,)),
+                                    self._token + '_session', self._on_session_created)
+
+    def _portal_request(self, method, parameters, handle_token, on_response):
+        """Call a portal method and deliver its Request::Response results to on_response"""
+        from gi.repository import Gio
+
+        # Subscribe before calling, the Response may arrive before the reply
+        sender = self._bus.get_unique_name()[1:].replace('.', '_')
+        request_path = f"{self.PORTAL_PATH}/request/{sender}/{handle_token}"
+        subscription = None
+
+        def on_signal(bus, sender_name, path, interface, signal_name, params):
+            self._bus.signal_unsubscribe(subscription)
+            self._subscriptions.remove(subscription)
+            response, results = params.unpack()
+            if response == 0:
+                on_response(results)
+            else:
+                print(f"Warning: Hotkey portal {method} was denied ({response})")
+
+        subscription = self._bus.signal_subscribe(
+            self.PORTAL_BUS, 'org.freedesktop.portal.Request', 'Response', request_path,
+            None, Gio.DBusSignalFlags.NONE, on_signal
+        )
+        self._subscriptions.append(subscription)
         try:
-            cmd = ['/usr/bin/pactl', f'set-default-{device_type}', device_id]
-            subprocess.run(cmd, check=True, capture_output=True)
-            return True
+            self._bus.call_sync(self.PORTAL_BUS, self.PORTAL_PATH, self.PORTAL_IFACE, method,
+                                parameters, None, Gio.DBusCallFlags.NONE, -1, None)
         except Exception as e:
-            print(f"Error setting device: {e}")
+            print(f"Warning: Hotkey portal unavailable: {e}")
             return False
-    
-    def toggle_audio(self, _):
-        """Toggle between audio configurations"""
-        # Reload configuration to get latest settings
-        self.load_config()
-        
-        if not all([self.speaker_device, self.headset_output, self.speaker_input, self.headset_input]):
-            self.show_notification("Configuration Required", "Please use 'Configure Devices...' from the menu to set up your audio devices.")
-            return
-        
-        # Get current device
-        current_output = self.get_current_device('sink')
-        
-        # Debug logging
-        print(f"[Toggle] Current output: '{current_output}'")
-        print(f"[Toggle] Profile 1 Output: '{self.speaker_device}'")
-        print(f"[Toggle] Profile 2 Output: '{self.headset_output}'")
-        
-        # Determine target devices based on current state
-        if current_output == self.headset_output:
-            # Currently on headset (Profile 2), switch to speakers (Profile 1)
-            target_output = self.speaker_device
-            target_input = self.speaker_input
-            profile_name = "Profile 1"
-        elif current_output == self.speaker_device:
-            # Currently on speakers (Profile 1), switch to headset (Profile 2)
-            target_output = self.headset_output
-            target_input = self.headset_input
-            profile_name = "Profile 2"
-        else:
-            # Current device doesn't match either configured device
-            # Default to switching to speakers
-            print(f"[Toggle] Warning: Current device doesn't match configured devices")
-            print(f"[Toggle] Defaulting to Profile 1")
-            target_output = self.speaker_device
-            target_input = self.speaker_input
-            profile_name = "Profile 1"
-        
-        print(f"[Toggle] Switching to {profile_name}: output='{target_output}', input='{target_input}'")
-        
-        # Attempt to switch output device
-        output_success = self.set_audio_device(target_output, 'sink')
-        if not output_success:
-            self.show_notification("Audio Toggle", f"Failed to switch output to {target_output}")
-            return
+        return True
 
-        # Attempt to switch input device
-        input_success = self.set_audio_device(target_input, 'source')
-        if not input_success:
-            self.show_notification("Audio Toggle", f"Output switched but input failed")
-            return
+    def _on_session_created(self, results):
+        from gi.repository import Gio
 
-        # Both switches succeeded
-        # Get display names from device IDs
-        target_output_display = self.get_device_display_name(target_output, 'sinks')
-        target_input_display = self.get_device_display_name(target_input, 'sources')
+        session = results['session_handle']
+        self._session = session
+        self._subscriptions.append(self._bus.signal_subscribe(
+            self.PORTAL_BUS, self.PORTAL_IFACE, 'Activated', self.PORTAL_PATH,
+            session, Gio.DBusSignalFlags.NONE, self._on_activated
+        ))
+        shortcuts = [(self.SHORTCUT_ID, {
+            'description': GLib.Variant('s', "Toggle audio profile"),
+            'preferred_trigger': GLib.Variant('s', self.portal_trigger()),
+        })]
+        options = {'handle_token': GLib.Variant('s', self._token + '_bind')}
+        self._portal_request('BindShortcuts', GLib.Variant('(oa(sa{sv})sa{sv})', (session, shortcuts, '', options)),
+                             self._token + '_bind', lambda results: None)
 
-        # Shorten device names for display
-        out_short = self.get_short_device_name(target_output_display)
-        in_short = self.get_short_device_name(target_input_display)
+    def _on_activated(self, bus, sender_name, path, interface, signal_name, params):
+        if params.unpack()[1] == self.SHORTCUT_ID:
+            self.callback()
 
-        # Determine full profile label
-        if profile_name == "Profile 1":
-            profile_label = "Profile 1 (Desktop)"
-        elif profile_name == "Profile 2":
-            profile_label = "Profile 2 (Headset)"
-        else:
-            profile_label = profile_name  # Fallback for edge cases
 
-        # Format notification to match Windows
-        message = f"{profile_label}\n🔊 {out_short}\n🎤 {in_short}"
-        self.show_notification("Audio Toggle", message)
-    
-    def show_notification(self, title, message):
-        """Show desktop notification"""
+class PactlSubscription:
+    """
+    Streams `pactl subscribe` into the GLib main loop without polling.
+
+    on_event(event, facility, index) is called for lines such as
+    "Event 'new' on sink #12"; on_eof() when the stream ends.
+    """
+
+    EVENT_RE = re.compile(r"Event '(\w+)' on ([\w-]+)(?: #(\d+))?")
+    COMMAND = ['/usr/bin/pactl', 'subscribe']
+
+    def __init__(self, on_event, on_eof=None):
+        self.on_event = on_event
+        self.on_eof = on_eof
+        self.process = None
+        self._watch_id = None
+        self._buffer = b''
+
+    def start(self):
         try:
-            subprocess.run(['/usr/bin/notify-send', title, message], check=False)
-        except Exception:
-            print(f"{title}: {message}")
-    
-    def configure_devices(self, _):
-        """Open configuration in terminal"""
-        script_path = Path(__file__).resolve()
-        
-        # Command to execute: run configure then wait for user input to close
-        # Use shlex.quote to properly escape the path for shell execution
-        quoted_path = shlex.quote(str(script_path))
-        cmd_str = f'python3 {quoted_path} --configure; echo; echo Press Enter to close...; read'
-        
-        # List of terminal emulators with their specific invocation patterns
-        # Each entry is a complete command list to try with subprocess.Popen
-        # Note: We don't use --hold flags since the 'read' command keeps the terminal open
-        terminals = [
-            # gnome-terminal: modern syntax uses -- to separate terminal args from command
-            ['gnome-terminal', '--', 'bash', '-c', cmd_str],
-            # konsole: -e executes command
-            ['konsole', '-e', 'bash', '-c', cmd_str],
-            # xfce4-terminal: -x for command with args
-            ['xfce4-terminal', '-x', 'bash', '-c', cmd_str],
-            # mate-terminal: -x for command with args
-            ['mate-terminal', '-x', 'bash', '-c', cmd_str],
-            # lxterminal: -e followed by command
-            ['lxterminal', '-e', 'bash', '-c', cmd_str],
-            # tilix: -e executes command
-            ['tilix', '-e', 'bash', '-c', cmd_str],
-            # alacritty: -e followed by command and args
-            ['alacritty', '-e', 'bash', '-c', cmd_str],
-            # kitty: direct command execution
-            ['kitty', 'bash', '-c', cmd_str],
-            # ghostty: -e executes command
-            ['ghostty', '-e', 'bash', '-c', cmd_str],
-            # foot: direct command execution
-            ['foot', 'bash', '-c', cmd_str],
-            # terminator: -x for command with args
-            ['terminator', '-x', 'bash', '-c', cmd_str],
-            # urxvt: -e followed by command and args
-            ['urxvt', '-e', 'bash', '-c', cmd_str],
-            # st (suckless terminal): -e followed by command and args
-            ['st', '-e', 'bash', '-c', cmd_str],
-            # xterm: -e followed by command
-            ['xterm', '-e', 'bash', '-c', cmd_str],
-        ]
-
-        for terminal_cmd in terminals:
-            try:
-                subprocess.Popen(terminal_cmd)
-                return
-            except FileNotFoundError:
+            self.process = subprocess.Popen(self.COMMAND, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        except OSError as e:
+            print(f"Warning: Live device updates unavailable: {e}")
+            return False
+        fd = self.process.stdout.fileno()
+        os.set_blocking(fd, False)
+        self._watch_id = GLib.io_add_watch(
+            fd, GLib.PRIORITY_DEFAULT,
+            GLib.IOCondition.IN | GLib.IOCondition.HUP | GLib.IOCondition.ERR,
+            self._on_readable
+        )
+        return True
+
+    def _on_readable(self, fd, condition):
+        try:
+            chunk = os.read(fd, 65536)
+        except BlockingIOError:
+            return True
+        except OSError:
+            chunk = b''
+        if not chunk:
+            # pactl exited: the server went away or was restarted
+            self._watch_id = None
+            self.stop()
+            if self.on_eof:
+                self.on_eof()
+            return False
+
+        lines = (self._buffer + chunk).split(b'\n')
+        self._buffer = lines.pop()
+        for line in lines:
+            match = self.EVENT_RE.match(line.decode('utf-8', 'replace'))
+            if match:
+                event, facility, index = match.groups()
+                self.on_event(event, facility, int(index) if index else None)
+        return True
+
+    def stop(self):
+        if self._watch_id is not None:
+            GLib.source_remove(self._watch_id)
+            self._watch_id = None
+        if self.process is not None:
+            if self.process.poll() is None:
+                self.process.terminate()
+                self.process.wait()
+            self.process.stdout.close()
+            self.process = None
+        self._buffer = b''
+
+
+# One read of the server: server_info() dict (None if it did not answer),
+# 'pipewire'/'pulseaudio'/None, DeviceSnapshot per device type, default IDs
+ServerState = namedtuple('ServerState', ['info', 'audio_system', 'devices', 'defaults'])
+
+
+class ServerReconnect:
+    """
+    Waits for the audio server to come back after it went away.
+
+    probe() runs on a worker thread, so a server that is still starting
+    never blocks the main loop; it returns server_info() or None. Failed
+    probes are retried after BACKOFF_SECONDS, then every last entry. Once a
+    probe answers, on_ready(info) is called on the main loop.
+    """
+
+    BACKOFF_SECONDS = (0.5, 1, 2, 5, 10)
+
+    def __init__(self, probe, on_ready):
+        self.probe = probe
+        self.on_ready = on_ready
+        self.active = False
+        self._attempt = 0
+        self._source_id = None
+
+    def start(self):
+        if self.active:
+            return
+        self.active = True
+        self._attempt = 0
+        self._schedule()
+
+    def _schedule(self):
+        delay = self.BACKOFF_SECONDS[min(self._attempt, len(self.BACKOFF_SECONDS) - 1)]
+        self._source_id = GLib.timeout_add(int(delay * 1000), self._spawn_probe)
+
+    def _spawn_probe(self):
+        self._source_id = None
+        threading.Thread(target=self._probe, name='server-probe', daemon=True).start()
+        return False  # One-shot
+
+    def _probe(self):
+        try:
+            info = self.probe()
+        except Exception as e:
+            # Keep retrying: a dead probe thread would leave toggles queued forever
+            print(f"[Server] Probe failed: {e}")
+            info = None
+        GLib.idle_add(self._finish, info)
+
+    def _finish(self, info):
+        if not self.active:
+            return False  # Stopped meanwhile
+        if not info:
+            self._attempt += 1
+            self._schedule()
+            return False
+        self.active = False
+        self.on_ready(info)
+        return False
+
+    def stop(self):
+        self.active = False
+        if self._source_id is not None:
+            GLib.source_remove(self._source_id)
+            self._source_id = None
+
+
+def parse_pactl_output(lines, device_type, with_properties=False):
+    """
+    Parse `pactl list sinks|sources` lines into a DeviceSnapshot of Device
+    records (properties only if with_properties). Accepts any iterable of
+    lines so output can be parsed straight from the pipe.
+
+    ports maps port name -> (available, priority), where available is True,
+    False ("not available") or None (availability unknown).
+    """
+    devices = []
+    # Fields of the device being parsed, keyed like the Device constructor
+    current_device = {}
+    index = None
+    in_ports = False
+
+    for line in lines:
+        line = line.strip()
+
+        # Port lines look like:
+        #   analog-output-headphones: Headphones (type: Headphones, priority: 9900, not available)
+        if in_ports:
+            port, sep, details = line.partition(': ')
+            if sep and details.endswith(')') and 'priority: ' in details:
+                if details.endswith('not available)'):
+                    available = False
+                elif details.endswith('available)'):
+                    available = True
+                else:
+                    available = None
+                priority = re.search(r'priority: (\d+)', details)
+                current_device['ports'][sys.intern(port)] = (available, int(priority.group(1)) if priority else 0)
                 continue
+            in_ports = False
 
-        # No terminal found - show notification with instructions
-        # Use quoted_path for a working command users can copy
-        self.show_notification(
-            "Configuration Error",
-            f"No terminal found. Please run manually:\npython3 {quoted_path} --configure"
-        )
-    
-    def quit(self, _):
-        """Quit the application"""
-        self._release_lock()
-        Gtk.main_quit()
-    
-    def run(self):
-        """Run the GTK main loop"""
-        signal.signal(signal.SIGINT, signal.SIG_DFL)
-        Gtk.main()
+        # Section header carries the server index, e.g. "Sink #12"
+        if line.startswith(('Sink #', 'Source #')):
+            index = int(line.split('#')[1])
 
+        elif line == 'Ports:' and 'id' in current_device:
+            current_device['ports'] = {}
+            in_ports = True
 
-def parse_pactl_devices(device_type):
-    """Helper function to parse devices from pactl output - runs pactl only once!"""
-    try:
-        cmd = ['/usr/bin/pactl', 'list', device_type]
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+        elif line.startswith('Active Port:') and 'id' in current_device:
+            current_device['active_port'] = sys.intern(line[len('Active Port:'):].strip())
 
-        devices = []
-        current_device = {}
+        # New device entry
+        elif line.startswith('Name:'):
+            if current_device and 'id' in current_device:
+                # Skip monitor sources for inputs
+                if device_type != 'sources' or not current_device['id'].endswith('.monitor'):
+                    devices.append(Device(**current_device))
+            current_device = {'id': line[len('Name:'):].strip()}
+            if with_properties:
+                current_device['properties'] = {}
+            if index is not None:
+                current_device['index'] = index
+                index = None
 
-        for line in result.stdout.split('\n'):
-            line = line.strip()
+        # e.g. "Sample Specification: s24le 2ch 48000Hz" -> ('s24le', 48000)
+        elif line.startswith('Sample Specification:') and 'id' in current_device:
+            spec = line[len('Sample Specification:'):].split()
+            if len(spec) == 3 and spec[2].endswith('Hz') and spec[2][:-2].isdigit():
+                current_device['sample_spec'] = (sys.intern(spec[0]), int(spec[2][:-2]))
 
-            # New device entry
-            if line.startswith('Name:'):
-                if current_device and 'id' in current_device:
-                    # Skip monitor sources for inputs
-                    if device_type != 'sources' or not current_device['id'].endswith('.monitor'):
-                        devices.append(current_device)
-                current_device = {'id': line.split('Name:')[1].strip()}
+        # Get description
+        elif line.startswith('Description:') and 'id' in current_device:
+            current_device['name'] = sys.intern(line[len('Description:'):].strip())
 
-            # Get description
-            elif line.startswith('Description:') and 'id' in current_device:
-                current_device['name'] = line.split('Description:')[1].strip()
+        # Properties section entries look like: device.bus = "usb"
+        elif with_properties and ' = "' in line and line.endswith('"') and 'id' in current_device:
+            key, _, value = line.partition(' = ')
+            current_device['properties'][key] = value[1:-1]
 
-        # Add last device
-        if current_device and 'id' in current_device:
-            if device_type != 'sources' or not current_device['id'].endswith('.monitor'):
-                devices.append(current_device)
+    # Add last device
+    if current_device and 'id' in current_device:
+        if device_type != 'sources' or not current_device['id'].endswith('.monitor'):
+            devices.append(Device(**current_device))
 
-        # Ensure all devices have a name
-        for device in devices:
-            if 'name' not in device:
-                device['name'] = device['id']
+    return DeviceSnapshot(devices)
 
-        return devices
+
+def parse_pactl_devices(device_type, with_properties=False, backend=None):
+    """Helper function to parse devices from pactl output - runs pactl only once!"""
+    try:
+        cmd = ['/usr/bin/pactl', 'list', device_type]
+        # Parse line by line from the pipe instead of buffering the whole output
+        return (backend or CommandBackend()).stream(
+            cmd, lambda lines: parse_pactl_output(lines, device_type, with_properties), check=True
+        )
     except Exception as e:
         print(f"Error getting devices: {e}")
-        return []
+        return DeviceSnapshot()
 
 
-def read_input_line(tty_file):
-    """Read a line from tty_file with proper EOF handling.
-    
-    Returns the stripped input string, or None if EOF/empty/whitespace-only input.
+def parse_pactl_streams(stream_type, indexes, backend=None):
     """
+    Properties of the given sink-input/source-output indexes, from one
+    `pactl list sink-inputs|source-outputs` call. Other streams are skipped
+    without parsing their properties.
+    """
+    def consume(lines):
+        streams = {}
+        properties = None
+        for line in lines:
+            line = line.strip()
+            if line.startswith(('Sink Input #', 'Source Output #')):
+                index = int(line.split('#')[1])
+                properties = streams.setdefault(index, {}) if index in indexes else None
+            elif properties is not None and ' = "' in line and line.endswith('"'):
+                key, _, value = line.partition(' = ')
+                properties[key] = value[1:-1]
+        return streams
+
     try:
-        line = tty_file.readline()
-        if line == '':
-            # EOF reached - no more input available
-            return None
-        stripped = line.strip()
-        if stripped == '':
-            # Whitespace-only input treated as empty
-            return None
-        return stripped
-    except (OSError, IOError):
-        return None
+        return (backend or CommandBackend()).stream(['/usr/bin/pactl', 'list', stream_type], consume, check=True)
+    except Exception as e:
+        print(f"Error getting streams: {e}")
+        return {}
 
 
-def configure_interactive():
+def configure_interactive(backend=None):
     """Interactive configuration mode"""
+    backend = backend or CommandBackend()
     # Open /dev/tty for reading input, with fallback to stdin
     tty_file = None
     try:
@@ -496,7 +2622,7 @@ def configure_interactive():
 
     # Check audio system
     try:
-        result = subprocess.run(['/usr/bin/pactl', 'info'], capture_output=True, text=True, check=True)
+        result = backend.run(['/usr/bin/pactl', 'info'], check=True)
         if 'PipeWire' in result.stdout:
             print("Detected audio system: PipeWire")
         else:
@@ -508,111 +2634,46 @@ def configure_interactive():
     print("\nFetching audio devices...\n")
 
     # Get devices using optimized helper function
-    output_devices = parse_pactl_devices('sinks')
-    input_devices = parse_pactl_devices('sources')
+    output_devices = parse_pactl_devices('sinks', backend=backend)
+    input_devices = parse_pactl_devices('sources', backend=backend)
 
     if not output_devices or not input_devices:
         print("Error: Could not retrieve audio devices.")
         return
     
-    # Letters for input devices (matching Windows installer pattern)
-    letters = ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'J', 'K', 'L', 'M', 'N', 'O', 'P']
-    # Calculate the max valid letter for input devices (for error messages)
-    max_input_letter = letters[min(len(input_devices), len(letters)) - 1]
-    
-    # Display devices
-    print("=== OUTPUT DEVICES (Speakers/Headphones) - Use NUMBERS ===")
-    for i, device in enumerate(output_devices):
-        print(f"  [{i}] {device['name']}")
-    
-    print("\n=== INPUT DEVICES (Microphones) - Use LETTERS ===")
-    for i, device in enumerate(input_devices):
-        if i < len(letters):
-            print(f"  [{letters[i]}] {device['name']}")
-    
-    print("\n")
-    print("Enter NUMBER for outputs, LETTER for inputs (or 'q' to quit):")
+    # Built once: paging and filtering reuse the fetched lists and their search index
+    output_picker = DevicePicker(output_devices)
+    input_picker = DevicePicker(input_devices)
+    output_title = "OUTPUT DEVICES (Speakers/Headphones)"
+    input_title = "INPUT DEVICES (Microphones)"
+
+    print("Enter a device NUMBER, type text to filter the list (or 'q' to quit):")
     print()
     
     # Get user selections
     try:
-        # Get speaker output
-        print("1. Profile 1 Output (OUTPUT - enter number): ", end='', flush=True)
-        speaker_input_str = read_input_line(tty_file)
-        if speaker_input_str is None:
-            print("\nError: No input received. Please run this command in an interactive terminal.")
-            return
-        if speaker_input_str.lower() == 'q':
-            print("Configuration cancelled.")
-            return
-        if not speaker_input_str.isdigit():
-            print(f"\nError: '{speaker_input_str}' is not a valid number.")
-            return
-        speaker_idx = int(speaker_input_str)
-        if speaker_idx < 0 or speaker_idx >= len(output_devices):
-            print("Error: Number out of range.")
-            return
-        speaker_device = output_devices[speaker_idx]['id']
-        speaker_name = output_devices[speaker_idx]['name']
-        
-        # Get speaker input
-        print("2. Profile 1 Input (INPUT - enter letter): ", end='', flush=True)
-        speaker_input_letter = read_input_line(tty_file)
-        if speaker_input_letter is None:
-            print("\nError: No input received. Please run this command in an interactive terminal.")
-            return
-        speaker_input_letter = speaker_input_letter.upper()
-        if speaker_input_letter == 'Q':
-            print("Configuration cancelled.")
-            return
-        if speaker_input_letter not in letters:
-            print(f"\nError: '{speaker_input_letter}' is not a valid letter (A-{max_input_letter}).")
-            return
-        speaker_input_idx = letters.index(speaker_input_letter)
-        if speaker_input_idx >= len(input_devices):
-            print("Error: Letter out of range.")
-            return
-        speaker_input = input_devices[speaker_input_idx]['id']
-        speaker_input_name = input_devices[speaker_input_idx]['name']
-        
-        # Get headset output
-        print("3. Profile 2 Output (OUTPUT - enter number): ", end='', flush=True)
-        headset_output_str = read_input_line(tty_file)
-        if headset_output_str is None:
-            print("\nError: No input received. Please run this command in an interactive terminal.")
-            return
-        if headset_output_str.lower() == 'q':
-            print("Configuration cancelled.")
-            return
-        if not headset_output_str.isdigit():
-            print(f"\nError: '{headset_output_str}' is not a valid number.")
-            return
-        headset_output_idx = int(headset_output_str)
-        if headset_output_idx < 0 or headset_output_idx >= len(output_devices):
-            print("Error: Number out of range.")
-            return
-        headset_output = output_devices[headset_output_idx]['id']
-        headset_output_name = output_devices[headset_output_idx]['name']
-        
-        # Get headset input
-        print("4. Profile 2 Input (INPUT - enter letter): ", end='', flush=True)
-        headset_input_letter = read_input_line(tty_file)
-        if headset_input_letter is None:
-            print("\nError: No input received. Please run this command in an interactive terminal.")
+        speaker = output_picker.pick(tty_file, output_title, "1. Profile 1 Output: ")
+        if speaker is None:
             return
-        headset_input_letter = headset_input_letter.upper()
-        if headset_input_letter == 'Q':
-            print("Configuration cancelled.")
+        speaker_device, speaker_name = speaker.id, speaker.name
+        print()
+
+        speaker_mic = input_picker.pick(tty_file, input_title, "2. Profile 1 Input: ")
+        if speaker_mic is None:
             return
-        if headset_input_letter not in letters:
-            print(f"\nError: '{headset_input_letter}' is not a valid letter (A-{max_input_letter}).")
+        speaker_input, speaker_input_name = speaker_mic.id, speaker_mic.name
+        print()
+
+        headset = output_picker.pick(tty_file, output_title, "3. Profile 2 Output: ")
+        if headset is None:
             return
-        headset_input_idx = letters.index(headset_input_letter)
-        if headset_input_idx >= len(input_devices):
-            print("Error: Letter out of range.")
+        headset_output, headset_output_name = headset.id, headset.name
+        print()
+
+        headset_mic = input_picker.pick(tty_file, input_title, "4. Profile 2 Input: ")
+        if headset_mic is None:
             return
-        headset_input = input_devices[headset_input_idx]['id']
-        headset_input_name = input_devices[headset_input_idx]['name']
+        headset_input, headset_input_name = headset_mic.id, headset_mic.name
         
         # Show configuration
         print("\nYour configuration:")
@@ -628,18 +2689,16 @@ def configure_interactive():
         if confirm is None:
             confirm = ''
         if confirm.lower() != 'n':
-            config_file = Path.home() / ".config" / "audio_toggle" / "config.json"
-            config_file.parent.mkdir(parents=True, exist_ok=True)
-            
             config = {
                 'speaker_device': speaker_device,
                 'headset_output': headset_output,
                 'speaker_input': speaker_input,
                 'headset_input': headset_input
             }
-            
-            with open(config_file, 'w') as f:
-                json.dump(config, f, indent=2)
+            sample_specs = sample_specs_for(output_devices, (speaker_device, headset_output))
+            if sample_specs:
+                config['sample_specs'] = sample_specs
+            update_config_file(USER_CONFIG_FILE, config)
             
             print("\n✓ Configuration saved!")
             print("\nThe Audio Toggle app will now use these devices.")
@@ -657,9 +2716,181 @@ def configure_interactive():
             tty_file.close()
 
 
+# Non-interactive selector names, the config key each fills, and its device type
+SELECTOR_KEYS = (
+    ('profile1_output', 'speaker_device', 'sinks'),
+    ('profile1_input', 'speaker_input', 'sources'),
+    ('profile2_output', 'headset_output', 'sinks'),
+    ('profile2_input', 'headset_input', 'sources'),
+)
+
+
+def configure_non_interactive(selectors=None, batch_file=None, backend=None):
+    """
+    Scripted configuration mode for provisioning.
+
+    selectors maps the SELECTOR_KEYS names to match_device selectors. A batch
+    file is a JSON list of such mappings, each optionally naming its own
+    "config_file". Every selector is resolved against one enumeration pass
+    and validated before any config file is written.
+    Returns True on success.
+    """
+    jobs = []
+    if selectors:
+        jobs.append(dict(selectors))
+    if batch_file:
+        try:
+            with open(batch_file, 'r') as f:
+                batch = json.load(f)
+        except Exception as e:
+            print(f"Error: Failed to read batch file {batch_file}: {e}")
+            return False
+        if not isinstance(batch, list) or not all(isinstance(job, dict) for job in batch):
+            print("Error: Batch file must contain a JSON list of objects.")
+            return False
+        jobs.extend(batch)
+    if not jobs:
+        print("Error: No selectors given. Use --profile1-output etc. or --batch FILE.")
+        return False
+
+    devices = {
+        'sinks': parse_pactl_devices('sinks', with_properties=True, backend=backend),
+        'sources': parse_pactl_devices('sources', with_properties=True, backend=backend),
+    }
+    if not devices['sinks'] or not devices['sources']:
+        print("Error: Could not retrieve audio devices.")
+        return False
+
+    resolved = []
+    errors = []
+    for n, job in enumerate(jobs, 1):
+        config = {}
+        for selector_name, config_key, device_type in SELECTOR_KEYS:
+            selector = job.get(selector_name)
+            if not selector:
+                errors.append(f"[{n}] missing {selector_name}")
+                continue
+            if not isinstance(selector, str):
+                errors.append(f"[{n}] {selector_name}: selector must be a string, got {json.dumps(selector)}")
+                continue
+            try:
+                device = match_device(devices[device_type], selector)
+            except ValueError as e:
+                errors.append(f"[{n}] {selector_name}: invalid selector {e}")
+                continue
+            if device is None:
+                errors.append(f"[{n}] {selector_name}: no device matches '{selector}'")
+                continue
+            config[config_key] = device.id
+        config_file = job.get('config_file') or USER_CONFIG_FILE
+        if not isinstance(config_file, (str, Path)):
+            errors.append(f"[{n}] config_file must be a path string, got {json.dumps(config_file)}")
+            continue
+        resolved.append((Path(config_file), config))
+
+    if errors:
+        print("Error: Configuration not saved:")
+        for error in errors:
+            print(f"  {error}")
+        return False
+
+    for config_file, config in resolved:
+        update = {key: config[key] for key in CONFIG_KEYS}
+        sample_specs = sample_specs_for(devices['sinks'], (config['speaker_device'], config['headset_output']))
+        if sample_specs:
+            update['sample_specs'] = sample_specs
+        update_config_file(config_file, update)
+        print(f"✓ Configuration saved to {config_file}")
+        print(f"  Profile 1: {config['speaker_device']} / {config['speaker_input']}")
+        print(f"  Profile 2: {config['headset_output']} / {config['headset_input']}")
+    return True
+
+
+def parse_args(argv=None):
+    """Parse command-line arguments"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Audio Toggle for Linux - system tray audio device switcher")
+    parser.add_argument('--configure', action='store_true',
+                        help="configure audio devices (interactive unless --non-interactive)")
+    parser.add_argument('--non-interactive', action='store_true',
+                        help="with --configure: resolve device selectors instead of prompting")
+    for selector_name, _, device_type in SELECTOR_KEYS:
+        parser.add_argument('--' + selector_name.replace('_', '-'), dest=selector_name, metavar='SELECTOR',
+                            help=f"{device_type[:-1]} selector: exact ID, regex, desc:REGEX or prop:KEY=REGEX")
+    parser.add_argument('--batch', metavar='FILE',
+                        help="with --non-interactive: JSON list of selector sets to apply")
+    parser.add_argument('--profile-out', metavar='PATH',
+                        help="profile toggles and backend calls from startup; written on SIGUSR1 or quit")
+    parser.add_argument('--toggle', action='store_true',
+                        help="toggle once without the tray (via the multi-server daemon if --control-socket is set)")
+    parser.add_argument('--status', action='store_true',
+                        help="print the current defaults and active profile (from the running tray if any)")
+    parser.add_argument('--list', action='store_true',
+                        help="print devices, defaults and active profile (from the running tray if any)")
+    parser.add_argument('--json', action='store_true',
+                        help="with --status/--list: print JSON")
+    parser.add_argument('--watch', action='store_true',
+                        help="print a JSON line whenever the active profile or default devices change "
+                             "(from the running tray if any)")
+    parser.add_argument('--hotkey', metavar='ACCEL',
+                        help="global toggle shortcut in GTK syntax, e.g. '<Ctrl><Alt>a' (overrides config 'hotkey')")
+    parser.add_argument('--multi-server', metavar='CONFIG',
+                        help="run headless, serving every audio server listed in CONFIG")
+    parser.add_argument('--server', default=os.environ.get('PULSE_SERVER'),
+                        help="with --toggle: server address to route to (default: $PULSE_SERVER)")
+    parser.add_argument('--control-socket', default=os.environ.get('AUDIO_TOGGLE_CONTROL_SOCKET'),
+                        help="with --toggle: multi-server daemon socket (default: $AUDIO_TOGGLE_CONTROL_SOCKET)")
+    parser.add_argument('--record-trace', metavar='PATH',
+                        help="append every backend call (argv, stdout, exit code, wall time) to a JSON-lines trace")
+    parser.add_argument('--replay-trace', metavar='PATH',
+                        help="serve backend calls from a recorded trace instead of pactl/notify-send")
+    parser.add_argument('--replay-speed', metavar='FACTOR', type=float, default=1.0,
+                        help="replay speed-up factor; 0 replays without delays (default: 1, recorded timing)")
+    parser.add_argument('--mem-report', action='store_true',
+                        help="trace allocations; print a per-category report on SIGUSR2 and on quit")
+    parser.add_argument('--startup-timing', action='store_true',
+                        help="print when each startup stage finished, including time to tray")
+    parser.add_argument('--idle-check', metavar='SECONDS', type=int,
+                        help="run the tray idle for SECONDS, report CPU time and wakeups, then quit "
+                             "(exit status 1 if over budget)")
+    return parser.parse_args(argv)
+
+
 if __name__ == '__main__':
-    if len(sys.argv) > 1 and sys.argv[1] == '--configure':
-        configure_interactive()
+    args = parse_args()
+    backend = build_backend(args.record_trace, args.replay_trace, args.replay_speed)
+    if args.configure and args.non_interactive:
+        selectors = {name: getattr(args, name) for name, _, _ in SELECTOR_KEYS if getattr(args, name)}
+        sys.exit(0 if configure_non_interactive(selectors, args.batch, backend=backend) else 1)
+    elif args.configure:
+        configure_interactive(backend=backend)
+    elif args.multi_server:
+        MultiServerDaemon(args.multi_server).serve_forever()
+    elif args.toggle and args.control_socket:
+        try:
+            reply = send_control_request(args.control_socket, {'command': 'toggle', 'server': args.server})
+        except (OSError, ValueError) as e:
+            reply = {'ok': False, 'error': f"no reply from {args.control_socket}: {e}"}
+        if not reply.get('ok'):
+            print(f"Toggle failed: {reply.get('error', 'see daemon log')}")
+        sys.exit(0 if reply.get('ok') else 1)
+    elif args.toggle:
+        sys.exit(0 if AudioSession(backend=backend).toggle_audio(None) else 1)
+    elif args.watch:
+        StatusWatch(backend).run()
+    elif args.list or args.status:
+        command = 'list' if args.list else 'status'
+        # A running tray answers from memory; otherwise query the server once
+        reply = query_tray(command) if backend.live else None
+        if reply is None:
+            reply = AudioSession(backend=backend).query_state(command)
+            reply['answered_by'] = 'direct'
+        else:
+            reply['answered_by'] = 'tray'
+        print_query_reply(command, reply, args.json)
     else:
-        app = AudioToggle()
-        app.run()
+        import_gtk()
+        app = AudioToggle(profile_out=args.profile_out, mem_report=args.mem_report, backend=backend,
+                          hotkey=args.hotkey, idle_check=args.idle_check, startup_timing=args.startup_timing)
+        sys.exit(0 if app.run() else 1)
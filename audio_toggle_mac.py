@@ -10,22 +10,26 @@ AUDIO_TOGGLE_ID = "AudioToggle-pechavarriaa-CrossPlatformAudioToggle-v1.0"
 import subprocess
 import json
 import os
+import shutil
 import sys
 import fcntl
 import atexit
 from pathlib import Path
 
+from audio_toggle_core import (ProfileTable, ToggleSession, read_config_file, update_config_file,
+                               read_input_line, DevicePicker, Device, DeviceSnapshot)
+
+# The menu bar UI needs rumps and AppKit; the toggle logic (AudioSession)
+# does not, so it can be imported and tested without them
 try:
     import rumps
 except ImportError:
-    print("Error: rumps library not found. Install with: pip3 install rumps")
-    sys.exit(1)
+    rumps = None
 
 try:
     from AppKit import NSApplication, NSApplicationActivationPolicyAccessory
 except ImportError:
-    print("Error: AppKit not found. Install with: pip3 install pyobjc-framework-Cocoa")
-    sys.exit(1)
+    NSApplication = None
 
 try:
     import UserNotifications
@@ -33,18 +37,195 @@ try:
 except ImportError:
     _UN_AVAILABLE = False
 
+# Per-user config file
+USER_CONFIG_FILE = Path.home() / ".config" / "audio_toggle" / "config.json"
+
+# Where Homebrew installs switchaudio-osx (Apple Silicon, then Intel)
+SWITCH_AUDIO_SOURCE_PATHS = ('/opt/homebrew/bin/SwitchAudioSource', '/usr/local/bin/SwitchAudioSource')
+
+
+def find_switch_audio_source(configured=None):
+    """
+    Locate SwitchAudioSource: $AUDIO_TOGGLE_SWITCHAUDIOSOURCE, then the
+    config's "switchaudiosource_path", then the Homebrew paths, then $PATH.
+    """
+    for candidate in (os.environ.get('AUDIO_TOGGLE_SWITCHAUDIOSOURCE'), configured):
+        if candidate:
+            return candidate
+    for candidate in SWITCH_AUDIO_SOURCE_PATHS:
+        if os.path.exists(candidate):
+            return candidate
+    return shutil.which('SwitchAudioSource') or SWITCH_AUDIO_SOURCE_PATHS[0]
+
+
+def device_from_json(line):
+    """A Device from one SwitchAudioSource JSON line (name, type, id, uid); the UID is its ID"""
+    entry = json.loads(line)
+    index = entry.get('id')
+    return Device(entry['uid'], entry.get('name'), int(index) if str(index).isdigit() else None)
+
+
+def parse_switch_audio_source_devices(output):
+    """A DeviceSnapshot from `SwitchAudioSource -a -f json` output"""
+    return DeviceSnapshot(device_from_json(line) for line in output.splitlines() if line.strip())
+
+
+def _menu_callback(title):
+    """rumps.clicked when rumps is available, a no-op decorator otherwise"""
+    if rumps is None:
+        return lambda func: func
+    return rumps.clicked(title)
+
+
+class AudioSession(ToggleSession):
+    """
+    Toggle logic and SwitchAudioSource access, independent of rumps/AppKit.
+
+    Devices are Device records built from SwitchAudioSource's JSON output
+    and keyed by UID, which stays stable when devices are renamed.
+    The device list is cached between toggles and only re-read when a
+    configured device is not in it.
+    """
+
+    def __init__(self, config_file=USER_CONFIG_FILE, switch_audio_source=None):
+        self.config_file = Path(config_file)
+        self._device_cache = {}
+        self.load_config()
+        self.switch_audio_source = switch_audio_source or find_switch_audio_source(self.switch_audio_source_path)
+
+    def load_config(self):
+        """Load device configuration from file; returns it as a ProfileTable"""
+        try:
+            config = read_config_file(self.config_file)
+        except ValueError as e:
+            self.show_notification("Error", f"Failed to load config: {e}")
+            config = {}
+        self.speaker_device = config.get('speaker_device', '')
+        self.headset_output = config.get('headset_output', '')
+        self.speaker_input = config.get('speaker_input', '')
+        self.headset_input = config.get('headset_input', '')
+        self.switch_audio_source_path = config.get('switchaudiosource_path')
+        return ProfileTable(self.speaker_device, self.headset_output, self.speaker_input, self.headset_input)
+
+    def save_config(self):
+        """Save device configuration to file"""
+        config = {
+            'speaker_device': self.speaker_device,
+            'headset_output': self.headset_output,
+            'speaker_input': self.speaker_input,
+            'headset_input': self.headset_input
+        }
+        if self.switch_audio_source_path:
+            config['switchaudiosource_path'] = self.switch_audio_source_path
+        update_config_file(self.config_file, config)
+
+    def run_switch_audio_source(self, *args):
+        """Run SwitchAudioSource and return its stdout"""
+        cmd = [self.switch_audio_source] + list(args)
+        return subprocess.run(cmd, capture_output=True, text=True, check=True).stdout
+
+    def get_audio_devices(self, device_type='output', refresh=False):
+        """Get list of audio devices (cached until refresh is requested)"""
+        if refresh or device_type not in self._device_cache:
+            try:
+                output = self.run_switch_audio_source('-a', '-t', device_type, '-f', 'json')
+                self._device_cache[device_type] = parse_switch_audio_source_devices(output)
+            except (subprocess.CalledProcessError, FileNotFoundError):
+                self.show_notification("Error", f"{self.switch_audio_source} not found. Please install it.")
+                return DeviceSnapshot()
+            except Exception as e:
+                self.show_notification("Error", f"Failed to get devices: {e}")
+                return DeviceSnapshot()
+        return self._device_cache[device_type]
+
+    def find_device(self, value, device_type='output'):
+        """
+        Look up a configured device by UID, or by name for configs written
+        before UIDs were stored. Re-reads the device list once on a miss.
+        """
+        if not value:
+            return None
+        for refresh in (False, True):
+            devices = self.get_audio_devices(device_type, refresh=refresh)
+            device = devices.get(value)
+            if device:
+                return device
+            for device in devices:
+                if device.name == value:
+                    return device
+        return None
+
+    def get_current_device(self, device_type='output'):
+        """Get current default audio device as a Device"""
+        try:
+            return device_from_json(self.run_switch_audio_source('-c', '-t', device_type, '-f', 'json'))
+        except Exception as e:
+            print(f"Error getting current device: {e}")
+            return None
+
+    def set_audio_device(self, device, device_type='output'):
+        """Set default audio device by UID"""
+        try:
+            self.run_switch_audio_source('-t', device_type, '-u', device.id)
+            return True
+        except Exception as e:
+            # The device may have gone away; re-read the list next time
+            self._device_cache.clear()
+            self.show_notification("Error", f"Failed to set device: {e}")
+            return False
+
+    def toggle_audio(self, _):
+        """Toggle between audio configurations; returns the profile switched to, or None"""
+        # Reload configuration to get latest settings
+        return self.toggle_profile(self.load_config())
+
+    def current_output(self):
+        current = self.get_current_device('output')
+        return current.id if current else None
+
+    def resolve_toggle_devices(self, table):
+        # Resolve configured UIDs (or legacy names) to devices; a missing
+        # device is unavailable to the plan
+        values = []
+        port_states = {}
+        for value, device_type in zip(table, ('output', 'output', 'input', 'input')):
+            device = self.find_device(value, device_type)
+            if device:
+                values.append(device.id)
+            else:
+                port_states[value] = False
+                values.append(value)
+        return ProfileTable(*values), port_states
+
+    def switch_device(self, device_id, role, port):
+        device = self.find_device(device_id, role)
+        if not device or not self.set_audio_device(device, role):
+            return False
+        if role == 'output':
+            # Set system audio device (for communication apps like MS Teams)
+            if not self.set_audio_device(device, 'system'):
+                print("[Toggle] Warning: Failed to set system device, continuing anyway")
+        return True
 
-class AudioToggle(rumps.App):
+    def device_display_name(self, device_id, role):
+        device = self.find_device(device_id, role)
+        return device.name if device else device_id
+
+    def show_notification(self, title, message):
+        """Print notifications when there is no menu bar app"""
+        print(f"{title}: {message}")
+
+
+class AudioToggle(AudioSession, rumps.App if rumps else object):
     def __init__(self):
         # Use template icon for better visibility in dark themes
         # Template icons adapt to light/dark themes automatically
         icon_path = Path(__file__).parent / "icons" / "speaker_template.png"
         if icon_path.exists():
-            super(AudioToggle, self).__init__("AudioToggle", icon=str(icon_path), template=True, quit_button=None)
+            rumps.App.__init__(self, "AudioToggle", icon=str(icon_path), template=True, quit_button=None)
         else:
             # Fallback to emoji if icon file not found
-            super(AudioToggle, self).__init__("AudioToggle", title="🔊", quit_button=None)
-        self.config_file = Path.home() / ".config" / "audio_toggle" / "config.json"
+            rumps.App.__init__(self, "AudioToggle", title="🔊", quit_button=None)
         self.lockfile_path = Path.home() / ".config" / "audio_toggle" / ".audio_toggle.lock"
         self.lockfile = None
 
@@ -65,7 +246,7 @@ class AudioToggle(rumps.App):
             print("Audio Toggle is already running.")
             sys.exit(0)
 
-        self.load_config()
+        AudioSession.__init__(self, USER_CONFIG_FILE)
         self.menu = [
             rumps.MenuItem("Toggle Audio", callback=self.toggle_audio),
             rumps.separator,
@@ -103,175 +284,10 @@ class AudioToggle(rumps.App):
         except Exception:
             pass  # Ignore errors during cleanup
 
-    def load_config(self):
-        """Load device configuration from file"""
-        if self.config_file.exists():
-            try:
-                with open(self.config_file, 'r') as f:
-                    config = json.load(f)
-                    self.speaker_device = config.get('speaker_device', '')
-                    self.headset_output = config.get('headset_output', '')
-                    self.speaker_input = config.get('speaker_input', '')
-                    self.headset_input = config.get('headset_input', '')
-            except Exception as e:
-                self.show_notification("Error", f"Failed to load config: {e}")
-                self.speaker_device = ''
-                self.headset_output = ''
-                self.speaker_input = ''
-                self.headset_input = ''
-        else:
-            self.speaker_device = ''
-            self.headset_output = ''
-            self.speaker_input = ''
-            self.headset_input = ''
-
-    def get_short_device_name(self, device_name):
-        """
-        Simplify device names for display - matches Windows implementation
-        Extracts brand/model from parentheses and cleans up special characters
-        """
-        import re
-
-        # Extract content from parentheses if present
-        match = re.search(r'\(([^)]+)\)', device_name)
-        if match:
-            name = match.group(1)
-        else:
-            name = device_name
-
-        # Remove any remaining parentheses and their content (including partial ones)
-        name = re.sub(r'\([^)]*\)', '', name)   # Complete pairs like (R)
-        name = re.sub(r'\([^)]*$', '', name)    # Partial opening like (R
-        name = re.sub(r'\(', '', name)          # Any remaining (
-        name = re.sub(r'\)', '', name)          # Any remaining )
-        name = re.sub(r'\s+', ' ', name)        # Collapse multiple spaces
-        name = name.strip()
-
-        # Truncate if too long
-        if len(name) > 30:
-            name = name[:27] + "..."
-
-        return name
-
-    def save_config(self):
-        """Save device configuration to file"""
-        self.config_file.parent.mkdir(parents=True, exist_ok=True)
-        config = {
-            'speaker_device': self.speaker_device,
-            'headset_output': self.headset_output,
-            'speaker_input': self.speaker_input,
-            'headset_input': self.headset_input
-        }
-        with open(self.config_file, 'w') as f:
-            json.dump(config, f, indent=2)
-    
-    def get_audio_devices(self, device_type='output'):
-        """Get list of audio devices using /opt/homebrew/bin/SwitchAudioSource"""
-        try:
-            cmd = ['/opt/homebrew/bin/SwitchAudioSource', '-a', '-t', device_type]
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-            devices = [line.strip() for line in result.stdout.split('\n') if line.strip()]
-            return devices
-        except subprocess.CalledProcessError:
-            self.show_notification("Error", "/opt/homebrew/bin/SwitchAudioSource not found. Please install it.")
-            return []
-        except Exception as e:
-            self.show_notification("Error", f"Failed to get devices: {e}")
-            return []
-    
-    def get_current_device(self, device_type='output'):
-        """Get current default audio device"""
-        try:
-            cmd = ['/opt/homebrew/bin/SwitchAudioSource', '-c', '-t', device_type]
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-            return result.stdout.strip()
-        except Exception as e:
-            print(f"Error getting current device: {e}")
-            return None
-    
-    def set_audio_device(self, device_name, device_type='output'):
-        """Set default audio device"""
-        try:
-            cmd = ['/opt/homebrew/bin/SwitchAudioSource', '-s', device_name, '-t', device_type]
-            subprocess.run(cmd, check=True, capture_output=True)
-            return True
-        except Exception as e:
-            self.show_notification("Error", f"Failed to set device: {e}")
-            return False
-    
-    @rumps.clicked("Toggle Audio")
+    @_menu_callback("Toggle Audio")
     def toggle_audio(self, _):
         """Toggle between audio configurations"""
-        # Reload configuration to get latest settings
-        self.load_config()
-        
-        if not all([self.speaker_device, self.headset_output, self.speaker_input, self.headset_input]):
-            self.show_notification("Configuration Required", "Please use 'Configure Devices...' from the menu to set up your audio devices.")
-            return
-        
-        # Get current device
-        current_output = self.get_current_device('output')
-        
-        # Debug logging
-        print(f"[Toggle] Current output: '{current_output}'")
-        print(f"[Toggle] Profile 1 Output: '{self.speaker_device}'")
-        print(f"[Toggle] Profile 2 Output: '{self.headset_output}'")
-        
-        # Determine target devices based on current state
-        if current_output == self.headset_output:
-            # Currently on headset (Profile 2), switch to speakers (Profile 1)
-            target_output = self.speaker_device
-            target_input = self.speaker_input
-            profile_name = "Profile 1"
-        elif current_output == self.speaker_device:
-            # Currently on speakers (Profile 1), switch to headset (Profile 2)
-            target_output = self.headset_output
-            target_input = self.headset_input
-            profile_name = "Profile 2"
-        else:
-            # Current device doesn't match either configured device
-            # Default to switching to speakers
-            print(f"[Toggle] Warning: Current device doesn't match configured devices")
-            print(f"[Toggle] Defaulting to Speakers profile")
-            target_output = self.speaker_device
-            target_input = self.speaker_input
-            profile_name = "Speakers"
-        
-        print(f"[Toggle] Switching to {profile_name}: output='{target_output}', input='{target_input}'")
-        
-        # Attempt to switch output device
-        output_success = self.set_audio_device(target_output, 'output')
-        if not output_success:
-            self.show_notification("Audio Toggle", f"Failed to switch output to {target_output}")
-            return
-        
-        # Set system audio device (for communication apps like MS Teams)
-        system_success = self.set_audio_device(target_output, 'system')
-        if not system_success:
-            print(f"[Toggle] Warning: Failed to set system device, continuing anyway")
-
-        # Attempt to switch input device
-        input_success = self.set_audio_device(target_input, 'input')
-        if not input_success:
-            self.show_notification("Audio Toggle", f"Output switched but input failed")
-            return
-
-        # Both switches succeeded
-        # Shorten device names for display
-        out_short = self.get_short_device_name(target_output)
-        in_short = self.get_short_device_name(target_input)
-
-        # Determine full profile label
-        if profile_name == "Profile 1":
-            profile_label = "Profile 1 (Desktop)"
-        elif profile_name == "Profile 2":
-            profile_label = "Profile 2 (Headset)"
-        else:
-            profile_label = profile_name  # Fallback for edge cases
-
-        # Format notification to match Windows
-        message = f"{profile_label}\n🔊 {out_short}\n🎤 {in_short}"
-        self.show_notification("Audio Toggle", message)
+        return AudioSession.toggle_audio(self, _)
     
     def show_notification(self, title, message):
         """Show macOS notification using UNUserNotificationCenter (macOS 10.14+)."""
@@ -290,7 +306,7 @@ class AudioToggle(rumps.App):
         # Fallback: print to console
         print(f"{title}: {message}")
     
-    @rumps.clicked("Configure Devices...")
+    @_menu_callback("Configure Devices...")
     def configure_devices(self, _):
         """Open configuration in terminal"""
         script_path = Path(__file__).resolve()
@@ -308,32 +324,13 @@ class AudioToggle(rumps.App):
         '''
         subprocess.run(['osascript', '-e', applescript])
     
-    @rumps.clicked("Quit")
+    @_menu_callback("Quit")
     def quit_app(self, _):
         """Quit the application"""
         self._release_lock()
         rumps.quit_application()
 
 
-def read_input_line(tty_file):
-    """Read a line from tty_file with proper EOF handling.
-    
-    Returns the stripped input string, or None if EOF/empty/whitespace-only input.
-    """
-    try:
-        line = tty_file.readline()
-        if line == '':
-            # EOF reached - no more input available
-            return None
-        stripped = line.strip()
-        if stripped == '':
-            # Whitespace-only input treated as empty
-            return None
-        return stripped
-    except (OSError, IOError):
-        return None
-
-
 def configure_interactive():
     """Interactive configuration mode"""
     # Open /dev/tty for reading input, with fallback to stdin
@@ -352,130 +349,65 @@ def configure_interactive():
     
     print("\n=== Configure Audio Toggle for macOS ===\n")
     
-    # Check if /opt/homebrew/bin/SwitchAudioSource is available
+    session = AudioSession(USER_CONFIG_FILE)
+
+    # Check if SwitchAudioSource is available
     try:
-        subprocess.run(['/opt/homebrew/bin/SwitchAudioSource', '-h'], capture_output=True, check=True)
+        session.run_switch_audio_source('-h')
     except (subprocess.CalledProcessError, FileNotFoundError):
-        print("Error: /opt/homebrew/bin/SwitchAudioSource not found.")
+        print(f"Error: {session.switch_audio_source} not found.")
         print("Install with: brew install switchaudio-osx")
+        print("Or point AUDIO_TOGGLE_SWITCHAUDIOSOURCE at an existing binary.")
         return
     
     # Get devices
     print("Fetching audio devices...\n")
-    output_devices = []
-    input_devices = []
-    
     try:
-        result = subprocess.run(['/opt/homebrew/bin/SwitchAudioSource', '-a', '-t', 'output'], 
-                              capture_output=True, text=True, check=True)
-        output_devices = [line.strip() for line in result.stdout.split('\n') if line.strip()]
+        output = session.run_switch_audio_source('-a', '-t', 'output', '-f', 'json')
+        output_devices = parse_switch_audio_source_devices(output)
         
-        result = subprocess.run(['/opt/homebrew/bin/SwitchAudioSource', '-a', '-t', 'input'], 
-                              capture_output=True, text=True, check=True)
-        input_devices = [line.strip() for line in result.stdout.split('\n') if line.strip()]
+        output = session.run_switch_audio_source('-a', '-t', 'input', '-f', 'json')
+        input_devices = parse_switch_audio_source_devices(output)
     except Exception as e:
         print(f"Error getting devices: {e}")
         return
     
-    # Letters for input devices (matching Windows installer pattern)
-    letters = ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'J', 'K', 'L', 'M', 'N', 'O', 'P']
-    
-    # Display output devices
-    print("=== OUTPUT DEVICES (Speakers/Headphones) - Use NUMBERS ===")
-    for i, device in enumerate(output_devices):
-        print(f"  [{i}] {device}")
-    
-    print("\n=== INPUT DEVICES (Microphones) - Use LETTERS ===")
-    for i, device in enumerate(input_devices):
-        if i < len(letters):
-            print(f"  [{letters[i]}] {device}")
-    
-    print("\n")
-    print("Enter NUMBER for outputs, LETTER for inputs (or 'q' to quit):")
+    # Built once: paging and filtering reuse the fetched lists and their search index
+    output_picker = DevicePicker(output_devices)
+    input_picker = DevicePicker(input_devices)
+    output_title = "OUTPUT DEVICES (Speakers/Headphones)"
+    input_title = "INPUT DEVICES (Microphones)"
+
+    print("Enter a device NUMBER, type text to filter the list (or 'q' to quit):")
     print()
     
     # Get user selections
     try:
-        # Get speaker output
-        print("1. Profile 1 Output (OUTPUT - enter number): ", end='', flush=True)
-        speaker_input_str = read_input_line(tty_file)
-        if speaker_input_str is None:
-            print("\nError: No input received. Please run this command in an interactive terminal.")
-            return
-        if speaker_input_str.lower() == 'q':
-            print("Configuration cancelled.")
-            return
-        if not speaker_input_str.isdigit():
-            print(f"\nError: '{speaker_input_str}' is not a valid number.")
+        speaker_device = output_picker.pick(tty_file, output_title, "1. Profile 1 Output: ")
+        if speaker_device is None:
             return
-        speaker_idx = int(speaker_input_str)
-        if speaker_idx < 0 or speaker_idx >= len(output_devices):
-            print("Error: Number out of range.")
-            return
-        speaker_device = output_devices[speaker_idx]
-        
-        # Get speaker input
-        print("2. Profile 1 Input (INPUT - enter letter): ", end='', flush=True)
-        speaker_input_letter = read_input_line(tty_file)
-        if speaker_input_letter is None:
-            print("\nError: No input received. Please run this command in an interactive terminal.")
-            return
-        speaker_input_letter = speaker_input_letter.upper()
-        if speaker_input_letter == 'Q':
-            print("Configuration cancelled.")
-            return
-        if speaker_input_letter not in letters:
-            print(f"\nError: '{speaker_input_letter}' is not a valid letter.")
-            return
-        speaker_input_idx = letters.index(speaker_input_letter)
-        if speaker_input_idx >= len(input_devices):
-            print("Error: Letter out of range.")
-            return
-        speaker_input = input_devices[speaker_input_idx]
-        
-        # Get headset output
-        print("3. Profile 2 Output (OUTPUT - enter number): ", end='', flush=True)
-        headset_output_str = read_input_line(tty_file)
-        if headset_output_str is None:
-            print("\nError: No input received. Please run this command in an interactive terminal.")
-            return
-        if headset_output_str.lower() == 'q':
-            print("Configuration cancelled.")
-            return
-        if not headset_output_str.isdigit():
-            print(f"\nError: '{headset_output_str}' is not a valid number.")
-            return
-        headset_output_idx = int(headset_output_str)
-        if headset_output_idx < 0 or headset_output_idx >= len(output_devices):
-            print("Error: Number out of range.")
-            return
-        headset_output = output_devices[headset_output_idx]
-        
-        # Get headset input
-        print("4. Profile 2 Input (INPUT - enter letter): ", end='', flush=True)
-        headset_input_letter = read_input_line(tty_file)
-        if headset_input_letter is None:
-            print("\nError: No input received. Please run this command in an interactive terminal.")
-            return
-        headset_input_letter = headset_input_letter.upper()
-        if headset_input_letter == 'Q':
-            print("Configuration cancelled.")
+        print()
+
+        speaker_input = input_picker.pick(tty_file, input_title, "2. Profile 1 Input: ")
+        if speaker_input is None:
             return
-        if headset_input_letter not in letters:
-            print(f"\nError: '{headset_input_letter}' is not a valid letter.")
+        print()
+
+        headset_output = output_picker.pick(tty_file, output_title, "3. Profile 2 Output: ")
+        if headset_output is None:
             return
-        headset_input_idx = letters.index(headset_input_letter)
-        if headset_input_idx >= len(input_devices):
-            print("Error: Letter out of range.")
+        print()
+
+        headset_input = input_picker.pick(tty_file, input_title, "4. Profile 2 Input: ")
+        if headset_input is None:
             return
-        headset_input = input_devices[headset_input_idx]
         
         # Show configuration
         print("\nYour configuration:")
-        print(f"  1. Profile 1 Output: {speaker_device}")
-        print(f"  2. Profile 1 Input: {speaker_input}")
-        print(f"  3. Profile 2 Output: {headset_output}")
-        print(f"  4. Profile 2 Input: {headset_input}")
+        print(f"  1. Profile 1 Output: {speaker_device.name}")
+        print(f"  2. Profile 1 Input: {speaker_input.name}")
+        print(f"  3. Profile 2 Output: {headset_output.name}")
+        print(f"  4. Profile 2 Input: {headset_input.name}")
         
         print("\nSave this configuration? (Y/n): ", end='', flush=True)
         confirm = read_input_line(tty_file)
@@ -483,18 +415,12 @@ def configure_interactive():
             print("\nError: No input received. Configuration cancelled.")
             return
         if confirm.lower() != 'n':
-            config_file = Path.home() / ".config" / "audio_toggle" / "config.json"
-            config_file.parent.mkdir(parents=True, exist_ok=True)
-            
-            config = {
-                'speaker_device': speaker_device,
-                'headset_output': headset_output,
-                'speaker_input': speaker_input,
-                'headset_input': headset_input
-            }
-            
-            with open(config_file, 'w') as f:
-                json.dump(config, f, indent=2)
+            # Store UIDs: they survive renames and duplicate device names
+            session.speaker_device = speaker_device.id
+            session.speaker_input = speaker_input.id
+            session.headset_output = headset_output.id
+            session.headset_input = headset_input.id
+            session.save_config()
             
             print("\n✓ Configuration saved!")
             print("\nThe Audio Toggle app will now use these devices.")
@@ -511,6 +437,13 @@ if __name__ == '__main__':
     if len(sys.argv) > 1 and sys.argv[1] == '--configure':
         configure_interactive()
     else:
+        if rumps is None:
+            print("Error: rumps library not found. Install with: pip3 install rumps")
+            sys.exit(1)
+        if NSApplication is None:
+            print("Error: AppKit not found. Install with: pip3 install pyobjc-framework-Cocoa")
+            sys.exit(1)
+
         # Set activation policy to prevent Python from showing in Dock
         # This must be done before creating the rumps App instance
         app_instance = NSApplication.sharedApplication()
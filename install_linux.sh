@@ -9,6 +9,7 @@ set -e
 INSTALL_DIR="$HOME/.local/share/audio_toggle"
 CONFIG_DIR="$HOME/.config/audio_toggle"
 SCRIPT_NAME="audio_toggle_linux.py"
+CORE_NAME="audio_toggle_core.py"
 DESKTOP_FILE="audio-toggle.desktop"
 AUTOSTART_DIR="$HOME/.config/autostart"
 
@@ -150,12 +151,14 @@ mkdir -p "$CONFIG_DIR"
 mkdir -p "$AUTOSTART_DIR"
 
 # Download or copy the script
-if [ -f "$SCRIPT_NAME" ]; then
+if [ -f "$SCRIPT_NAME" ] && [ -f "$CORE_NAME" ]; then
     echo -e "${CYAN}Installing from local file...${NC}"
     cp "$SCRIPT_NAME" "$INSTALL_DIR/$SCRIPT_NAME"
+    cp "$CORE_NAME" "$INSTALL_DIR/$CORE_NAME"
 else
     echo -e "${CYAN}Downloading Audio Toggle script...${NC}"
     curl -fsSL "https://raw.githubusercontent.com/pechavarriaa/CrossPlatformAudioToggle/main/$SCRIPT_NAME" -o "$INSTALL_DIR/$SCRIPT_NAME"
+    curl -fsSL "https://raw.githubusercontent.com/pechavarriaa/CrossPlatformAudioToggle/main/$CORE_NAME" -o "$INSTALL_DIR/$CORE_NAME"
 fi
 
 # Make script executable
@@ -9,6 +9,7 @@ set -e
 INSTALL_DIR="$HOME/.local/share/audio_toggle"
 CONFIG_DIR="$HOME/.config/audio_toggle"
 SCRIPT_NAME="audio_toggle_mac.py"
+CORE_NAME="audio_toggle_core.py"
 PLIST_NAME="com.pechavarriaa.audiotoggle.plist"
 LAUNCH_AGENTS_DIR="$HOME/Library/LaunchAgents"
 
@@ -64,9 +65,10 @@ mkdir -p "$INSTALL_DIR"
 mkdir -p "$CONFIG_DIR"
 
 # Download or copy the script
-if [ -f "$SCRIPT_NAME" ]; then
+if [ -f "$SCRIPT_NAME" ] && [ -f "$CORE_NAME" ]; then
     echo -e "${CYAN}Installing from local file...${NC}"
     cp "$SCRIPT_NAME" "$INSTALL_DIR/$SCRIPT_NAME"
+    cp "$CORE_NAME" "$INSTALL_DIR/$CORE_NAME"
     # Copy icons directory if it exists
     if [ -d "icons" ]; then
         mkdir -p "$INSTALL_DIR/icons"
@@ -75,6 +77,7 @@ if [ -f "$SCRIPT_NAME" ]; then
 else
     echo -e "${CYAN}Downloading Audio Toggle script...${NC}"
     curl -fsSL "https://raw.githubusercontent.com/pechavarriaa/CrossPlatformAudioToggle/main/$SCRIPT_NAME" -o "$INSTALL_DIR/$SCRIPT_NAME"
+    curl -fsSL "https://raw.githubusercontent.com/pechavarriaa/CrossPlatformAudioToggle/main/$CORE_NAME" -o "$INSTALL_DIR/$CORE_NAME"
     # Download template icon for dark theme support
     mkdir -p "$INSTALL_DIR/icons"
     if ! curl -fsSL "https://raw.githubusercontent.com/pechavarriaa/CrossPlatformAudioToggle/main/icons/speaker_template.png" -o "$INSTALL_DIR/icons/speaker_template.png"; then
@@ -0,0 +1,104 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+FAKES = Path(__file__).resolve().parent / 'fakes'
+sys.path.insert(0, str(ROOT))
+
+SPEAKER = 'alsa_output.pci-0000_00_1f.3.analog-stereo'
+HEADSET = 'bluez_output.AA_BB.a2dp-sink'
+MIC = 'alsa_input.pci-0000_00_1f.3.analog-stereo'
+HEADSET_MIC = 'bluez_input.AA_BB'
+
+SINKS = f"""Sink #1
+\tState: SUSPENDED
+\tName: {SPEAKER}
+\tSample Specification: s32le 2ch 48000Hz
+\tDescription: Built-in Audio Analog Stereo
+Sink #2
+\tState: RUNNING
+\tName: {HEADSET}
+\tSample Specification: s16le 2ch 44100Hz
+\tDescription: WH-1000XM4 (Sony Headphones)
+"""
+
+SOURCES = f"""Source #3
+\tState: SUSPENDED
+\tName: {MIC}
+\tDescription: Built-in Audio Analog Stereo
+Source #4
+\tState: RUNNING
+\tName: {HEADSET_MIC}
+\tDescription: WH-1000XM4 (Sony Headphones)
+"""
+
+
+def trace_entry(argv, stdout='', returncode=0, wall_time=0.001):
+    """One recorded backend call, as written by TraceRecorder"""
+    return {'argv': list(argv), 'returncode': returncode, 'stdout': stdout, 'wall_time': wall_time}
+
+
+def pactl(*args, **kwargs):
+    return trace_entry(['/usr/bin/pactl'] + list(args), **kwargs)
+
+
+def server_entries(wall_time=0.001):
+    """Calls that describe a steady server with the SINKS/SOURCES devices"""
+    return [
+        pactl('info', stdout="Server Name: PulseAudio (on PipeWire 1.0.5)\nCookie: 1234:abcd\n",
+              wall_time=wall_time),
+        pactl('list', 'sinks', stdout=SINKS, wall_time=wall_time),
+        pactl('list', 'sources', stdout=SOURCES, wall_time=wall_time),
+        pactl('get-default-sink', stdout=SPEAKER + '\n', wall_time=wall_time),
+        pactl('get-default-source', stdout=MIC + '\n', wall_time=wall_time),
+        pactl('set-default-sink', SPEAKER, wall_time=wall_time),
+        pactl('set-default-sink', HEADSET, wall_time=wall_time),
+        pactl('set-default-source', MIC, wall_time=wall_time),
+        pactl('set-default-source', HEADSET_MIC, wall_time=wall_time),
+        trace_entry(['/usr/bin/pactl', 'subscribe'], wall_time=wall_time),
+    ]
+
+
+def write_trace(path, entries):
+    with open(path, 'w') as f:
+        for entry in entries:
+            f.write(json.dumps(entry) + '\n')
+    return path
+
+
+@pytest.fixture
+def config_file(tmp_path):
+    """User config naming the SINKS/SOURCES devices as the two profiles"""
+    path = tmp_path / 'config.json'
+    path.write_text(json.dumps({
+        'speaker_device': SPEAKER,
+        'headset_output': HEADSET,
+        'speaker_input': MIC,
+        'headset_input': HEADSET_MIC,
+    }))
+    return path
+
+
+# Exits 0 only if the real GTK and AppIndicator bindings load and a display is usable
+GTK_PROBE = """
+import sys, gi
+gi.require_version('Gtk', '3.0')
+gi.require_version('AppIndicator3', '0.1')
+from gi.repository import Gtk, AppIndicator3
+sys.exit(0 if Gtk.init_check(sys.argv)[0] else 1)
+"""
+
+
+@pytest.fixture(scope='session')
+def tray_environment():
+    """Skip unless the tray app can really start here (PyGObject, AppIndicator, a display)"""
+    try:
+        probe = subprocess.run([sys.executable, '-c', GTK_PROBE], capture_output=True, timeout=30)
+    except subprocess.TimeoutExpired:
+        pytest.skip("GTK probe timed out")
+    if probe.returncode != 0:
+        pytest.skip("needs PyGObject with Gtk 3 and AppIndicator3, and a display")
@@ -0,0 +1,111 @@
+import subprocess
+import time
+
+import pytest
+
+from audio_toggle_linux import BackendUnavailable, CircuitBreaker, CommandBackend, ReplayBackend
+from conftest import FAKES, pactl, trace_entry, write_trace
+
+INFO = ['/usr/bin/pactl', 'info']
+NOTIFY = ['/usr/bin/notify-send', 'Audio Toggle', 'hello']
+
+
+def breaker_over(tmp_path, entries):
+    """A CircuitBreaker over a replayed trace, logging its state changes"""
+    states = []
+    trace = write_trace(tmp_path / 'trace.jsonl', entries + [trace_entry(NOTIFY)])
+    return CircuitBreaker(ReplayBackend(trace, speed=0), on_state_change=states.append), states
+
+
+def timed_out_info():
+    return dict(pactl('info'), timeout=True)
+
+
+def test_breaker_opens_after_consecutive_timeouts(tmp_path):
+    breaker, states = breaker_over(tmp_path, [timed_out_info()] * CircuitBreaker.FAILURE_THRESHOLD)
+
+    for _ in range(CircuitBreaker.FAILURE_THRESHOLD - 1):
+        with pytest.raises(subprocess.TimeoutExpired):
+            breaker.run(INFO)
+        assert not breaker.unresponsive
+    with pytest.raises(subprocess.TimeoutExpired):
+        breaker.run(INFO)
+
+    assert breaker.unresponsive
+    assert states == ['open']
+
+
+def test_open_breaker_fails_fast_but_passes_other_commands(tmp_path):
+    breaker, _ = breaker_over(tmp_path, [timed_out_info()] * CircuitBreaker.FAILURE_THRESHOLD)
+    for _ in range(CircuitBreaker.FAILURE_THRESHOLD):
+        with pytest.raises(subprocess.TimeoutExpired):
+            breaker.run(INFO)
+
+    start = time.monotonic()
+    with pytest.raises(BackendUnavailable):
+        breaker.run(INFO)
+    with pytest.raises(BackendUnavailable):
+        breaker.stream(['/usr/bin/pactl', 'list', 'sinks'], list)
+    assert time.monotonic() - start < 0.1
+    assert breaker.run(NOTIFY).returncode == 0
+
+
+def test_half_open_probe_closes_the_breaker_on_success(tmp_path):
+    entries = [timed_out_info()] * CircuitBreaker.FAILURE_THRESHOLD + [pactl('info', stdout="Server Name: x\n")]
+    breaker, states = breaker_over(tmp_path, entries)
+    breaker.RESET_SECONDS = 0.2
+    for _ in range(CircuitBreaker.FAILURE_THRESHOLD):
+        with pytest.raises(subprocess.TimeoutExpired):
+            breaker.run(INFO)
+    with pytest.raises(BackendUnavailable):
+        breaker.run(INFO)
+
+    time.sleep(0.25)
+    assert breaker.run(INFO).stdout == "Server Name: x\n"
+
+    assert not breaker.unresponsive
+    assert states == ['open', 'half-open', 'closed']
+
+
+def test_half_open_probe_timeout_reopens_at_once(tmp_path):
+    breaker, states = breaker_over(tmp_path, [timed_out_info()] * (CircuitBreaker.FAILURE_THRESHOLD + 1))
+    breaker.RESET_SECONDS = 0.2
+    for _ in range(CircuitBreaker.FAILURE_THRESHOLD):
+        with pytest.raises(subprocess.TimeoutExpired):
+            breaker.run(INFO)
+
+    time.sleep(0.25)
+    with pytest.raises(subprocess.TimeoutExpired):
+        breaker.run(INFO)
+
+    assert states == ['open', 'half-open', 'open']
+    with pytest.raises(BackendUnavailable):
+        breaker.run(INFO)
+
+
+def alive(pid):
+    """True if pid is a process that has not exited (zombies count as exited)"""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            return f.read().rsplit(')', 1)[1].split()[0] != 'Z'
+    except FileNotFoundError:
+        return False
+
+
+def test_stream_watchdog_kills_a_hung_command_and_its_children(tmp_path):
+    pids_file = tmp_path / 'pids'
+    backend = CommandBackend(env={'FAKE_PACTL_PIDS': str(pids_file)})
+    lines = []
+
+    start = time.monotonic()
+    with pytest.raises(subprocess.TimeoutExpired):
+        backend.stream([str(FAKES / 'pactl'), 'list', 'sinks'], lines.extend, timeout=0.5)
+    elapsed = time.monotonic() - start
+
+    assert elapsed < 3
+    assert lines == ["Sink #1\n"]
+    pids = [int(pid) for pid in pids_file.read_text().split()]
+    deadline = time.monotonic() + 2
+    while any(alive(pid) for pid in pids) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert not any(alive(pid) for pid in pids)
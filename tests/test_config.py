@@ -0,0 +1,122 @@
+import json
+
+import audio_toggle_linux
+from audio_toggle_core import update_config_file
+from audio_toggle_linux import AudioSession, LayeredConfig, ReplayBackend, parse_pactl_output
+from conftest import HEADSET, MIC, SINKS, SPEAKER, server_entries, write_trace
+
+
+def test_save_config_writes_only_the_changed_key(tmp_path, capsys):
+    config_file = tmp_path / 'config.json'
+    config_file.write_text(json.dumps({
+        'match': {'speaker_device': 'desc:Built-in', 'speaker_input': 'alsa_input'},
+        'rules': [{'match': {'application.name': 'Teams'}, 'output': HEADSET}],
+    }))
+    trace = write_trace(tmp_path / 'server.jsonl', server_entries())
+    session = AudioSession(config_file, backend=ReplayBackend(trace, speed=0))
+    assert (session.speaker_device, session.speaker_input) == (SPEAKER, MIC)
+
+    session.speaker_device = HEADSET
+    session.save_config(('speaker_device',))
+
+    saved = json.loads(config_file.read_text())
+    assert saved['speaker_device'] == HEADSET
+    # The resolved input pattern is still a pattern, not a pinned device ID
+    assert saved['match'] == {'speaker_input': 'alsa_input'}
+    assert 'speaker_input' not in saved and 'headset_output' not in saved
+    assert saved['rules'] == [{'match': {'application.name': 'Teams'}, 'output': HEADSET}]
+    assert '"match" pattern for speaker_device' in capsys.readouterr().out
+
+
+def test_update_config_file_merges_sample_specs(tmp_path):
+    config_file = tmp_path / 'config.json'
+    config_file.write_text(json.dumps({
+        'speaker_device': SPEAKER,
+        'sample_specs': {SPEAKER: {'format': 's32le', 'rate': 48000}},
+    }))
+
+    update_config_file(config_file, {
+        'headset_output': HEADSET,
+        'sample_specs': {HEADSET: {'format': 's16le', 'rate': 44100}},
+    })
+
+    saved = json.loads(config_file.read_text())
+    assert saved['speaker_device'] == SPEAKER
+    assert saved['sample_specs'] == {
+        SPEAKER: {'format': 's32le', 'rate': 48000},
+        HEADSET: {'format': 's16le', 'rate': 44100},
+    }
+
+
+def test_load_can_defer_match_patterns(tmp_path):
+    config_file = tmp_path / 'config.json'
+    config_file.write_text(json.dumps({'headset_output': HEADSET, 'match': {'speaker_device': 'desc:Built-in'}}))
+    listed = []
+
+    def lister(device_type):
+        listed.append(device_type)
+        return parse_pactl_output(SINKS.splitlines(), device_type)
+
+    config = LayeredConfig(config_file, system_dir=tmp_path / 'etc', environ={})
+    table = config.load(lister, resolve=False)
+    assert (table.speaker_device, table.headset_output) == ('', HEADSET)
+    assert config.unresolved == ('speaker_device',)
+    assert listed == []
+
+    table = config.load(lister)
+    assert table.speaker_device == SPEAKER
+    assert config.unresolved == ()
+    assert listed == ['sinks']
+
+
+def test_malformed_layers_are_skipped(tmp_path, capsys):
+    system_dir = tmp_path / 'etc'
+    system_dir.mkdir()
+    (system_dir / '10-list.json').write_text(json.dumps([SPEAKER]))
+    (system_dir / '20-rules.json').write_text(json.dumps({'speaker_device': MIC, 'rules': 'teams'}))
+    (system_dir / '30-broken.json').write_text('{"speaker_device": ')
+    config_file = tmp_path / 'config.json'
+    config_file.write_text(json.dumps({'speaker_device': SPEAKER}))
+
+    table = LayeredConfig(config_file, system_dir=system_dir, environ={}).load()
+
+    assert table.speaker_device == SPEAKER
+    out = capsys.readouterr().out
+    assert '10-list.json' in out and '20-rules.json' in out and '30-broken.json' in out
+
+
+def test_unmatched_pattern_stays_cached_until_retried(tmp_path):
+    config_file = tmp_path / 'config.json'
+    config_file.write_text(json.dumps({'match': {'headset_output': 'bluez_output'}}))
+    snapshots = iter([SINKS.split('Sink #2')[0], SINKS])
+    listed = []
+
+    def lister(device_type):
+        listed.append(device_type)
+        return parse_pactl_output(next(snapshots).splitlines(), device_type)
+
+    config = LayeredConfig(config_file, system_dir=tmp_path / 'etc', environ={})
+    assert config.load(lister).headset_output == ''
+    assert config.unresolved == ('headset_output',)
+    # An unplugged device does not cost an enumeration per load
+    for _ in range(5):
+        assert config.load(lister).headset_output == ''
+    assert listed == ['sinks']
+
+    assert config.retry_unresolved(lister).headset_output == HEADSET
+    assert config.unresolved == ()
+    assert config.retry_unresolved(lister).headset_output == HEADSET
+    assert listed == ['sinks', 'sinks']
+
+
+def test_default_system_dir_is_read_at_construction(tmp_path, monkeypatch):
+    system_dir = tmp_path / 'etc'
+    system_dir.mkdir()
+    (system_dir / '10-fleet.json').write_text(json.dumps({'headset_output': HEADSET}))
+    monkeypatch.setattr(audio_toggle_linux, 'SYSTEM_CONFIG_DIR', system_dir)
+    config_file = tmp_path / 'config.json'
+    config_file.write_text(json.dumps({'speaker_device': SPEAKER}))
+
+    table = LayeredConfig(config_file, environ={}).load()
+
+    assert (table.speaker_device, table.headset_output) == (SPEAKER, HEADSET)
@@ -0,0 +1,46 @@
+import json
+
+from audio_toggle_linux import ReplayBackend, configure_non_interactive
+from conftest import HEADSET, HEADSET_MIC, MIC, SPEAKER, server_entries, write_trace
+
+SELECTORS = {
+    'profile1_output': 'desc:Built-in',
+    'profile1_input': 'alsa_input',
+    'profile2_output': 'bluez_output',
+    'profile2_input': 'bluez_input',
+}
+
+
+def replayed_server(tmp_path):
+    return ReplayBackend(write_trace(tmp_path / 'server.jsonl', server_entries()), speed=0)
+
+
+def run_batch(tmp_path, jobs):
+    batch = tmp_path / 'batch.json'
+    batch.write_text(json.dumps(jobs))
+    return configure_non_interactive(batch_file=batch, backend=replayed_server(tmp_path))
+
+
+def test_batch_writes_each_config_file(tmp_path):
+    config_file = tmp_path / 'alice.json'
+
+    assert run_batch(tmp_path, [dict(SELECTORS, config_file=str(config_file))])
+
+    saved = json.loads(config_file.read_text())
+    assert (saved['speaker_device'], saved['speaker_input']) == (SPEAKER, MIC)
+    assert (saved['headset_output'], saved['headset_input']) == (HEADSET, HEADSET_MIC)
+
+
+def test_non_string_selector_is_reported_not_raised(tmp_path, capsys):
+    config_file = tmp_path / 'alice.json'
+
+    assert not run_batch(tmp_path, [dict(SELECTORS, profile1_output=1, config_file=str(config_file))])
+
+    assert "[1] profile1_output: selector must be a string, got 1" in capsys.readouterr().out
+    assert not config_file.exists()
+
+
+def test_non_string_config_file_is_reported_not_raised(tmp_path, capsys):
+    assert not run_batch(tmp_path, [dict(SELECTORS, config_file=["alice.json"])])
+
+    assert '[1] config_file must be a path string, got ["alice.json"]' in capsys.readouterr().out
@@ -0,0 +1,80 @@
+from audio_toggle_core import PlanError, ProfileTable, ToggleSession
+
+TABLE = ProfileTable('speaker-id', 'headset-id', 'mic-id', 'headset-mic-id')
+NAMES = {'speaker-id': 'Speakers', 'headset-id': 'AirPods Pro',
+         'mic-id': 'Microphone', 'headset-mic-id': 'AirPods Pro'}
+
+
+class FakePlatform(ToggleSession):
+    """Adapter that records switches and notifications instead of touching a server"""
+
+    def __init__(self, current='speaker-id', failing=(), error=None):
+        self.current = current
+        self.failing = failing
+        self.error = error
+        self.switched = []
+        self.notifications = []
+
+    def current_output(self):
+        if self.error:
+            raise self.error
+        return self.current
+
+    def switch_device(self, device_id, role, port):
+        if device_id in self.failing:
+            return False
+        self.switched.append((role, device_id, port))
+        return True
+
+    def device_display_name(self, device_id, role):
+        return NAMES.get(device_id, device_id)
+
+    def show_notification(self, title, message):
+        self.notifications.append((title, message))
+
+
+def test_toggle_switches_output_then_input():
+    platform = FakePlatform()
+
+    assert platform.toggle_profile(TABLE) == 'Profile 2'
+    assert platform.switched == [('output', 'headset-id', None), ('input', 'headset-mic-id', None)]
+    assert len(platform.notifications) == 1
+    assert 'AirPods Pro' in platform.notifications[0][1]
+
+
+def test_failed_output_is_reported_by_display_name():
+    platform = FakePlatform(failing=('headset-id',))
+
+    assert platform.toggle_profile(TABLE) is None
+    assert platform.notifications == [('Audio Toggle', 'Failed to switch output to AirPods Pro')]
+    assert platform.switched == []
+
+
+def test_failed_input_keeps_the_output():
+    platform = FakePlatform(failing=('headset-mic-id',))
+
+    assert platform.toggle_profile(TABLE) is None
+    assert platform.notifications == [('Audio Toggle', 'Output switched but input failed')]
+    assert platform.switched == [('output', 'headset-id', None)]
+
+
+def test_unavailable_input_stops_before_switching():
+    class Unplugged(FakePlatform):
+        def resolve_toggle_devices(self, table):
+            return table, {'headset-mic-id': False}
+
+    platform = Unplugged()
+
+    assert platform.toggle_profile(TABLE) is None
+    assert platform.notifications == [('Audio Toggle', 'Profile 2 input is not connected')]
+    assert platform.switched == []
+
+
+def test_plan_errors_become_notifications():
+    platform = FakePlatform(error=PlanError('Audio Toggle', 'Audio server unresponsive, try again shortly'))
+    assert platform.toggle_profile(TABLE) is None
+    assert platform.notifications == [('Audio Toggle', 'Audio server unresponsive, try again shortly')]
+
+    platform = FakePlatform()
+    assert platform.toggle_profile(ProfileTable('speaker-id', '', 'mic-id', '')) is None
+    assert len(platform.notifications) == 1 and platform.switched == []
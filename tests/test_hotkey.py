@@ -0,0 +1,88 @@
+import shutil
+import subprocess
+import sys
+import time
+
+import pytest
+
+import audio_toggle_linux
+from audio_toggle_linux import AudioSession, GlobalHotkey, ReplayBackend
+from conftest import server_entries, write_trace
+
+KEYBINDER_PROBE = """
+import gi
+gi.require_version('Keybinder', '3.0')
+from gi.repository import Keybinder
+"""
+
+
+def test_portal_trigger_uses_shortcut_spec_names():
+    assert GlobalHotkey('<Ctrl><Alt>a', None).portal_trigger() == 'CTRL+ALT+a'
+    assert GlobalHotkey('<Super><Shift>F9', None).portal_trigger() == 'LOGO+SHIFT+F9'
+
+
+class SessionBus:
+    """Records the D-Bus calls GlobalHotkey makes on the session bus"""
+
+    def __init__(self):
+        self.calls = []
+        self.unsubscribed = []
+
+    def call_sync(self, bus_name, path, interface, method, *args):
+        self.calls.append((bus_name, path, interface, method))
+
+    def signal_unsubscribe(self, subscription):
+        self.unsubscribed.append(subscription)
+
+
+def test_unbind_closes_the_portal_session():
+    pytest.importorskip('gi.repository.Gio')
+    session = '/org/freedesktop/portal/desktop/session/1_42/audio_toggle_1'
+    hotkey = GlobalHotkey('<Ctrl><Alt>a', None)
+    hotkey.method = 'portal'
+    hotkey._bus = bus = SessionBus()
+    hotkey._subscriptions = [7]
+    hotkey._session = session
+
+    hotkey.unbind()
+
+    assert bus.unsubscribed == [7]
+    assert bus.calls == [(GlobalHotkey.PORTAL_BUS, session, 'org.freedesktop.portal.Session', 'Close')]
+    assert hotkey.method is None
+    # A second unbind has nothing left to close
+    hotkey.unbind()
+    assert len(bus.calls) == 1
+
+
+@pytest.fixture
+def x11_keybinder(tray_environment, monkeypatch):
+    """Skip unless Keybinder and xdotool can deliver a key on an X display (e.g. under xvfb-run)"""
+    if subprocess.run([sys.executable, '-c', KEYBINDER_PROBE], capture_output=True).returncode != 0:
+        pytest.skip("needs Keybinder 3.0 (gir1.2-keybinder-3.0)")
+    if not shutil.which('xdotool'):
+        pytest.skip("needs xdotool")
+    monkeypatch.delenv('WAYLAND_DISPLAY', raising=False)
+    monkeypatch.setenv('XDG_SESSION_TYPE', 'x11')
+
+
+def test_hotkey_toggles_on_a_synthetic_key_press(tmp_path, config_file, x11_keybinder):
+    audio_toggle_linux.import_gtk()
+    from gi.repository import GLib
+
+    session = AudioSession(config_file, backend=ReplayBackend(write_trace(tmp_path / 'server.jsonl',
+                                                                          server_entries()), speed=0))
+    toggled = []
+    hotkey = GlobalHotkey('<Ctrl><Alt>a', lambda: toggled.append(session.toggle_audio(None)))
+    assert hotkey.bind()
+    try:
+        assert hotkey.method == 'keybinder'
+        subprocess.run(['xdotool', 'key', 'ctrl+alt+a'], check=True, timeout=10)
+        context = GLib.MainContext.default()
+        deadline = time.monotonic() + 5
+        while not toggled and time.monotonic() < deadline:
+            context.iteration(False)
+            time.sleep(0.01)
+    finally:
+        hotkey.unbind()
+
+    assert toggled == ['Profile 2']
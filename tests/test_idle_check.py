@@ -0,0 +1,62 @@
+import os
+import shutil
+import subprocess
+import sys
+
+from conftest import FAKES, ROOT, server_entries, write_trace
+
+IDLE_SECONDS = 2
+
+# The tray on a replayed server, but live so it keeps a `pactl subscribe`
+# (the quiet fake) open under an IO watch for the whole window
+LIVE_TRAY = """
+import sys
+sys.path.insert(0, sys.argv[1])
+import audio_toggle_linux as m
+
+class LiveReplay(m.ReplayBackend):
+    live = True
+
+m.import_gtk()
+m.PactlSubscription.COMMAND = [sys.argv[2]]
+app = m.AudioToggle(backend=LiveReplay(sys.argv[3], speed=0), idle_check=int(sys.argv[4]))
+sys.exit(0 if app.run() else 1)
+"""
+
+
+def tray_home(tmp_path, config_file):
+    (tmp_path / '.config' / 'audio_toggle').mkdir(parents=True)
+    shutil.copy(config_file, tmp_path / '.config' / 'audio_toggle' / 'config.json')
+    env = dict(os.environ, HOME=str(tmp_path))
+    env.pop('AUDIO_TOGGLE_CONTROL_SOCKET', None)
+    return env
+
+
+def test_tray_stays_idle_on_a_replayed_server(tmp_path, config_file, tray_environment):
+    env = tray_home(tmp_path, config_file)
+    trace = write_trace(tmp_path / 'server.jsonl', server_entries())
+
+    result = subprocess.run(
+        [sys.executable, str(ROOT / 'audio_toggle_linux.py'), '--replay-trace', str(trace),
+         '--replay-speed', '0', '--idle-check', str(IDLE_SECONDS)],
+        capture_output=True, text=True, env=env, timeout=60,
+    )
+
+    assert f"[Idle] {IDLE_SECONDS} s idle" in result.stdout, result.stdout + result.stderr
+    assert result.returncode == 0, result.stdout
+    assert 'within budget' in result.stdout
+
+
+def test_tray_stays_idle_with_an_open_subscription(tmp_path, config_file, tray_environment):
+    env = tray_home(tmp_path, config_file)
+    trace = write_trace(tmp_path / 'server.jsonl', server_entries())
+
+    result = subprocess.run(
+        [sys.executable, '-c', LIVE_TRAY, str(ROOT), str(FAKES / 'pactl-subscribe'), str(trace), str(IDLE_SECONDS)],
+        capture_output=True, text=True, env=env, timeout=60,
+    )
+
+    assert 'Live device updates unavailable' not in result.stdout
+    assert f"[Idle] {IDLE_SECONDS} s idle" in result.stdout, result.stdout + result.stderr
+    assert result.returncode == 0, result.stdout
+    assert 'within budget' in result.stdout
@@ -0,0 +1,83 @@
+import json
+
+import pytest
+
+from audio_toggle_mac import AudioSession
+from conftest import FAKES
+
+SPEAKERS = 'BuiltInSpeakerDevice'
+AIRPODS_OUT = 'AA-BB-CC:output'
+MICROPHONE = 'BuiltInMicrophoneDevice'
+AIRPODS_IN = 'AA-BB-CC:input'
+
+
+@pytest.fixture
+def switch_state(tmp_path, monkeypatch):
+    """State file of the fake SwitchAudioSource, which the session finds via the environment"""
+    state_file = tmp_path / 'switchaudiosource.json'
+    monkeypatch.setenv('FAKE_SWITCHAUDIOSOURCE_STATE', str(state_file))
+    monkeypatch.setenv('AUDIO_TOGGLE_SWITCHAUDIOSOURCE', str(FAKES / 'SwitchAudioSource'))
+    return state_file
+
+
+@pytest.fixture
+def mac_config(tmp_path):
+    path = tmp_path / 'config.json'
+    path.write_text(json.dumps({
+        'speaker_device': SPEAKERS,
+        'headset_output': AIRPODS_OUT,
+        'speaker_input': MICROPHONE,
+        'headset_input': AIRPODS_IN,
+    }))
+    return path
+
+
+def current(state_file):
+    return json.loads(state_file.read_text())['current']
+
+
+def test_toggle_switches_output_system_and_input_by_uid(switch_state, mac_config):
+    session = AudioSession(mac_config)
+
+    assert session.toggle_audio(None) == 'Profile 2'
+    assert current(switch_state) == {'output': AIRPODS_OUT, 'input': AIRPODS_IN, 'system': AIRPODS_OUT}
+
+    assert session.toggle_audio(None) == 'Profile 1'
+    assert current(switch_state) == {'output': SPEAKERS, 'input': MICROPHONE, 'system': SPEAKERS}
+
+
+def test_toggle_finds_renamed_devices_by_uid(switch_state, mac_config):
+    switch_state.write_text(json.dumps({'devices': [
+        {'name': 'Speakers', 'type': 'output', 'id': 79, 'uid': SPEAKERS},
+        {'name': "Sam's AirPods", 'type': 'output', 'id': 91, 'uid': AIRPODS_OUT},
+        {'name': 'Microphone', 'type': 'input', 'id': 72, 'uid': MICROPHONE},
+        {'name': "Sam's AirPods", 'type': 'input', 'id': 92, 'uid': AIRPODS_IN},
+    ]}))
+
+    assert AudioSession(mac_config).toggle_audio(None) == 'Profile 2'
+    assert current(switch_state)['output'] == AIRPODS_OUT
+
+
+def test_toggle_stops_when_headset_input_is_gone(switch_state, mac_config, capsys):
+    switch_state.write_text(json.dumps({'devices': [
+        {'name': 'MacBook Pro Speakers', 'type': 'output', 'id': 79, 'uid': SPEAKERS},
+        {'name': 'AirPods Pro', 'type': 'output', 'id': 91, 'uid': AIRPODS_OUT},
+        {'name': 'MacBook Pro Microphone', 'type': 'input', 'id': 72, 'uid': MICROPHONE},
+    ]}))
+
+    assert AudioSession(mac_config).toggle_audio(None) is None
+    assert 'Profile 2 input is not connected' in capsys.readouterr().out
+    assert 'current' not in json.loads(switch_state.read_text())
+
+
+def test_legacy_name_config_still_toggles(switch_state, tmp_path):
+    config = tmp_path / 'config.json'
+    config.write_text(json.dumps({
+        'speaker_device': 'MacBook Pro Speakers',
+        'headset_output': 'AirPods Pro',
+        'speaker_input': 'MacBook Pro Microphone',
+        'headset_input': 'AirPods Pro',
+    }))
+
+    assert AudioSession(config).toggle_audio(None) == 'Profile 2'
+    assert current(switch_state)['input'] == AIRPODS_IN
@@ -0,0 +1,47 @@
+import pytest
+
+import audio_toggle_linux
+from audio_toggle_linux import AudioSession, ReplayBackend
+from conftest import HEADSET, SPEAKER, pactl, server_entries, trace_entry, write_trace
+
+TOGGLES = 10000
+WARMUP = 200
+# Allowed RSS growth over the measured toggles; a per-toggle leak of even
+# a few hundred bytes would exceed it
+MAX_GROWTH_KIB = 2048
+
+
+def toggle_trace(path, toggles):
+    """A trace whose default sink alternates, so every toggle flips profile"""
+    entries = server_entries(wall_time=0.0)
+    entries.remove(pactl('get-default-sink', stdout=SPEAKER + '\n', wall_time=0.0))
+    for i in range(toggles):
+        current = SPEAKER if i % 2 == 0 else HEADSET
+        entries.append(pactl('get-default-sink', stdout=current + '\n', wall_time=0.0))
+    for message in ("Profile 1 (Desktop)\n🔊 Built-in Audio Analog Stereo\n🎤 Built-in Audio Analog Stereo",
+                    "Profile 2 (Headset)\n🔊 Sony Headphones\n🎤 Sony Headphones"):
+        entries.append(trace_entry(['/usr/bin/notify-send', 'Audio Toggle', message], wall_time=0.0))
+    return write_trace(path, entries)
+
+
+def test_rss_stays_flat_over_many_toggles(tmp_path, config_file, capsys):
+    if audio_toggle_linux.read_rss_kib() is None:
+        pytest.skip("no /proc/self/status on this platform")
+    trace = toggle_trace(tmp_path / 'toggle.jsonl', WARMUP + TOGGLES)
+    session = AudioSession(config_file, backend=ReplayBackend(trace, speed=0))
+
+    profiles = set()
+    for _ in range(WARMUP):
+        profiles.add(session.toggle_audio(None))
+    capsys.readouterr()
+    before = audio_toggle_linux.read_rss_kib()
+    for i in range(TOGGLES):
+        session.toggle_audio(None)
+        if i % 100 == 0:
+            # Keep captured output from counting against the process
+            capsys.readouterr()
+    capsys.readouterr()
+    after = audio_toggle_linux.read_rss_kib()
+
+    assert profiles == {'Profile 1', 'Profile 2'}
+    assert after - before < MAX_GROWTH_KIB, f"RSS grew {after - before} KiB over {TOGGLES} toggles"
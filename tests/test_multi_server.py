@@ -0,0 +1,52 @@
+import json
+import subprocess
+import sys
+from concurrent.futures import Future
+
+import pytest
+
+from audio_toggle_linux import AudioSession, MultiServerDaemon, ReplayBackend
+from conftest import ROOT, server_entries, trace_entry, write_trace
+
+
+class ExitingSession:
+    """Stands in for a ServerSession whose worker died of SystemExit"""
+
+    def submit(self, command):
+        future = Future()
+        future.set_exception(SystemExit(1))
+        return future
+
+
+def test_handle_replies_when_the_worker_exits(tmp_path):
+    config = tmp_path / 'servers.json'
+    config.write_text(json.dumps({'socket': str(tmp_path / 'control.sock'), 'servers': {}}))
+    daemon = MultiServerDaemon(config)
+    daemon.sessions['unix:/run/user/1001/pulse/native'] = ExitingSession()
+
+    reply = daemon.handle({'command': 'toggle', 'server': 'unix:/run/user/1001/pulse/native'})
+
+    assert reply['ok'] is False
+    assert reply['error']
+
+
+def test_server_info_raises_instead_of_exiting_without_pactl(tmp_path, config_file):
+    entries = [entry for entry in server_entries() if entry['argv'][1:] != ['info']]
+    entries.append(dict(trace_entry(['/usr/bin/pactl', 'info']), missing=True))
+    session = AudioSession(config_file, backend=ReplayBackend(write_trace(tmp_path / 'trace.jsonl', entries), speed=0))
+
+    with pytest.raises(FileNotFoundError):
+        session.server_info()
+
+
+def test_toggle_via_missing_control_socket_fails_cleanly(tmp_path):
+    result = subprocess.run(
+        [sys.executable, str(ROOT / 'audio_toggle_linux.py'), '--toggle',
+         '--control-socket', str(tmp_path / 'missing.sock'), '--server', 'unix:/nowhere'],
+        capture_output=True, text=True, timeout=30,
+        env={'HOME': str(tmp_path), 'PATH': '/usr/bin:/bin'},
+    )
+
+    assert result.returncode == 1
+    assert result.stdout.startswith("Toggle failed:")
+    assert 'Traceback' not in result.stderr
@@ -0,0 +1,41 @@
+import json
+
+from audio_toggle_linux import LayeredConfig, StreamRouter
+from conftest import HEADSET, SPEAKER
+
+TEAMS = {'application.name': 'Teams', 'application.process.binary': 'teams'}
+
+
+def test_user_rule_beats_system_rule_on_another_field(tmp_path):
+    system_dir = tmp_path / 'etc'
+    system_dir.mkdir()
+    (system_dir / '10-fleet.json').write_text(json.dumps({
+        'rules': [{'match': {'application.process.binary': 'teams'}, 'output': SPEAKER}],
+    }))
+    user_file = tmp_path / 'config.json'
+    user_file.write_text(json.dumps({
+        'rules': [{'match': {'application.name': 'Teams'}, 'output': HEADSET}],
+    }))
+    config = LayeredConfig(user_file, system_dir=system_dir, environ={})
+    config.load()
+
+    assert config.router.route(TEAMS)['output'] == HEADSET
+
+
+def test_first_listed_rule_wins():
+    router = StreamRouter([
+        {'match': {'media.role': 'phone'}, 'output': HEADSET},
+        {'match': {'application.process.binary': 'teams'}, 'output': SPEAKER},
+    ])
+
+    assert router.route(dict(TEAMS, **{'media.role': 'phone'}))['output'] == HEADSET
+    assert router.route(TEAMS)['output'] == SPEAKER
+    assert router.route({'application.name': 'Firefox'}) is None
+
+
+def test_rule_with_several_fields_needs_all_of_them():
+    router = StreamRouter([{'match': {'application.process.binary': 'teams', 'media.role': 'phone'},
+                            'output': HEADSET}])
+
+    assert router.route(TEAMS) is None
+    assert router.route(dict(TEAMS, **{'media.role': 'phone'}))['output'] == HEADSET
@@ -0,0 +1,47 @@
+import json
+
+from audio_toggle_linux import AudioSession
+from conftest import HEADSET, HEADSET_MIC, MIC, SPEAKER, pactl, server_entries, trace_entry, write_trace
+from test_toggle import CallLog
+
+PIN_RATE = ['/usr/bin/pw-metadata', '-n', 'settings', '0', 'clock.force-rate']
+
+
+def toggled_twice(tmp_path, settings_after_first):
+    """pw-metadata calls of a speaker -> headset -> speaker round trip"""
+    config_file = tmp_path / 'config.json'
+    config = {
+        'speaker_device': SPEAKER, 'headset_output': HEADSET,
+        'speaker_input': MIC, 'headset_input': HEADSET_MIC,
+        'align_sample_rate': True,
+        # Only the headset has a recorded rate
+        'sample_specs': {HEADSET: {'format': 's16le', 'rate': 44100}},
+    }
+    config_file.write_text(json.dumps(config))
+    entries = server_entries()
+    # The default sink follows the toggles: speaker first, then the headset
+    entries.insert(entries.index(pactl('get-default-sink', stdout=SPEAKER + '\n')) + 1,
+                   pactl('get-default-sink', stdout=HEADSET + '\n'))
+    entries += [trace_entry(PIN_RATE + ['44100']), trace_entry(PIN_RATE + ['0'])]
+    backend = CallLog(write_trace(tmp_path / 'trace.jsonl', entries))
+    session = AudioSession(config_file, backend=backend)
+
+    assert session.toggle_audio(None) == 'Profile 2'
+    assert session.forced_graph_rate == 44100
+    config_file.write_text(json.dumps(dict(config, **settings_after_first)))
+    assert session.toggle_audio(None) == 'Profile 1'
+    return session, [argv for argv in backend.calls if argv[0] == PIN_RATE[0]]
+
+
+def test_rate_is_released_for_an_output_without_a_known_rate(tmp_path):
+    session, calls = toggled_twice(tmp_path, {})
+
+    assert calls == [PIN_RATE + ['44100'], PIN_RATE + ['0']]
+    assert session.forced_graph_rate is None
+
+
+def test_rate_is_released_when_the_setting_is_turned_off(tmp_path):
+    session, calls = toggled_twice(tmp_path, {'align_sample_rate': False})
+
+    assert calls == [PIN_RATE + ['44100'], PIN_RATE + ['0']]
+    assert session.forced_graph_rate is None
@@ -0,0 +1,66 @@
+import json
+import threading
+
+import pytest
+
+import audio_toggle_linux
+from audio_toggle_linux import ReplayBackend
+from conftest import server_entries, write_trace
+
+# Every replayed pactl call takes this long, as on a server that is still starting
+SLOW_CALL_SECONDS = 0.3
+BACKEND_STAGES = ('patterns', 'detect', 'devices', 'defaults')
+
+
+class ThreadLog(ReplayBackend):
+    """ReplayBackend that notes which thread made each call"""
+
+    def __init__(self, trace_path):
+        super().__init__(trace_path, speed=1)
+        self.threads = []
+
+    def run(self, argv, check=False, timeout=None):
+        self.threads.append(threading.current_thread().name)
+        return super().run(argv, check=check, timeout=timeout)
+
+
+@pytest.fixture
+def tray_home(tmp_path, monkeypatch):
+    config_dir = tmp_path / '.config' / 'audio_toggle'
+    config_dir.mkdir(parents=True)
+    config_file = config_dir / 'config.json'
+    config_file.write_text(json.dumps({'match': {
+        'speaker_device': 'desc:Built-in', 'headset_output': 'bluez_output',
+        'speaker_input': 'alsa_input', 'headset_input': 'bluez_input',
+    }}))
+    monkeypatch.setattr(audio_toggle_linux, 'USER_CONFIG_FILE', config_file)
+    monkeypatch.setattr(audio_toggle_linux, 'LOCK_FILE', config_dir / '.audio_toggle.lock')
+    monkeypatch.setattr(audio_toggle_linux, 'TRAY_SOCKET', config_dir / 'tray.sock')
+    monkeypatch.setattr(audio_toggle_linux, 'SYSTEM_CONFIG_DIR', tmp_path / 'etc')
+    return tmp_path
+
+
+def test_indicator_is_up_before_the_slow_server_is_asked(tray_home, tray_environment):
+    audio_toggle_linux.import_gtk()
+    entries = server_entries(wall_time=SLOW_CALL_SECONDS)
+    backend = ThreadLog(write_trace(tray_home / 'slow.jsonl', entries))
+
+    app = audio_toggle_linux.AudioToggle(backend=backend, startup_timing=True)
+    try:
+        startup = next(thread for thread in threading.enumerate() if thread.name == 'startup-snapshot')
+        startup.join(timeout=30)
+        assert not startup.is_alive()
+    finally:
+        app.query_server.stop()
+        app.subscription.stop()
+        app._release_lock()
+
+    stages = {stage: (thread_name, at) for stage, thread_name, at in app.startup_timing.stages}
+    indicator_at = stages['indicator'][1]
+    for stage in BACKEND_STAGES:
+        thread_name, at = stages[stage]
+        assert thread_name == 'startup-snapshot', stage
+        assert at > indicator_at, stage
+    assert 'MainThread' not in backend.threads
+    # The patterns were resolved off the main thread
+    assert app.speaker_device and app.headset_input
@@ -0,0 +1,38 @@
+from audio_toggle_core import Device
+from audio_toggle_linux import AudioSession, ReplayBackend
+from conftest import HEADSET_MIC, server_entries, write_trace
+
+
+class CallLog(ReplayBackend):
+    """ReplayBackend that also keeps the argv of every call"""
+
+    def __init__(self, trace_path):
+        super().__init__(trace_path, speed=0)
+        self.calls = []
+
+    def run(self, argv, check=False, timeout=None):
+        self.calls.append(argv)
+        return super().run(argv, check=check, timeout=timeout)
+
+
+class CachedSession(AudioSession):
+    """AudioSession with a fixed device cache, as the tray keeps one"""
+
+    def __init__(self, config_file, backend, devices):
+        self.cached = {device.id: device for device in devices}
+        super().__init__(config_file, backend=backend)
+
+    def get_cached_device(self, device_id, device_type):
+        return self.cached.get(device_id)
+
+
+def test_toggle_stops_when_target_input_is_unplugged(tmp_path, config_file):
+    backend = CallLog(write_trace(tmp_path / 'trace.jsonl', server_entries()))
+    unplugged_mic = Device(HEADSET_MIC, 'Headset Microphone', ports={'headset-mic': (False, 100)},
+                           active_port='headset-mic')
+    session = CachedSession(config_file, backend, [unplugged_mic])
+
+    assert session.toggle_audio(None) is None
+
+    assert ['/usr/bin/notify-send', 'Audio Toggle', "Profile 2 input is not connected"] in backend.calls
+    assert not [argv for argv in backend.calls if argv[1].startswith('set-default')]
@@ -0,0 +1,82 @@
+from audio_toggle_core import Device, DeviceSnapshot
+from audio_toggle_linux import AudioToggle
+from conftest import HEADSET, SPEAKER
+
+
+class Item:
+    """Stands in for a Gtk.CheckMenuItem"""
+
+    def __init__(self, label):
+        self.label = label
+
+    def set_label(self, label):
+        self.label = label
+
+
+class TrayState:
+    """
+    The attributes AudioToggle's event handling works on, without GTK:
+    AudioToggle methods are called with this as self.
+    """
+
+    def __init__(self, devices, listings=(), unresolved=()):
+        self.devices = {'sinks': DeviceSnapshot(devices), 'sources': DeviceSnapshot()}
+        self.device_items = {'sinks': {device.id: Item(device.name) for device in devices}, 'sources': {}}
+        self.device_indexes = {'sinks': {device.index: device.id for device in devices}, 'sources': {}}
+        self.listings = list(listings)
+        self.scheduled = []
+        self.retries = 0
+        self._pending_refresh = set()
+        self._refresh_source_id = None
+        self.backend = type('Backend', (), {'unresponsive': False})()
+        self.config = type('Config', (), {'unresolved': unresolved})()
+
+    def _schedule_refresh(self, what):
+        self.scheduled.append(what)
+        self._pending_refresh.add(what)
+
+    def get_audio_devices(self, device_type):
+        return self.listings.pop(0)
+
+    def _apply_device_list(self, device_type, devices):
+        return AudioToggle._apply_device_list(self, device_type, devices)
+
+    def _add_device_item(self, device_type, device):
+        self.device_items[device_type][device.id] = Item(device.name)
+
+    def load_config(self, retry=False):
+        self.retries += retry
+
+    def _sync_default_items(self):
+        pass
+
+
+SPEAKERS = Device(SPEAKER, 'Built-in Audio Analog Stereo', 1)
+HEADPHONES = Device(HEADSET, 'WH-1000XM4', 2)
+
+
+def test_sink_change_event_relabels_a_renamed_device():
+    renamed = Device(HEADSET, 'Sony Headphones', 2)
+    tray = TrayState([SPEAKERS, HEADPHONES], listings=[DeviceSnapshot([SPEAKERS, renamed])])
+
+    AudioToggle._on_pactl_event(tray, 'change', 'sink', 2)
+    assert tray.scheduled == ['sinks']
+    AudioToggle._run_pending_refresh(tray)
+
+    assert tray.device_items['sinks'][HEADSET].label == 'Sony Headphones'
+    assert tray.device_items['sinks'][SPEAKER].label == 'Built-in Audio Analog Stereo'
+
+
+def test_unresolved_patterns_are_retried_only_when_a_device_appears():
+    tray = TrayState([SPEAKERS], unresolved=('headset_output',),
+                     listings=[DeviceSnapshot([SPEAKERS]), DeviceSnapshot([SPEAKERS, HEADPHONES])])
+
+    # A volume change lists the sinks but adds nothing
+    AudioToggle._on_pactl_event(tray, 'change', 'sink', 1)
+    AudioToggle._run_pending_refresh(tray)
+    assert tray.retries == 0
+
+    AudioToggle._on_pactl_event(tray, 'new', 'sink', 2)
+    AudioToggle._run_pending_refresh(tray)
+    assert tray.retries == 1
+    assert HEADSET in tray.device_items['sinks']
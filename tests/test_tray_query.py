@@ -0,0 +1,59 @@
+import json
+import socket
+import subprocess
+import sys
+
+from audio_toggle_linux import TrayQueryServer, tray_is_running
+from conftest import ROOT, server_entries, write_trace
+
+
+def listening_socket(path):
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(str(path))
+    listener.listen(1)
+    return listener
+
+
+def test_tray_is_running_probes_the_socket(tmp_path):
+    path = tmp_path / 'tray.sock'
+    assert not tray_is_running(path)
+
+    with listening_socket(path):
+        assert tray_is_running(path)
+
+    # A socket file left behind by a crashed tray refuses connections
+    assert path.exists()
+    assert not tray_is_running(path)
+
+
+def test_probe_connection_is_closed_without_a_reply(tmp_path, capsys):
+    path = tmp_path / 'tray.sock'
+    handled = []
+    server = TrayQueryServer(path, handled.append)
+    server.listener = listening_socket(path)
+    try:
+        assert tray_is_running(path)
+        assert server._on_connection(server.listener.fileno(), None) is True
+    finally:
+        server.listener.close()
+
+    assert handled == []
+    assert capsys.readouterr().out == ''
+
+
+def test_direct_status_is_marked_answered_by_direct(tmp_path, config_file):
+    trace = write_trace(tmp_path / 'server.jsonl', server_entries())
+    config_dir = tmp_path / '.config' / 'audio_toggle'
+    config_dir.mkdir(parents=True)
+    (config_dir / 'config.json').write_text(config_file.read_text())
+
+    result = subprocess.run(
+        [sys.executable, str(ROOT / 'audio_toggle_linux.py'), '--status', '--json',
+         '--replay-trace', str(trace), '--replay-speed', '0'],
+        capture_output=True, text=True, env={'HOME': str(tmp_path), 'PATH': '/usr/bin:/bin'}, timeout=30,
+    )
+
+    assert result.returncode == 0, result.stderr
+    reply = json.loads(result.stdout)
+    assert reply['answered_by'] == 'direct'
+    assert 'source' not in reply
@@ -0,0 +1,80 @@
+import io
+import json
+import os
+import subprocess
+
+import audio_toggle_linux
+from audio_toggle_linux import ReplayBackend, StatusWatch, WatchSession
+from conftest import SPEAKER, server_entries, write_trace
+
+
+class LiveReplay(ReplayBackend):
+    """Replayed calls, but claiming a live server so --watch subscribes"""
+
+    live = True
+
+
+def bursts_from(lines):
+    read_fd, write_fd = os.pipe()
+    os.write(write_fd, ''.join(line + '\n' for line in lines).encode())
+    os.close(write_fd)
+    try:
+        return list(StatusWatch(None)._bursts(read_fd, WatchSession.__new__(WatchSession)))
+    finally:
+        os.close(read_fd)
+
+
+def test_bursts_tell_state_changes_from_new_clients():
+    assert bursts_from(["Event 'new' on client #12"]) == [False]
+    assert bursts_from(["Event 'change' on sink #1", "Event 'remove' on client #12"]) == []
+
+
+def test_burst_with_a_default_change_is_a_change(monkeypatch):
+    invalidated = []
+    monkeypatch.setattr(WatchSession, 'invalidate', lambda self, device_type=None: invalidated.append(device_type))
+
+    assert bursts_from(["Event 'new' on client #12", "Event 'new' on sink #7",
+                        "Event 'change' on server"]) == [True]
+    assert invalidated == ['sinks']
+
+
+def test_direct_watch_hands_over_when_a_tray_starts(tmp_path, monkeypatch):
+    real_popen = subprocess.Popen
+    subscribers = []
+
+    def fake_subscribe(argv, **kwargs):
+        assert argv == ['/usr/bin/pactl', 'subscribe']
+        # A tray starting connects as a client, then the stream stays open
+        process = real_popen(['/bin/sh', '-c', "echo \"Event 'new' on client #40\"; exec sleep 60"], **kwargs)
+        subscribers.append(process)
+        return process
+
+    probes = iter([False, True])
+    monkeypatch.setattr(audio_toggle_linux.subprocess, 'Popen', fake_subscribe)
+    monkeypatch.setattr(audio_toggle_linux, 'tray_is_running', lambda: next(probes))
+    out = io.StringIO()
+    watch = StatusWatch(LiveReplay(write_trace(tmp_path / 'server.jsonl', server_entries()), speed=0), out)
+
+    assert watch.follow_server() is True
+
+    assert [json.loads(line)['output'] for line in out.getvalue().splitlines()] == [SPEAKER]
+    assert subscribers[0].poll() is not None
+
+
+def test_run_alternates_between_tray_and_server(monkeypatch):
+    calls = []
+    followed = iter([False, True, True, False])
+
+    def follow(name):
+        def step():
+            calls.append(name)
+            return next(followed)
+        return step
+
+    watch = StatusWatch(LiveReplay.__new__(LiveReplay))
+    monkeypatch.setattr(watch, 'follow_tray', follow('tray'))
+    monkeypatch.setattr(watch, 'follow_server', follow('server'))
+
+    watch.run()
+
+    assert calls == ['tray', 'server', 'tray', 'server']